@@ -1,19 +1,17 @@
-import firebase_admin
-from firebase_admin import credentials, db
+import importlib
 from dotenv import load_dotenv
 import os
 import json
 import base64  # Importar base64
 import binascii
+import threading
+import time
 from collections.abc import Mapping, Sequence
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta, timezone
 from urllib.parse import unquote
-import io
 import uuid
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
+from app.services.document_renderers import render_history_workbook
 
 # Cargar .env solo si existe (en Docker/Coolify las variables vienen del entorno)
 if os.getenv("VERCEL") != "1":
@@ -55,33 +53,68 @@ def _load_service_account_from_env() -> Optional[dict[str, Any]]:
 
     return None
 
+_firebase_init_lock = threading.Lock()
+_firebase_init_done = False
+
 if skip_firebase_init:
     print("Saltando inicialización de Firebase por configuración de entorno.")
-elif not firebase_admin._apps:
-    try:
-        cred = None
-        service_account_info = _load_service_account_from_env()
-        if service_account_info:
-            print("Inicializando Firebase con credenciales JSON desde variable de entorno...")
-            cred = credentials.Certificate(service_account_info)
+
+
+def ensure_firebase_app() -> bool:
+    """Inicializa Firebase en el primer acceso (no al importar). ``True`` si hay app lista."""
+    global _firebase_init_done
+    if skip_firebase_init:
+        return False
+    with _firebase_init_lock:
+        import firebase_admin
+        from firebase_admin import credentials
+
+        if _firebase_init_done or firebase_admin._apps:
+            _firebase_init_done = True
+            return bool(firebase_admin._apps)
+        _firebase_init_done = True
+        try:
+            cred = None
+            service_account_info = _load_service_account_from_env()
+            if service_account_info:
+                print("Inicializando Firebase con credenciales JSON desde variable de entorno...")
+                cred = credentials.Certificate(service_account_info)
             
-        elif cred_path:
-            print(f"Inicializando Firebase con ruta de archivo: {cred_path} (Modo Local)...")
-            if not os.path.exists(cred_path):
-                raise FileNotFoundError(f"El archivo de credenciales no se encuentra en la ruta: {cred_path}")
-            cred = credentials.Certificate(cred_path)
-        else:
-            raise ValueError("No se encontró 'FIREBASE_PRIVATE_KEY_JSON_BASE64', 'FIREBASE_PRIVATE_KEY_JSON' ni 'FIREBASE_CREDENTIALS_PATH'. Revisa tu .env")
+            elif cred_path:
+                print(f"Inicializando Firebase con ruta de archivo: {cred_path} (Modo Local)...")
+                if not os.path.exists(cred_path):
+                    raise FileNotFoundError(f"El archivo de credenciales no se encuentra en la ruta: {cred_path}")
+                cred = credentials.Certificate(cred_path)
+            else:
+                raise ValueError("No se encontró 'FIREBASE_PRIVATE_KEY_JSON_BASE64', 'FIREBASE_PRIVATE_KEY_JSON' ni 'FIREBASE_CREDENTIALS_PATH'. Revisa tu .env")
 
-        firebase_admin.initialize_app(cred, {
-            'databaseURL': database_url
-        })
-        print("Firebase initialized successfully")
+            firebase_admin.initialize_app(cred, {
+                'databaseURL': database_url
+            })
+            print("Firebase initialized successfully")
         
-    except Exception as e:
-        # No se relanza para evitar crashear el arranque del servidor.
-        # Las funciones que usen Firebase fallarán con un mensaje claro.
-        print(f"ERROR AL INICIALIZAR FIREBASE (el app continuará): {str(e)}")
+        except Exception as e:
+            # No se relanza para evitar crashear el arranque del servidor.
+            # Las funciones que usen Firebase fallarán con un mensaje claro.
+            print(f"ERROR AL INICIALIZAR FIREBASE (el app continuará): {str(e)}")
+        return bool(firebase_admin._apps)
+
+
+class LazyFirebaseModule:
+    """Proxy de ``firebase_admin.db``/``firebase_admin.auth``: importa firebase_admin
+    (y google-auth) e inicializa la app recien al primer atributo usado."""
+
+    def __init__(self, module_name: str) -> None:
+        self._module_name = module_name
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        ensure_firebase_app()
+        return getattr(importlib.import_module(self._module_name), name)
+
+
+db = LazyFirebaseModule("firebase_admin.db")
 
 # ======================================================================
 # ¡FUNCIÓN DE DETECCIÓN MODIFICADA!
@@ -292,12 +325,65 @@ DEFAULT_THRESHOLDS = {
     for sensor_id in SENSOR_IDS
 }
 
+# Umbrales y horarios se leen en cada lectura IoT; se cachean por TTL y las
+# escrituras de esta instancia los invalidan al momento.
+_config_cache: dict[str, tuple[float, Any]] = {}
+_config_cache_lock = threading.Lock()
+
+
+def _config_cache_ttl_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("CONFIG_CACHE_TTL_SECONDS", "30")))
+    except ValueError:
+        return 30.0
+
+
+def _config_cache_get(key: str) -> Any:
+    with _config_cache_lock:
+        entry = _config_cache.get(key)
+    if entry is None or time.monotonic() - entry[0] >= _config_cache_ttl_seconds():
+        return None
+    return entry[1]
+
+
+def _config_cache_put(key: str, value: Any) -> None:
+    with _config_cache_lock:
+        _config_cache[key] = (time.monotonic(), value)
+
+
+def invalidate_config_cache(key: Optional[str] = None) -> None:
+    with _config_cache_lock:
+        if key is None:
+            _config_cache.clear()
+        else:
+            _config_cache.pop(key, None)
+
+
+def warm_sensor_thresholds() -> dict[str, dict]:
+    """Una sola lectura de ``/config/thresholds`` para todos los ramales."""
+    data = db.reference('/config/thresholds').get()
+    thresholds = data if isinstance(data, dict) else {}
+    warmed: dict[str, dict] = {}
+    for sensor_id in SENSOR_IDS:
+        threshold = thresholds.get(sensor_id)
+        if isinstance(threshold, dict) and threshold:
+            _config_cache_put(f"threshold:{sensor_id}", threshold)
+            warmed[sensor_id] = threshold
+        else:
+            warmed[sensor_id] = get_sensor_threshold(sensor_id)
+    return warmed
+
+
 def get_sensor_threshold(sensor_id: str) -> dict:
+    cached = _config_cache_get(f"threshold:{sensor_id}")
+    if cached is not None:
+        return dict(cached)
     try:
         ref = db.reference(f'/config/thresholds/{sensor_id}')
         threshold = ref.get()
         if threshold:
-            return threshold
+            _config_cache_put(f"threshold:{sensor_id}", threshold)
+            return dict(threshold)
         else:
             default = DEFAULT_THRESHOLDS.get(sensor_id, {"corriente": 11.0, "potencia": 2420.0})
             ref.set(default) 
@@ -314,6 +400,7 @@ def update_sensor_threshold(sensor_id: str, corriente: float, potencia: float) -
             "potencia": potencia,
             "updated_at": datetime.now().isoformat()
         })
+        invalidate_config_cache(f"threshold:{sensor_id}")
         return True
     except Exception as e:
         print(f"Error al actualizar umbral: {str(e)}")
@@ -372,6 +459,7 @@ def save_room_schedule(room_id: str, schedule_id: str, schedule_record: Mapping[
     record["id"] = schedule_id
     record["room_id"] = room_id
     db.reference(_schedule_path(room_id, schedule_id)).set(record)
+    invalidate_config_cache(f"schedules:{room_id}")
     return record
 
 
@@ -386,9 +474,20 @@ def update_room_schedule(room_id: str, schedule_id: str, schedule_patch: Mapping
     updated_record["id"] = schedule_id
     updated_record["room_id"] = room_id
     ref.set(updated_record)
+    invalidate_config_cache(f"schedules:{room_id}")
     return updated_record
 
 
+def get_cached_room_schedules(room_id: str) -> List[Dict[str, Any]]:
+    """Horarios de la sala para el camino caliente (ingesta y estado actual)."""
+    cached = _config_cache_get(f"schedules:{room_id}")
+    if cached is not None:
+        return cached
+    schedules = list_room_schedules(room_id)
+    _config_cache_put(f"schedules:{room_id}", schedules)
+    return schedules
+
+
 def _schedule_kind(schedule: Mapping[str, Any]) -> str:
     kind = str(schedule.get("kind") or "class").strip().lower()
     if kind in NO_CLASS_SCHEDULE_KINDS:
@@ -422,7 +521,7 @@ def get_schedule_context(room_id: str, when: Optional[datetime] = None) -> Dict[
     day_name = current_time.strftime("%A").lower()
     current_clock = current_time.strftime("%H:%M")
     current_date = current_time.date().isoformat()
-    schedules = list_room_schedules(room_id)
+    schedules = get_cached_room_schedules(room_id)
 
     for schedule in schedules:
         if _schedule_kind(schedule) == "no_class" and _schedule_matches_date(schedule, day_name, current_date) and _schedule_matches_clock(schedule, current_clock):
@@ -573,15 +672,7 @@ def record_iot_reading(
     }
 
 
-def _user_has_current_terms_consent(username: str, uid: str, role: str) -> bool:
-    if not _firebase_safe_key(username):
-        return False
-    try:
-        records = db.reference(f"{TERMS_CONSENT_STORE_PATH}/{username}").get()
-    except Exception as e:
-        print(f"Error al leer consentimientos: {str(e)}")
-        return False
-
+def _records_include_current_terms_consent(records: Any, uid: str, role: str) -> bool:
     if not isinstance(records, dict):
         return False
 
@@ -610,18 +701,33 @@ def _alert_contact_name(username: str, user_record: Mapping[str, Any]) -> str:
     return username
 
 
-def get_alert_email_contacts(roles: Sequence[str] | None = None) -> List[Dict[str, str]]:
-    allowed_roles = {role.lower() for role in (roles or ALERT_RECIPIENT_ROLES)}
+_recipient_directory: dict[str, list[Dict[str, str]]] | None = None
+_recipient_directory_loaded_at = 0.0
+_recipient_directory_lock = threading.Lock()
+
+
+def _recipient_directory_ttl_seconds() -> float:
+    try:
+        return max(0.0, float(os.getenv("ALERT_RECIPIENT_CACHE_TTL_SECONDS", "300")))
+    except ValueError:
+        return 300.0
+
+
+def _load_recipient_directory() -> dict[str, list[Dict[str, str]]] | None:
+    """Dos lecturas en bloque (usuarios y consentimientos) en vez de una por usuario."""
     try:
         users = db.reference(USER_STORE_PATH).get()
+        consents = db.reference(TERMS_CONSENT_STORE_PATH).get()
     except Exception as e:
         print(f"Error al leer destinatarios de alerta: {str(e)}")
-        return []
+        return None
 
     if not isinstance(users, dict):
-        return []
+        return {}
+    if not isinstance(consents, dict):
+        consents = {}
 
-    contacts: dict[str, Dict[str, str]] = {}
+    by_role: dict[str, dict[str, Dict[str, str]]] = {}
     for username, user_record in users.items():
         if not isinstance(user_record, dict):
             continue
@@ -632,21 +738,59 @@ def get_alert_email_contacts(roles: Sequence[str] | None = None) -> List[Dict[st
         uid = str(user_record.get("uid") or "").strip()
         is_disabled = bool(user_record.get("disabled", False))
 
-        if role not in allowed_roles or status != "activo" or is_disabled or not email:
+        if not role or status != "activo" or is_disabled or not email:
             continue
         if "@" not in email:
             continue
-        if not _user_has_current_terms_consent(str(username), uid, role):
+        if not _firebase_safe_key(str(username)):
+            continue
+        if not _records_include_current_terms_consent(consents.get(username), uid, role):
             continue
 
-        contacts[email.lower()] = {
+        by_role.setdefault(role, {})[email.lower()] = {
             "email": email,
             "name": _alert_contact_name(str(username), user_record),
             "username": str(username),
             "role": role,
         }
 
-    return sorted(contacts.values(), key=lambda contact: contact["email"].lower())
+    return {role: list(contacts.values()) for role, contacts in by_role.items()}
+
+
+def get_alert_recipient_directory() -> dict[str, list[Dict[str, str]]]:
+    """Directorio de destinatarios por rol, cacheado ``ALERT_RECIPIENT_CACHE_TTL_SECONDS``."""
+    global _recipient_directory, _recipient_directory_loaded_at
+
+    now = time.monotonic()
+    with _recipient_directory_lock:
+        if _recipient_directory is not None and now - _recipient_directory_loaded_at < _recipient_directory_ttl_seconds():
+            return _recipient_directory
+        directory = _load_recipient_directory()
+        if directory is None:
+            # Si Firebase falla se conserva el ultimo directorio valido.
+            return _recipient_directory or {}
+        _recipient_directory = directory
+        _recipient_directory_loaded_at = now
+        return directory
+
+
+def invalidate_alert_recipient_directory() -> None:
+    global _recipient_directory
+
+    with _recipient_directory_lock:
+        _recipient_directory = None
+
+
+def get_alert_email_contacts(roles: Sequence[str] | None = None) -> List[Dict[str, str]]:
+    allowed_roles = {role.lower() for role in (roles or ALERT_RECIPIENT_ROLES)}
+    directory = get_alert_recipient_directory()
+
+    contacts: dict[str, Dict[str, str]] = {}
+    for role in allowed_roles:
+        for contact in directory.get(role, []):
+            contacts.setdefault(contact["email"].lower(), contact)
+
+    return sorted((dict(contact) for contact in contacts.values()), key=lambda contact: contact["email"].lower())
 
 
 def get_alert_email_recipients(roles: Sequence[str] | None = None) -> List[str]:
@@ -819,7 +963,7 @@ def _is_reportable_history_record(record: Mapping[str, Any]) -> bool:
 
 def get_history_data(
     sensor_id: str,
-    limit: int = 20,
+    limit: int | None = 20,
     start_date: str = None,
     end_date: str = None,
     reportable_only: bool = False,
@@ -831,7 +975,8 @@ def get_history_data(
         ref = db.reference(f'/history/{sensor_id}')
         threshold = get_sensor_threshold(sensor_id)["corriente"] # Obtener umbral
         
-        data = ref.order_by_key().get() if start_date or end_date else ref.order_by_key().limit_to_last(limit).get()
+        # limit=None lee el historial completo (exportaciones en segundo plano).
+        data = ref.order_by_key().get() if start_date or end_date or limit is None else ref.order_by_key().limit_to_last(limit).get()
         
         if data:
             history = []
@@ -952,75 +1097,26 @@ def check_connection() -> bool:
         print(f"Error al verificar conexión: {str(e)}")
         return False
     
+def collect_history_rows(sensor_id: str = None, start_date: str = None, end_date: str = None, reportable_only: bool = False, limit: int | None = 1000) -> List[list]:
+    """Filas planas del historial para el Excel (solo lectura de Firebase, sin openpyxl)."""
+    sensors = [sensor_id] if sensor_id else SENSOR_IDS
+    rows = []
+    for sid in sensors:
+        history = get_history_data(sid, limit=limit, start_date=start_date, end_date=end_date, reportable_only=reportable_only)
+        for record in history:
+            rows.append([
+                sid,
+                record['timestamp'],
+                record['irms'],
+                record['potencia'],
+                record['device']['type'],
+                record['estado']
+            ])
+    return rows
+
 def export_history_excel(sensor_id: str = None, start_date: str = None, end_date: str = None, reportable_only: bool = False) -> bytes:
     try:
-        if sensor_id:
-            sensors = [sensor_id]
-        else:
-            sensors = SENSOR_IDS
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Historial SafyraShield"
-        
-        header_font = Font(bold=True, color="FFFFFF", name="Inter")
-        header_fill = PatternFill(start_color="0A0E27", end_color="0A0E27", fill_type="solid")
-        cell_font = Font(name="Inter")
-        center_align = Alignment(horizontal="center", vertical="center")
-        left_align = Alignment(horizontal="left", vertical="center")
-        thin_border = Border(left=Side(style='thin'), 
-                             right=Side(style='thin'), 
-                             top=Side(style='thin'), 
-                             bottom=Side(style='thin'))
-
-        headers = ["Sensor ID", "Fecha/Hora (ISO)", "Corriente (A)", "Potencia (W)", "Dispositivo Detectado", "Estado"]
-        ws.append(headers)
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.border = thin_border
-            cell.alignment = center_align
-            ws.row_dimensions[1].height = 25
-
-        row_idx = 2
-        for sid in sensors:
-            history = get_history_data(sid, limit=1000, start_date=start_date, end_date=end_date, reportable_only=reportable_only)
-            for record in history:
-                row_data = [
-                    sid,
-                    record['timestamp'],
-                    record['irms'],
-                    record['potencia'],
-                    record['device']['type'],
-                    record['estado']
-                ]
-                ws.append(row_data)
-                
-                for col_num in range(1, len(headers) + 1):
-                    cell = ws.cell(row=row_idx, column=col_num)
-                    cell.border = thin_border
-                    cell.font = cell_font
-                    if col_num in [1, 5, 6]: cell.alignment = center_align
-                    else: cell.alignment = left_align
-                    if col_num == 3: cell.number_format = '0.000 "A"'
-                    if col_num == 4: cell.number_format = '0.00 "W"'
-                
-                ws.row_dimensions[row_idx].height = 20
-                row_idx += 1
-        
-        ws.column_dimensions[get_column_letter(1)].width = 15
-        ws.column_dimensions[get_column_letter(2)].width = 28
-        ws.column_dimensions[get_column_letter(3)].width = 15
-        ws.column_dimensions[get_column_letter(4)].width = 15
-        ws.column_dimensions[get_column_letter(5)].width = 25
-        ws.column_dimensions[get_column_letter(6)].width = 12
-        
-        with io.BytesIO() as buffer:
-            wb.save(buffer)
-            return buffer.getvalue()
-
+        return render_history_workbook(collect_history_rows(sensor_id, start_date, end_date, reportable_only))
     except Exception as e:
         print(f"Error al exportar Excel: {str(e)}")
         return b""
@@ -1,20 +1,92 @@
+import asyncio
 import os
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Optional, TypeVar
+
+from fastapi import HTTPException
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 # Cargar variables de entorno si no están cargadas
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
+T = TypeVar("T")
+
+
+def _read_float_env(name: str, default: float, minimum: float) -> float:
+    try:
+        return max(minimum, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def supabase_timeout_seconds() -> float:
+    return _read_float_env("SUPABASE_TIMEOUT_SECONDS", 10.0, 0.5)
+
+
+def supabase_max_concurrency() -> int:
+    return int(_read_float_env("SUPABASE_MAX_CONCURRENCY", 8, 1))
+
+
 # Singleton pattern para el cliente de Supabase
-_supabase_client: Client = None
+_supabase_client: Optional["Client"] = None
+_supabase_executor: ThreadPoolExecutor | None = None
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     global _supabase_client
     if _supabase_client is None:
         if not SUPABASE_URL or not SUPABASE_KEY:
             raise ValueError("SUPABASE_URL y SUPABASE_SERVICE_ROLE_KEY deben estar definidos en el entorno.")
-        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # supabase-py (postgrest, httpx, gotrue...) se importa en la primera consulta.
+        from supabase import ClientOptions, create_client
+
+        # Un solo cliente: PostgREST reutiliza su pool de conexiones HTTP entre peticiones.
+        options = ClientOptions(postgrest_client_timeout=supabase_timeout_seconds())
+        _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
     return _supabase_client
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _supabase_executor
+    if _supabase_executor is None:
+        _supabase_executor = ThreadPoolExecutor(
+            max_workers=supabase_max_concurrency(), thread_name_prefix="safyra-supabase"
+        )
+    return _supabase_executor
+
+
+async def run_supabase(query: Callable[[], T], timeout: float | None = None) -> T:
+    """Ejecuta una consulta sincrona de Supabase en un pool acotado, sin bloquear el event loop.
+
+    El pool es propio para que las consultas lentas no agoten el threadpool
+    que usan la ingesta IoT y Firebase.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_get_executor(), query),
+            timeout=timeout if timeout is not None else supabase_timeout_seconds(),
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Supabase no respondio a tiempo")
+
+
+def warm_supabase_connection() -> bool:
+    """Crea el cliente y abre la conexion HTTP de PostgREST con una consulta minima."""
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return False
+    get_supabase_client().table("maintenance_tickets").select("id").limit(1).execute()
+    return True
+
+
+def shutdown_supabase_executor() -> None:
+    global _supabase_executor
+    if _supabase_executor is not None:
+        _supabase_executor.shutdown(wait=False, cancel_futures=True)
+        _supabase_executor = None
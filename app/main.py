@@ -1,12 +1,28 @@
 # app/main.py
+import asyncio
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from app.routers.data_api import router as data_router
-from app.routers.auth_api import router as auth_router 
+from app.routers.data_api import router as data_router, alert_coalescer
+from app.routers.auth_api import router as auth_router, stop_identity_cache, warm_identity_cache
 from app.routers.tickets_api import router as tickets_router
 from app.routers.reports_api import router as reports_router
 from app.services.scheduler_service import start_scheduler, shutdown_scheduler
+from app.services.line_ingest import start_line_ingest_listener_if_enabled, stop_line_ingest_listener
+from app.services.notifications import shutdown_notifications, start_notification_dispatcher
+from app.services.ticket_service import ticket_batcher
+from app.db.firebase import (
+    LAB_ROOM_ID,
+    get_alert_recipient_directory,
+    get_cached_room_schedules,
+    skip_firebase_init,
+    warm_sensor_thresholds,
+)
+from app.db.supabase import shutdown_supabase_executor, warm_supabase_connection
+from app.services.render_pool import document_render_pool
+from app.services.password_hasher import password_hash_pool
+from app.services.warmup import warmup_state
 import os
 
 app = FastAPI(title="SafyraShield API - Sprint 3")
@@ -25,13 +41,72 @@ app.include_router(auth_router)
 app.include_router(tickets_router)
 app.include_router(reports_router)
 
+_warmup_task: asyncio.Task | None = None
+
+# Estado que vive en la memoria de cada worker y no se comparte entre procesos.
+PER_PROCESS_INGEST_STATE = (
+    "deduplicacion de reintentos IoT (un reintento que cae en otro worker se procesa de nuevo)",
+    "limites de admision IoT por sensor y por token (el tope efectivo es N veces el configurado)",
+)
+
+
+def _configured_workers() -> int:
+    # uvicorn toma WEB_CONCURRENCY si no se pasa --workers; la imagen usa UVICORN_WORKERS.
+    for name in ("UVICORN_WORKERS", "WEB_CONCURRENCY"):
+        try:
+            return max(1, int(os.getenv(name, "")))
+        except ValueError:
+            continue
+    return 1
+
+
+def _warn_per_process_state() -> None:
+    workers = _configured_workers()
+    if workers <= 1:
+        return
+    for state in PER_PROCESS_INGEST_STATE:
+        print(f"[STARTUP] Aviso con {workers} workers: {state}.")
+
+
+def _warmup_steps() -> dict:
+    steps = {"supabase": warm_supabase_connection}
+    if not skip_firebase_init:
+        steps.update({
+            "thresholds": warm_sensor_thresholds,
+            "schedules": lambda: get_cached_room_schedules(LAB_ROOM_ID),
+            "identity": warm_identity_cache,
+            "recipients": get_alert_recipient_directory,
+        })
+    return steps
+
+
 @app.on_event("startup")
 async def startup_event():
+    global _warmup_task
+    _warn_per_process_state()
     start_scheduler()
+    start_notification_dispatcher()
+    # Ventanas de alertas que quedaron abiertas si el proceso anterior murio.
+    alert_coalescer.recover()
+    document_render_pool.start()
+    # En segundo plano: /health responde de inmediato y /ready espera al calentamiento.
+    _warmup_task = asyncio.create_task(warmup_state.run(_warmup_steps()))
+    await start_line_ingest_listener_if_enabled()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if _warmup_task is not None and not _warmup_task.done():
+        _warmup_task.cancel()
+    await stop_line_ingest_listener()
     shutdown_scheduler()
+    await alert_coalescer.flush()
+    # Incluye las alertas que la ventana del coalescer acaba de entregar.
+    await asyncio.to_thread(ticket_batcher.flush)
+    await shutdown_notifications()
+    shutdown_supabase_executor()
+    document_render_pool.shutdown()
+    password_hash_pool.shutdown()
+    stop_identity_cache()
 
 # Rutas HTML
 @app.get("/login")
@@ -78,3 +153,10 @@ async def health_check():
         "service": "SafyraShield IoT Monitor",
         "version": "3.0.0 - Sprint 3"
     }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Para el balanceador (Coolify): 503 hasta que caches y conexiones esten calientes."""
+    snapshot = warmup_state.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 from typing import Any, Callable, Mapping, Optional
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import auth as firebase_auth
-from firebase_admin import db as firebase_db
+from app.db.firebase import LazyFirebaseModule, ensure_firebase_app, invalidate_alert_recipient_directory
+from app.services.identity_cache import IdentityCache, consent_records_from
+from app.services.password_hasher import password_hash_pool
+import hashlib
 import os
 import re
+import threading
+import time
 
 if os.getenv("VERCEL") != "1":
     load_dotenv(override=os.getenv("SKIP_FIREBASE_INIT", "false").lower() not in {"1", "true", "yes"})
@@ -59,10 +61,26 @@ FIREBASE_USER_STORE_DISABLED = os.getenv("DISABLE_FIREBASE_USER_STORE", "false")
 TERMS_VERSION = os.getenv("TERMS_VERSION", "2026-05-31")
 TERMS_CONSENT_STORE_PATH = os.getenv("TERMS_CONSENT_STORE_PATH", "/app_consents")
 TERMS_REQUIRED_ROLES_RAW = os.getenv("TERMS_REQUIRED_ROLES", "admin,auditor")
+FIREBASE_REVOCATION_RECHECK_SECONDS = _get_int_env("FIREBASE_REVOCATION_RECHECK_SECONDS", 300)
+VERIFIED_TOKEN_CACHE_SIZE = max(1, _get_int_env("VERIFIED_TOKEN_CACHE_SIZE", 1024))
+UNKNOWN_IDENTITY_RETRY_SECONDS = 30.0
+IDENTITY_CACHE_TTL_SECONDS = float(_get_int_env("IDENTITY_CACHE_TTL_SECONDS", 300))
+IDENTITY_CACHE_LISTENERS = os.getenv(
+    "IDENTITY_CACHE_LISTENERS", "false" if os.getenv("VERCEL") == "1" else "true"
+).lower() == "true"
+
+# Cache de ID tokens verificados: sha256(token) -> claims, exp y ultima verificacion de revocacion.
+_verified_tokens: dict[str, dict[str, Any]] = {}
+_verified_tokens_lock = threading.Lock()
+_unknown_identity_until: dict[str, float] = {}
 
 # Contexto para Hashing de contraseñas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# firebase_admin (y google-auth) se importa e inicializa en el primer uso, no al arrancar.
+firebase_auth = LazyFirebaseModule("firebase_admin.auth")
+firebase_db = LazyFirebaseModule("firebase_admin.db")
+
 # Esquema de OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -279,12 +297,20 @@ def _normalize_user_record(user_record: Mapping[str, Any]) -> dict[str, Any]:
     return normalized_record
 
 
+identity_cache = IdentityCache(
+    fake_users_db,
+    fake_consent_db,
+    ttl_seconds=IDENTITY_CACHE_TTL_SECONDS,
+    normalize_user=_normalize_user_record,
+)
+
+
 def _firebase_user_store_enabled() -> bool:
-    return not FIREBASE_USER_STORE_DISABLED and not SKIP_FIREBASE_INIT and bool(firebase_admin._apps)
+    return not FIREBASE_USER_STORE_DISABLED and not SKIP_FIREBASE_INIT and ensure_firebase_app()
 
 
 def _firebase_auth_enabled() -> bool:
-    return AUTH_PROVIDER == "firebase" and not SKIP_FIREBASE_INIT and bool(firebase_admin._apps)
+    return AUTH_PROVIDER == "firebase" and not SKIP_FIREBASE_INIT and ensure_firebase_app()
 
 
 def _firebase_auth_user_management_enabled() -> bool:
@@ -292,7 +318,7 @@ def _firebase_auth_user_management_enabled() -> bool:
 
 
 def _firebase_consent_store_enabled() -> bool:
-    return not SKIP_FIREBASE_INIT and bool(firebase_admin._apps)
+    return not SKIP_FIREBASE_INIT and ensure_firebase_app()
 
 
 def _get_firebase_web_config() -> Optional[dict[str, str]]:
@@ -327,35 +353,39 @@ def _load_user_from_store(username: str) -> Optional[dict[str, Any]]:
         if isinstance(user_record, dict):
             normalized_record = _normalize_user_record(user_record)
             fake_users_db[username] = normalized_record
+            identity_cache.mark_user_changed(username)
             return normalized_record
     except Exception as exc:
         print(f"Error al cargar usuario desde Firebase: {exc}")
     return None
 
 
-def _load_all_users_from_store() -> None:
+def _load_all_users_from_store(force: bool = False) -> None:
+    """Relee ``/app_users`` solo si el cache de identidad vencio (o ``force``)."""
     if not _firebase_user_store_enabled():
         return
+    if not force and identity_cache.users_fresh():
+        return
+    _read_all_users_from_store()
+
+
+def _read_all_users_from_store() -> None:
     try:
         users = firebase_db.reference(USER_STORE_PATH).get()
-        if isinstance(users, dict):
-            for username, user_record in users.items():
-                if isinstance(user_record, dict):
-                    fake_users_db[str(username)] = _normalize_user_record(user_record)
+        identity_cache.replace_users(users if isinstance(users, dict) else {})
     except Exception as exc:
         print(f"Error al listar usuarios desde Firebase: {exc}")
 
 
+def _refresh_users_if_stale() -> None:
+    """Un acierto en cache tambien respeta el TTL: un rol o estado cambiado desde otro worker se relee."""
+    if identity_cache.users_fresh() or not _firebase_user_store_enabled():
+        return
+    _read_all_users_from_store()
+
+
 def _find_cached_user_by_firebase_identity(uid: str, email: Optional[str]) -> Optional[dict[str, Any]]:
-    normalized_email = email.strip().lower() if email else None
-    for user_record in fake_users_db.values():
-        record_uid = str(user_record.get("uid", "")).strip()
-        record_email = str(user_record.get("email", "")).strip().lower()
-        if record_uid and record_uid == uid:
-            return user_record
-        if normalized_email and record_email and record_email == normalized_email:
-            return user_record
-    return None
+    return identity_cache.find_by_identity(uid, email)
 
 
 def _build_bootstrap_admin_from_firebase_identity(uid: str, email: Optional[str]) -> Optional[dict[str, Any]]:
@@ -385,6 +415,7 @@ def _build_bootstrap_admin_from_firebase_identity(uid: str, email: Optional[str]
 
 
 def get_user_by_firebase_identity(uid: str, email: Optional[str]) -> Optional[UserInDB]:
+    _refresh_users_if_stale()
     user_record = _find_cached_user_by_firebase_identity(uid, email)
     if user_record:
         user_record = _normalize_user_record(user_record)
@@ -395,7 +426,9 @@ def get_user_by_firebase_identity(uid: str, email: Optional[str]) -> Optional[Us
         user_record["auth_provider"] = "firebase"
         return UserInDB(**user_record)
 
-    _load_all_users_from_store()
+    # Identidad desconocida: se recarga /app_users como maximo una vez por ventana.
+    if _unknown_identity_until.get(uid, 0.0) <= time.monotonic():
+        _load_all_users_from_store(force=True)
     user_record = _find_cached_user_by_firebase_identity(uid, email)
     if user_record:
         user_record = _normalize_user_record(user_record)
@@ -410,16 +443,22 @@ def get_user_by_firebase_identity(uid: str, email: Optional[str]) -> Optional[Us
     if user_record:
         return UserInDB(**user_record)
 
+    if len(_unknown_identity_until) >= VERIFIED_TOKEN_CACHE_SIZE:
+        _unknown_identity_until.clear()
+    _unknown_identity_until[uid] = time.monotonic() + UNKNOWN_IDENTITY_RETRY_SECONDS
     return None
 
 
 def _save_user_to_store(username: str, user_record: Mapping[str, Any]) -> None:
+    identity_cache.mark_user_changed(username)
+    _unknown_identity_until.clear()
     if not _firebase_user_store_enabled():
         return
     try:
         firebase_db.reference(f"{USER_STORE_PATH}/{username}").set(dict(user_record))
     except Exception as exc:
         raise RuntimeError(f"Error al guardar usuario en Firebase: {exc}") from exc
+    invalidate_alert_recipient_directory()
 
 
 def _safe_firebase_child_key(value: str) -> bool:
@@ -430,22 +469,39 @@ def _load_consent_records(username: str) -> list[dict[str, Any]]:
     cached_records = fake_consent_db.get(username, [])
     if not _firebase_consent_store_enabled() or not _safe_firebase_child_key(username):
         return cached_records
+    if identity_cache.consents_fresh(username):
+        return cached_records
 
     try:
-        data = firebase_db.reference(f"{TERMS_CONSENT_STORE_PATH}/{username}").get()
-        if isinstance(data, dict):
-            records = [record for record in data.values() if isinstance(record, dict)]
-            records.sort(key=lambda record: str(record.get("accepted_at", "")))
-            fake_consent_db[username] = records
-            return records
-        fake_consent_db[username] = []
-        return []
+        records = consent_records_from(firebase_db.reference(f"{TERMS_CONSENT_STORE_PATH}/{username}").get())
+        identity_cache.replace_consents(username, records)
+        return records
     except Exception as exc:
         print(f"Error al cargar consentimientos desde Firebase: {exc}")
         fake_consent_db[username] = []
         return []
 
 
+def warm_identity_cache() -> None:
+    """Carga usuarios y consentimientos en dos lecturas y, si se puede, deja listeners activos."""
+    if not _firebase_user_store_enabled():
+        return
+    # Lectura sincrona primero: al terminar el calentamiento el cache ya esta poblado,
+    # sin esperar el primer evento de los listeners.
+    _load_all_users_from_store(force=True)
+    try:
+        consents = firebase_db.reference(TERMS_CONSENT_STORE_PATH).get()
+        identity_cache.replace_all_consents(consents if isinstance(consents, dict) else {})
+    except Exception as exc:
+        print(f"Error al cargar consentimientos desde Firebase: {exc}")
+    if IDENTITY_CACHE_LISTENERS:
+        identity_cache.start_listeners(firebase_db.reference, USER_STORE_PATH, TERMS_CONSENT_STORE_PATH)
+
+
+def stop_identity_cache() -> None:
+    identity_cache.stop_listeners()
+
+
 def _append_consent_record(user: UserInDB, terms_version: str) -> dict[str, Any]:
     record = {
         "username": user.username,
@@ -465,6 +521,7 @@ def _append_consent_record(user: UserInDB, terms_version: str) -> dict[str, Any]
             fake_consent_db[user.username].pop()
             raise RuntimeError(f"Error al guardar consentimiento en Firebase: {exc}") from exc
 
+    invalidate_alert_recipient_directory()
     return record
 
 
@@ -511,7 +568,19 @@ def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool
         return False
     return pwd_context.verify(plain_password, hashed_password)
 
+
+async def verify_password_async(plain_password: str, hashed_password: Optional[str]) -> bool:
+    if not hashed_password:
+        return False
+    return await password_hash_pool.run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def hash_password_async(plain_password: str) -> str:
+    return await password_hash_pool.run(pwd_context.hash, plain_password)
+
 def get_user(db: Mapping[str, dict[str, Any]], username: str) -> Optional[UserInDB]:
+    if db is fake_users_db:
+        _refresh_users_if_stale()
     if username in db:
         user_dict = _normalize_user_record(db[username])
         fake_users_db[username] = user_dict
@@ -535,7 +604,8 @@ def _is_active_admin_record(user_record: Mapping[str, Any]) -> bool:
 
 
 def _count_active_admins() -> int:
-    _load_all_users_from_store()
+    # Guarda del ultimo administrador: se decide con el store actualizado, no con el cache.
+    _load_all_users_from_store(force=True)
     return sum(1 for user_record in fake_users_db.values() if _is_active_admin_record(user_record))
 
 
@@ -546,22 +616,64 @@ def create_access_token(data: dict[str, str], expires_delta: Optional[timedelta]
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def _get_user_from_firebase_token(token: str) -> Optional[UserInDB]:
-    if not _firebase_auth_enabled():
-        return None
+def _verify_firebase_token_cached(token: str) -> Optional[dict[str, Any]]:
+    """Claims verificados en cache por hash del token hasta su ``exp``.
+
+    La revocacion (llamada de red) se vuelve a consultar cada
+    ``FIREBASE_REVOCATION_RECHECK_SECONDS``; entre tanto el costo es un hash.
+    """
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = time.time()
+    with _verified_tokens_lock:
+        cached = _verified_tokens.get(token_hash)
+        if cached and cached["exp"] <= now:
+            _verified_tokens.pop(token_hash, None)
+            cached = None
+    if cached and (not CHECK_FIREBASE_TOKEN_REVOKED or now - cached["checked_at"] < FIREBASE_REVOCATION_RECHECK_SECONDS):
+        return cached["claims"]
+
     try:
         decoded_token = firebase_auth.verify_id_token(
             token,
             check_revoked=CHECK_FIREBASE_TOKEN_REVOKED,
         )
     except Exception as e:
+        with _verified_tokens_lock:
+            _verified_tokens.pop(token_hash, None)
         print(f"🔥 FIREBASE AUTH EXCEPTION 🔥: {e}")
         return None
 
+    try:
+        exp = float(decoded_token.get("exp"))
+    except (TypeError, ValueError):
+        return decoded_token
+    with _verified_tokens_lock:
+        if len(_verified_tokens) >= VERIFIED_TOKEN_CACHE_SIZE:
+            _verified_tokens.pop(next(iter(_verified_tokens)))
+        _verified_tokens[token_hash] = {"claims": decoded_token, "exp": exp, "checked_at": now}
+    return decoded_token
+
+
+def clear_auth_caches() -> None:
+    with _verified_tokens_lock:
+        _verified_tokens.clear()
+    _unknown_identity_until.clear()
+    identity_cache.reset()
+
+
+def _get_user_from_firebase_token(token: str) -> Optional[UserInDB]:
+    if not _firebase_auth_enabled():
+        return None
+    decoded_token = _verify_firebase_token_cached(token)
+    if decoded_token is None:
+        return None
+
     uid = str(decoded_token.get("uid") or decoded_token.get("sub") or "").strip()
     if not uid:
         return None
@@ -593,6 +705,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     if not ALLOW_LEGACY_PASSWORD_LOGIN:
         raise credentials_exception
 
+    # python-jose (y su backend de cryptography) solo se carga con el login local.
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -679,7 +794,10 @@ async def create_firebase_session(current_user: UserInDB = Depends(get_current_u
 
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()) -> dict[str, str]:
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+) -> dict[str, str]:
     """
     Endpoint de login local legacy. En producción se debe usar Firebase Auth.
     """
@@ -690,7 +808,14 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
 
     user = get_user(fake_users_db, form_data.username)
-    if not user or not is_active_user(user) or not verify_password(form_data.password, user.hashed_password):
+    client_key = request.client.host if request.client else "desconocido"
+    async with password_hash_pool.login_slot(client_key):
+        password_ok = (
+            user is not None
+            and is_active_user(user)
+            and await verify_password_async(form_data.password, user.hashed_password)
+        )
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -749,6 +874,7 @@ async def create_user(user_data: UserCreate, _: UserInDB = Depends(require_roles
     account_status = _parse_status_for_request(user_data.status)
     firebase_uid = _create_firebase_auth_account(user_data, account_status)
     should_store_local_password = firebase_uid is None
+    hashed_password = await hash_password_async(user_data.password) if should_store_local_password else ""
 
     fake_users_db[username] = {
         "uid": firebase_uid or "",
@@ -758,7 +884,7 @@ async def create_user(user_data: UserCreate, _: UserInDB = Depends(require_roles
         "role": role,
         "status": account_status,
         "disabled": account_status != ACTIVE_STATUS,
-        "hashed_password": pwd_context.hash(user_data.password) if should_store_local_password else "",
+        "hashed_password": hashed_password,
         "auth_provider": "firebase" if firebase_uid else "local",
     }
     try:
@@ -813,7 +939,7 @@ async def update_user(
             user_record["hashed_password"] = ""
             user_record["auth_provider"] = "firebase"
         else:
-            user_record["hashed_password"] = pwd_context.hash(user_data.password)
+            user_record["hashed_password"] = await hash_password_async(user_data.password)
 
     _update_firebase_auth_account(user_record.get("uid"), firebase_update_data)
 
@@ -1,6 +1,6 @@
 # app/routers/data_api.py
 from fastapi import APIRouter, HTTPException, Response, Depends, Header, status, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
 from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from app.db.firebase import (
@@ -9,7 +9,7 @@ from app.db.firebase import (
     check_connection,
     update_sensor_threshold,
     export_history_csv,
-    export_history_excel,
+    collect_history_rows,
     get_alert_history,
     LAB_ROOM_ID,
     LAB_ROOM_NAME,
@@ -21,13 +21,37 @@ from app.db.firebase import (
 )
 from app.routers.auth_api import require_roles
 from app.routers.auth_api import UserInDB
+from app.routers.auth_api import identity_cache
 from app.models.data import ThresholdUpdate
-from app.services.notifications import queue_alert_notification_factory, send_alert_notification
-from app.services.ticket_service import handle_critical_alert
+from app.services.notifications import (
+    notification_metrics_snapshot,
+    queue_raw_alert_notification,
+    register_payload_builder,
+    send_alert_notification,
+)
+from app.services.document_renderers import render_history_workbook
+from app.services.export_jobs import export_job_manager
+from app.services.pdf_cache import report_pdf_cache
+from app.services.render_pool import document_render_pool
+from app.services.password_hasher import password_hash_pool
+from app.services.ticket_service import handle_critical_alert, ticket_batcher
+from app.services.ingest_idempotency import idempotency_key_for, ingest_idempotency_cache
+from app.services.admission_control import admit_iot_reading, iot_admission_controller, retry_after_header
+from app.services.line_ingest import line_ingest_snapshot
+from app.services.alert_coalescer import AlertCoalescer, build_alert_window_store
+from app.services.cooldown_store import build_cooldown_store
+from app.services.notification_outbox import NotificationBodyStore, default_outbox_path
+from app.services.notification_templates import (
+    render_email_body,
+    render_email_header,
+    render_email_html,
+    render_whatsapp_text,
+)
+from app.services.signed_urls import build_signed_body_url, verify_body_url
 from collections.abc import Mapping
 from datetime import date, datetime, timezone
-from typing import Any
-import html
+from typing import Any, Literal
+import asyncio
 import io
 import os
 import re
@@ -51,6 +75,7 @@ SCHOOL_START_TIME = "08:00"
 SCHOOL_END_TIME = "14:30"
 IOT_SENSOR_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{3,50}$")
 _alert_notification_cache: dict[str, float] = {}
+alert_cooldown_store = build_cooldown_store(_alert_notification_cache)
 
 router = APIRouter(
     prefix="/data", 
@@ -98,6 +123,7 @@ class IotReadingPayload(BaseModel):
     potencia: float | None = Field(default=None, ge=0, le=50000)
     voltage: float = Field(default=220.0, gt=0, le=260)
     circuito: str | None = Field(default=None, max_length=50)
+    device_seq: int | None = Field(default=None, ge=0)
 
 
 def _validate_time(value: str, field_name: str) -> str:
@@ -241,12 +267,35 @@ def _notification_cooldown_seconds() -> float:
         return 300.0
 
 
-def _require_iot_token(x_safyra_iot_token: str | None = Header(default=None, alias="X-Safyra-Iot-Token")) -> None:
+def _read_window_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _coalesce_window_seconds(event_type: str) -> float:
+    # En modo digest, el consumo fuera de horario se resume en una ventana mas larga.
+    if _is_digest(event_type):
+        return _read_window_env("ALERT_DIGEST_WINDOW_SECONDS", 900.0)
+    return _read_window_env("ALERT_COALESCE_WINDOW_SECONDS", 10.0)
+
+
+def _is_digest(event_type: str) -> bool:
+    return event_type == "out_of_schedule_consumption" and _out_of_schedule_digest_enabled()
+
+
+def _out_of_schedule_digest_enabled() -> bool:
+    return os.getenv("ALERT_OUT_OF_SCHEDULE_MODE", "immediate").strip().lower() == "digest"
+
+
+def _require_iot_token(x_safyra_iot_token: str | None = Header(default=None, alias="X-Safyra-Iot-Token")) -> str:
     expected_token = os.getenv("SAFYRA_IOT_TOKEN", "").strip()
     if not expected_token:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Token IoT no configurado")
     if not x_safyra_iot_token or not secrets.compare_digest(x_safyra_iot_token, expected_token):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token IoT invalido")
+    return x_safyra_iot_token
 
 
 def _schedule_status_code(schedule: object) -> str:
@@ -343,10 +392,6 @@ def _format_measure(value: object, decimals: int = 2) -> str:
         return "-"
 
 
-def _html_row(label: str, value: object) -> str:
-    return f"<p><strong>{html.escape(label)}:</strong> {html.escape(str(value))}</p>"
-
-
 def _notification_reference(payload: Mapping[str, Any]) -> tuple[str, str]:
     alert_type = str(payload.get("alert_type") or "")
     threshold = payload.get("threshold") if isinstance(payload.get("threshold"), Mapping) else {}
@@ -376,97 +421,63 @@ def _notification_subject(payload: Mapping[str, Any]) -> str:
     return f"[SafyraShield] {severity_label}: {alert_label} - {room_name} ({room_id})"
 
 
-def _build_notification_content(
-    payload: Mapping[str, Any],
-    recipient: Mapping[str, Any] | None = None,
-) -> dict[str, str]:
+def _notification_context(payload: Mapping[str, Any]) -> dict[str, Any]:
+    """Campos de la alerta ya formateados para las plantillas (sin datos del destinatario)."""
     alert_type = str(payload.get("alert_type") or "")
-    alert_label = str(payload.get("alert_type_label") or "Alerta electrica")
     severity = str(payload.get("severity") or "info")
-    severity_label = str(payload.get("severity_label") or "Informativa")
-    room_name = str(payload.get("room_name") or LAB_ROOM_NAME)
-    room_id = str(payload.get("room_id") or LAB_ROOM_ID)
-    circuito = str(payload.get("circuito") or room_id)
-    schedule_label = str(payload.get("schedule_status_label") or "No especificado")
-    detected_at_display = str(payload.get("detected_at_display") or payload.get("detected_at") or "")
     irms = _format_measure(payload.get("irms"))
     potencia = _format_measure(payload.get("potencia"), 0)
     threshold = payload.get("threshold") if isinstance(payload.get("threshold"), Mapping) else {}
     device = payload.get("device") if isinstance(payload.get("device"), Mapping) else {}
-    device_type = str(payload.get("device_type") or device.get("type") or "No clasificado")
-    device_description = str(payload.get("device_description") or device.get("description") or "Sin detalle del estado electrico.")
     threshold_current = _format_measure(threshold.get("corriente") if isinstance(threshold, Mapping) else None)
     threshold_power = _format_measure(threshold.get("potencia") if isinstance(threshold, Mapping) else None, 0)
     reference_label, reference_value = _notification_reference(payload)
-    recipient_name = _recipient_display_name(recipient)
-    intro = (
-        "ha detectado una anomalia electrica que requiere su intervencion inmediata."
-        if severity == "critical"
-        else "ha detectado una anomalia electrica que requiere verificacion operativa."
-    )
-    summary_title = "Resumen de la emergencia" if severity == "critical" else "Resumen de la alerta"
-    action_title = "Accion inmediata requerida" if severity == "critical" else "Accion operativa requerida"
-    current_detail = (
-        f"{irms} A (umbral: {threshold_current} A)"
-        if alert_type == "overload"
-        else f"{irms} A ({reference_value})"
-    )
-    power_detail = (
-        f"{potencia} W (limite seguro: {threshold_power} W)"
-        if alert_type == "overload"
-        else f"{potencia} W"
-    )
+    room_id = str(payload.get("room_id") or LAB_ROOM_ID)
+    return {
+        "alert_label": str(payload.get("alert_type_label") or "Alerta electrica"),
+        "severity_label": str(payload.get("severity_label") or "Informativa"),
+        "room_name": str(payload.get("room_name") or LAB_ROOM_NAME),
+        "room_id": room_id,
+        "circuito": str(payload.get("circuito") or room_id),
+        "schedule_label": str(payload.get("schedule_status_label") or "No especificado"),
+        "detected_at_display": str(payload.get("detected_at_display") or payload.get("detected_at") or ""),
+        "irms": irms,
+        "potencia": potencia,
+        "device_type": str(payload.get("device_type") or device.get("type") or "No clasificado"),
+        "device_description": str(
+            payload.get("device_description") or device.get("description") or "Sin detalle del estado electrico."
+        ),
+        "reference_label": reference_label,
+        "reference_value": reference_value,
+        "intro": (
+            "ha detectado una anomalia electrica que requiere su intervencion inmediata."
+            if severity == "critical"
+            else "ha detectado una anomalia electrica que requiere verificacion operativa."
+        ),
+        "summary_title": "Resumen de la emergencia" if severity == "critical" else "Resumen de la alerta",
+        "action_title": "Accion inmediata requerida" if severity == "critical" else "Accion operativa requerida",
+        "current_detail": (
+            f"{irms} A (umbral: {threshold_current} A)" if alert_type == "overload" else f"{irms} A ({reference_value})"
+        ),
+        "power_detail": f"{potencia} W (limite seguro: {threshold_power} W)" if alert_type == "overload" else f"{potencia} W",
+        "recommended_action": str(payload.get("recommended_action") or "Revisar el laboratorio."),
+        "reason": str(payload.get("reason") or "Evento generado por SafyraShield"),
+        "alert_id": str(payload.get("alert_id") or "-"),
+    }
 
-    subject = _notification_subject(payload)
-    html_content = (
-        "<div style='font-family:Arial,sans-serif;color:#0f172a;line-height:1.5;max-width:720px'>"
-        "<h2 style='margin:0 0 12px;color:#0f172a'>SafyraShield IoT</h2>"
-        f"<p>Estimado(a) <strong>{html.escape(recipient_name)}</strong>,</p>"
-        f"<p>El sistema SafyraShield {html.escape(intro)}</p>"
-        "<div style='border:1px solid #cbd5e1;border-radius:8px;padding:14px;margin:16px 0'>"
-        f"<h3 style='margin:0 0 10px;color:#0f172a'>{html.escape(summary_title)}</h3>"
-        + _html_row("Incidente", f"{alert_label} (Nivel {severity_label})")
-        + _html_row("Ubicacion", f"{room_name} ({room_id})")
-        + _html_row("Ramal monitoreado", circuito)
-        + _html_row("Estado detectado", device_type)
-        + _html_row("Estado de agenda", schedule_label)
-        + "</div>"
-        "<div style='background:#fff7ed;border:1px solid #fed7aa;border-radius:8px;padding:14px;margin:16px 0'>"
-        f"<h3 style='margin:0 0 10px;color:#9a3412'>{html.escape(action_title)}</h3>"
-        f"<p style='margin:0'>{html.escape(str(payload.get('recommended_action') or 'Revisar el laboratorio.'))}</p>"
-        + "</div>"
-        "<div style='border:1px solid #e2e8f0;border-radius:8px;padding:14px;margin:16px 0'>"
-        "<h3 style='margin:0 0 10px;color:#0f172a'>Reporte tecnico de telemetria</h3>"
-        + _html_row("Corriente medida", current_detail)
-        + _html_row("Potencia estimada", power_detail)
-        + _html_row(reference_label, reference_value)
-        + _html_row("Detalle del estado", device_description)
-        + _html_row("Motivo", payload.get("reason") or "Evento generado por SafyraShield")
-        + _html_row("Fecha y hora", detected_at_display)
-        + _html_row("ID de auditoria", payload.get("alert_id") or "-")
-        + "</div>"
-        "<hr style='border:none;border-top:1px solid #cbd5e1;margin:18px 0'>"
-        "<small>Mensaje automatico. Usted recibe esta alerta operativa porque su cuenta se encuentra activa "
-        "y ha aceptado los Terminos y Condiciones vigentes del sistema SafyraShield. No responder.</small>"
-        "</div>"
-    )
-    whatsapp_text = (
-        f"SafyraShield - {severity_label.upper()}\n"
-        f"Incidente: {alert_label}\n"
-        f"Lugar: {room_name} ({room_id})\n"
-        f"Ramal: {circuito}\n"
-        f"Estado: {device_type}\n"
-        f"Accion: {payload.get('recommended_action') or 'Revisar el laboratorio.'}\n"
-        f"Lectura: {irms} A / {potencia} W\n"
-        f"{reference_label}: {reference_value}\n"
-        f"Agenda: {schedule_label}\n"
-        f"Hora: {detected_at_display}\n"
-        f"ID: {payload.get('alert_id') or '-'}"
-    )
+
+def _build_notification_content(
+    payload: Mapping[str, Any],
+    recipient: Mapping[str, Any] | None = None,
+    body_html: str | None = None,
+) -> dict[str, str]:
+    context = _notification_context(payload)
+    if body_html is None:
+        body_html = render_email_body(context)
     return {
-        "email_subject": subject,
-        "email_html": html_content,
-        "whatsapp_text": whatsapp_text,
+        "email_subject": _notification_subject(payload),
+        "email_html": render_email_html(body_html, _recipient_display_name(recipient)),
+        "whatsapp_text": render_whatsapp_text(context),
     }
 
 
@@ -474,29 +485,105 @@ def _build_email_notifications(
     payload: Mapping[str, Any],
     recipients: list[Mapping[str, Any]],
 ) -> list[dict[str, Any]]:
+    # El cuerpo es igual para todos: se renderiza una vez y solo cambia el saludo.
+    body_html = render_email_body(_notification_context(payload))
+    subject = _notification_subject(payload)
     notifications: list[dict[str, Any]] = []
     for recipient in recipients:
         email = str(recipient.get("email") or "").strip()
         if not email or "@" not in email:
             continue
-        content = _build_notification_content(payload, recipient)
+        recipient_name = _recipient_display_name(recipient)
         notifications.append(
             {
                 "to": {
                     "email": email,
-                    "name": _recipient_display_name(recipient),
+                    "name": recipient_name,
                 },
-                "subject": content["email_subject"],
-                "htmlContent": content["email_html"],
+                "subject": subject,
+                "htmlContent": render_email_html(body_html, recipient_name),
             }
         )
     return notifications
 
 
+PAYLOAD_V2_REQUIRED_ENV = ("SAFYRA_BACKEND_URL", "N8N_BODY_URL_SECRET")
+_payload_v2_warned: set[tuple[str, ...]] = set()
+
+
+def _payload_version() -> int:
+    if os.getenv("N8N_PAYLOAD_VERSION", "1").strip() != "2":
+        return 1
+    # Sin URL publica o sin secreto propio, n8n recibiria enlaces que no funcionan.
+    missing = tuple(name for name in PAYLOAD_V2_REQUIRED_ENV if not os.getenv(name, "").strip())
+    if missing:
+        if missing not in _payload_v2_warned:
+            _payload_v2_warned.add(missing)
+            print(f"[NOTIFICACIONES] N8N_PAYLOAD_VERSION=2 requiere {', '.join(missing)}; se envia el payload v1.")
+        return 1
+    return 2
+
+
+def _body_url_ttl_seconds() -> float:
+    return _read_window_env("N8N_BODY_URL_TTL_SECONDS", 86400.0)
+
+
+_notification_body_store: NotificationBodyStore | None = None
+
+
+def _body_store() -> NotificationBodyStore:
+    global _notification_body_store
+
+    if _notification_body_store is None:
+        _notification_body_store = NotificationBodyStore(default_outbox_path())
+    return _notification_body_store
+
+
+def _attach_notification_content(payload: dict[str, Any], email_contacts: list[Mapping[str, Any]]) -> dict[str, Any]:
+    if _payload_version() == 1:
+        payload["notification"] = _build_notification_content(payload)
+        payload["email_notifications"] = _build_email_notifications(payload, email_contacts)
+        return payload
+
+    # v2: hechos de la alerta + un solo cuerpo HTML; n8n arma cada correo con el saludo
+    # del destinatario o descarga el HTML completo desde la URL firmada.
+    context = _notification_context(payload)
+    body_html = render_email_body(context)
+    alert_id = str(payload["alert_id"])
+    ttl_seconds = _body_url_ttl_seconds()
+    _body_store().put(alert_id, body_html, ttl_seconds)
+    backend_url = os.environ["SAFYRA_BACKEND_URL"].strip()
+
+    recipients = []
+    for contact in email_contacts:
+        email = str(contact.get("email") or "").strip()
+        if not email or "@" not in email:
+            continue
+        name = _recipient_display_name(contact)
+        recipients.append(
+            {
+                "email": email,
+                "name": name,
+                "greeting_html": render_email_header(name),
+                "body_url": build_signed_body_url(backend_url, alert_id, email, name, ttl_seconds),
+            }
+        )
+    payload["payload_version"] = 2
+    payload["notification"] = {
+        "email_subject": _notification_subject(payload),
+        "email_body_html": body_html,
+        "whatsapp_text": render_whatsapp_text(context),
+    }
+    payload["recipients"] = recipients
+    return payload
+
+
 def _build_alert_notification_payload(
     sensor: Mapping[str, Any],
     event_type: str,
     detected_at: datetime | None = None,
+    affected_branches: list[dict[str, Any]] | None = None,
+    digest: bool = False,
 ) -> dict[str, Any]:
     now = detected_at or datetime.now(timezone.utc)
     copy = _alert_copy(event_type)
@@ -537,9 +624,92 @@ def _build_alert_notification_payload(
         "created_at": now.isoformat(),
         "email_recipients": [contact["email"] for contact in email_contacts],
     }
-    payload["notification"] = _build_notification_content(payload)
-    payload["email_notifications"] = _build_email_notifications(payload, email_contacts)
-    return payload
+    if affected_branches:
+        payload["affected_branches"] = affected_branches
+        payload["branch_count"] = len(affected_branches)
+        payload["circuito"] = ", ".join(str(branch["circuito"]) for branch in affected_branches)
+        payload["potencia"] = round(sum(float(branch.get("potencia") or 0) for branch in affected_branches), 2)
+        if len(affected_branches) > 1:
+            payload["message"] = f"{copy['message']} ({len(affected_branches)} ramales afectados)"
+    if digest:
+        payload["digest"] = True
+        payload["reason"] = f"{copy['reason']} Resumen de la ventana de {int(_coalesce_window_seconds(event_type))} s."
+    return _attach_notification_content(payload, email_contacts)
+
+
+SENSOR_ALERT_BUILDER = "sensor_alert"
+
+
+def _sensor_alert_inputs(
+    sensor: Mapping[str, Any],
+    event_type: str,
+    affected_branches: list[dict[str, Any]] | None = None,
+    digest: bool = False,
+) -> dict[str, Any]:
+    """Datos crudos que se guardan en el outbox antes de armar el payload."""
+    return {
+        "sensor": dict(sensor),
+        "event_type": event_type,
+        "detected_at": datetime.now(timezone.utc).isoformat(),
+        "affected_branches": affected_branches,
+        "digest": digest,
+    }
+
+
+def _build_sensor_alert_payload(inputs: Mapping[str, Any]) -> dict[str, Any]:
+    return _build_alert_notification_payload(
+        inputs["sensor"],
+        inputs["event_type"],
+        detected_at=datetime.fromisoformat(inputs["detected_at"]),
+        affected_branches=inputs.get("affected_branches"),
+        digest=bool(inputs.get("digest")),
+    )
+
+
+register_payload_builder(SENSOR_ALERT_BUILDER, _build_sensor_alert_payload)
+
+
+def _affected_branch(sensor: Mapping[str, Any]) -> dict[str, Any]:
+    return {
+        "sensor_id": sensor.get("id"),
+        "circuito": sensor.get("circuito") or sensor.get("id"),
+        "irms": sensor.get("irms"),
+        "potencia": sensor.get("potencia"),
+        "estado": sensor.get("estado"),
+        "detected_at": sensor.get("timestamp"),
+    }
+
+
+async def _emit_coalesced_alert(room_id: str, event_type: str, sensors: list[dict[str, Any]]) -> None:
+    """Una sola notificacion y un solo ticket por incidente de sala.
+
+    Fuera del modo digest, el primer ramal de la ventana ya salio al abrirla: si
+    nadie mas se sumo no hay nada que enviar; si no, sale el resumen de todos.
+    """
+    digest = _is_digest(event_type)
+    if not digest and len(sensors) <= 1:
+        return
+    primary = max(sensors, key=lambda item: float(item.get("irms") or 0))
+    branches = [_affected_branch(item) for item in sorted(sensors, key=lambda item: str(item.get("id") or ""))]
+    print(f"[ALERTAS] Emitiendo alerta agrupada {room_id}/{event_type} con {len(branches)} ramal(es).")
+
+    await run_in_threadpool(
+        handle_critical_alert,
+        event_type=event_type,
+        sensor_id=primary.get("id", LAB_ROOM_ID),
+        severity="Alta" if event_type == "overload" else "Media",
+        irms=primary.get("irms"),
+        power=sum(float(branch.get("potencia") or 0) for branch in branches),
+        branch_label=", ".join(str(branch["circuito"]) for branch in branches),
+    )
+    await run_in_threadpool(
+        queue_raw_alert_notification,
+        SENSOR_ALERT_BUILDER,
+        _sensor_alert_inputs(primary, event_type, affected_branches=branches, digest=digest),
+    )
+
+
+alert_coalescer = AlertCoalescer(_emit_coalesced_alert, build_alert_window_store())
 
 
 def _event_type_for_sensor(sensor: Mapping[str, Any]) -> str:
@@ -550,7 +720,13 @@ def _event_type_for_sensor(sensor: Mapping[str, Any]) -> str:
     return ""
 
 
-def _queue_sensor_alert(sensor: Mapping[str, Any], background_tasks: BackgroundTasks = None) -> dict[str, Any]:
+def _queue_sensor_alert(
+    sensor: Mapping[str, Any],
+    background_tasks: BackgroundTasks = None,
+    loop: asyncio.AbstractEventLoop | None = None,
+) -> dict[str, Any]:
+    """Cooldown, ventana y outbox escriben en SQLite: en la ingesta corre en el
+    threadpool y ``loop`` es el event loop donde se programan los cierres de ventana."""
     event_type = _event_type_for_sensor(sensor)
     if not event_type:
         return {"queued": False, "reason": "no_alert"}
@@ -558,12 +734,22 @@ def _queue_sensor_alert(sensor: Mapping[str, Any], background_tasks: BackgroundT
     current_timestamp = datetime.now(timezone.utc).timestamp()
     cooldown = _notification_cooldown_seconds()
     cache_key = f"{sensor.get('id')}:{event_type}"
-    last_sent = _alert_notification_cache.get(cache_key, 0)
-    if current_timestamp - last_sent < cooldown:
+    # Check-and-set atomico: con varios workers solo uno gana la alerta.
+    if not alert_cooldown_store.try_acquire(cache_key, cooldown, current_timestamp):
         return {"queued": False, "reason": "cooldown"}
 
     sensor_snapshot = dict(sensor)
-    
+    room_id = str(sensor_snapshot.get("schedule_room_id") or LAB_ROOM_ID)
+    window = alert_coalescer.add(room_id, event_type, sensor_snapshot, _coalesce_window_seconds(event_type), loop)
+    # La primera alerta de la sala sale de inmediato (salvo en digest); las que llegan
+    # durante la ventana salen juntas al cerrarla, con todos los ramales afectados.
+    if window["window_open"] and (window["coalesced"] or _is_digest(event_type)):
+        return {
+            "queued": True,
+            "reason": "coalesced" if window["coalesced"] else "",
+            "event_type": event_type,
+        }
+
     # Siempre crear ticket/audit_event en Supabase cuando hay una alerta real (independiente de notificación)
     if background_tasks:
         severity = "Alta" if event_type == "overload" else "Media"
@@ -578,24 +764,12 @@ def _queue_sensor_alert(sensor: Mapping[str, Any], background_tasks: BackgroundT
         )
 
     # La notificación (email/push) es un esfuerzo separado e independiente
-    queue_result = queue_alert_notification_factory(
-        lambda: _build_alert_notification_payload(sensor_snapshot, event_type)
-    )
-    if queue_result.get("queued"):
-        _alert_notification_cache[cache_key] = current_timestamp
-    else:
-        # Marcar cooldown igual para evitar spam de tickets en lecturas consecutivas
-        _alert_notification_cache[cache_key] = current_timestamp
-        
+    queue_result = queue_raw_alert_notification(SENSOR_ALERT_BUILDER, _sensor_alert_inputs(sensor_snapshot, event_type))
+    # El cooldown ya quedo marcado aunque no se encole, para evitar spam de tickets en lecturas consecutivas
     return {**queue_result, "event_type": event_type}
 
 
-@router.post("/iot/readings", status_code=status.HTTP_201_CREATED, dependencies=[Depends(_require_iot_token)])
-async def ingest_iot_reading(reading: IotReadingPayload, background_tasks: BackgroundTasks):
-    sensor_id = reading.sensor_id.strip()
-    if not IOT_SENSOR_ID_PATTERN.fullmatch(sensor_id):
-        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="sensor_id invalido")
-
+async def _record_reading_and_queue_alert(reading: IotReadingPayload, sensor_id: str, background_tasks: BackgroundTasks) -> dict[str, Any]:
     try:
         sensor = await run_in_threadpool(
             record_iot_reading,
@@ -610,7 +784,8 @@ async def ingest_iot_reading(reading: IotReadingPayload, background_tasks: Backg
     except Exception as exc:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al registrar lectura IoT: {exc}") from exc
 
-    notification = _queue_sensor_alert(sensor, background_tasks)
+    # Con varios workers los archivos SQLite pueden estar bloqueados: nunca en el hilo del loop.
+    notification = await run_in_threadpool(_queue_sensor_alert, sensor, background_tasks, asyncio.get_running_loop())
     return {
         "success": True,
         "sensor": sensor,
@@ -620,6 +795,57 @@ async def ingest_iot_reading(reading: IotReadingPayload, background_tasks: Backg
         },
     }
 
+
+async def process_iot_reading(
+    reading: IotReadingPayload,
+    iot_token: str,
+    background_tasks: BackgroundTasks,
+    idempotency_key: str | None = None,
+) -> tuple[dict[str, Any], bool]:
+    """Pipeline comun de ingesta (HTTP y listener de lineas). Devuelve ``(resultado, reenviado)``."""
+    sensor_id = reading.sensor_id.strip()
+    if not IOT_SENSOR_ID_PATTERN.fullmatch(sensor_id):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="sensor_id invalido")
+
+    replay_key = idempotency_key_for(reading.device_seq, idempotency_key)
+    if replay_key is not None:
+        # Un reintento ya procesado no consume cupo de admision: se devuelve el resultado original.
+        replayed = await ingest_idempotency_cache.replay(sensor_id, replay_key)
+        if replayed is not None:
+            return replayed, True
+
+    admission = admit_iot_reading(sensor_id, iot_token)
+    if not admission.admitted:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Demasiadas lecturas ({admission.scope}); reintente mas tarde",
+            headers={"Retry-After": retry_after_header(admission)},
+        )
+
+    if replay_key is None:
+        return await _record_reading_and_queue_alert(reading, sensor_id, background_tasks), False
+
+    # Un reintento del ESP32 devuelve el resultado original sin tocar Firebase, Supabase ni n8n.
+    return await ingest_idempotency_cache.resolve(
+        sensor_id,
+        replay_key,
+        lambda: _record_reading_and_queue_alert(reading, sensor_id, background_tasks),
+    )
+
+
+@router.post("/iot/readings", status_code=status.HTTP_201_CREATED)
+async def ingest_iot_reading(
+    reading: IotReadingPayload,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    iot_token: str = Depends(_require_iot_token),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key", max_length=128),
+):
+    result, replayed = await process_iot_reading(reading, iot_token, background_tasks, idempotency_key)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
 @router.get("/current", dependencies=[Depends(require_roles(*CURRENT_DATA_ROLES))])
 async def read_current_data():
     """
@@ -679,6 +905,32 @@ async def check_connection_status():
     }
 
 
+@router.get("/metrics", dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+async def read_runtime_metrics():
+    """
+    Metricas en memoria del proceso (ingesta IoT y webhooks)
+    (Protegido por autenticación)
+    """
+    return {
+        "ingest": {
+            "admission": iot_admission_controller.snapshot(),
+            "idempotency": ingest_idempotency_cache.snapshot(),
+            "line_listener": line_ingest_snapshot(),
+        },
+        "alerts": {
+            "coalescing": alert_coalescer.snapshot(),
+            "cooldowns": alert_cooldown_store.snapshot(),
+        },
+        "tickets": ticket_batcher.snapshot(),
+        "report_pdf_cache": report_pdf_cache.snapshot(),
+        "document_render_pool": document_render_pool.snapshot(),
+        "password_hash_pool": password_hash_pool.snapshot(),
+        "identity_cache": identity_cache.snapshot(),
+        "exports": export_job_manager.snapshot(),
+        "notifications": notification_metrics_snapshot(),
+    }
+
+
 @router.get("/schedule", dependencies=[Depends(require_roles(*SCHEDULE_READ_ROLES))])
 async def read_room_schedule(room_id: str | None = None):
     schedules = list_room_schedules(room_id)
@@ -770,11 +1022,24 @@ async def send_n8n_test_alert(alert_data: TestAlertPayload):
         "created_at": now.isoformat(),
         "email_recipients": [contact["email"] for contact in email_contacts],
     }
-    payload["notification"] = _build_notification_content(payload)
-    payload["email_notifications"] = _build_email_notifications(payload, email_contacts)
-    result = send_alert_notification(payload)
+    _attach_notification_content(payload, email_contacts)
+    result = await send_alert_notification(payload)
     return {"success": bool(result.get("sent")), "notification": result, "payload": payload}
 
+
+@router.get("/notifications/{alert_id}/email", response_class=HTMLResponse)
+async def read_notification_email(alert_id: str, to: str, name: str, exp: int, sig: str):
+    """
+    Correo renderizado para un destinatario (payload v2)
+    (Protegido por URL firmada, sin sesion)
+    """
+    if not verify_body_url(alert_id, to, name, exp, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Enlace invalido o expirado")
+    body_html = await run_in_threadpool(_body_store().get, alert_id)
+    if body_html is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notificacion no encontrada o expirada")
+    return HTMLResponse(render_email_html(body_html, name))
+
 @router.put("/threshold/{sensor_id}", dependencies=[Depends(require_roles(*ADMIN_ROLES))])
 async def update_threshold(sensor_id: str, threshold: ThresholdUpdate):
     """
@@ -838,7 +1103,9 @@ async def export_excel(
     NUEVO: Exportar datos históricos en formato Excel con estilos (HU-011)
     (Protegido por autenticación)
     """
-    excel_content_bytes = await run_in_threadpool(export_history_excel, sensor_id, start_date, end_date)
+    # Lectura de Firebase en el threadpool; el render de openpyxl en el pool de procesos.
+    rows = await run_in_threadpool(collect_history_rows, sensor_id, start_date, end_date)
+    excel_content_bytes = await document_render_pool.render(render_history_workbook, rows)
     
     if not excel_content_bytes:
         raise HTTPException(status_code=404, detail="No hay datos para exportar")
@@ -852,6 +1119,49 @@ async def export_excel(
             "Content-Disposition": f"attachment; filename={filename}"
         }
     )
+
+class ExportJobPayload(BaseModel):
+    format: Literal["csv", "excel"] = "csv"
+    sensor_id: str | None = Field(default=None, max_length=50)
+    start_date: str | None = Field(default=None, max_length=32)
+    end_date: str | None = Field(default=None, max_length=32)
+
+
+def _export_job_response(job) -> dict[str, object]:
+    result = job.to_dict()
+    if job.status == "done":
+        result["download_url"] = f"/api/data/exports/{job.id}/download"
+    return result
+
+
+@router.post("/exports", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_roles(*REPORT_ROLES))])
+async def create_export_job(payload: ExportJobPayload):
+    """
+    Encola una exportacion completa (todos los sensores, sin tope por sensor).
+    Si ya existe una con los mismos parametros, se reutiliza.
+    """
+    job, deduplicated = export_job_manager.submit(
+        payload.format, payload.sensor_id, payload.start_date, payload.end_date
+    )
+    return {**_export_job_response(job), "deduplicated": deduplicated}
+
+
+@router.get("/exports/{job_id}", dependencies=[Depends(require_roles(*REPORT_ROLES))])
+async def get_export_job(job_id: str):
+    job = export_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportacion no encontrada o expirada")
+    return _export_job_response(job)
+
+
+@router.get("/exports/{job_id}/download", dependencies=[Depends(require_roles(*REPORT_ROLES))])
+async def download_export_job(job_id: str):
+    job = export_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportacion no encontrada o expirada")
+    if job.status != "done" or not job.path:
+        raise HTTPException(status_code=409, detail="La exportacion aun no esta lista")
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename)
 
 @router.get("/statistics", dependencies=[Depends(require_roles(*CURRENT_DATA_ROLES))])
 async def get_statistics():
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import Response
-from app.db.supabase import get_supabase_client
-from app.services.report_service import generate_pdf_from_summary
+from app.db.supabase import get_supabase_client, run_supabase
+from app.services.pdf_cache import pdf_cache_key, report_pdf_cache
+from app.services.document_renderers import generate_pdf_from_summary
+from app.services.render_pool import document_render_pool
+from app.services.report_service import get_tickets_version, with_tickets_list
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
@@ -9,31 +12,92 @@ router = APIRouter(prefix="/api/reports", tags=["reports"])
 async def get_reports():
     """Lista todos los reportes historicos"""
     client = get_supabase_client()
-    res = client.table("reports").select("id, report_code, period_start, period_end, total_alerts, total_tickets, peak_current, generated_at").order("generated_at", desc=True).execute()
+    res = await run_supabase(lambda: client.table("reports").select("id, report_code, period_start, period_end, total_alerts, total_tickets, peak_current, generated_at").order("generated_at", desc=True).execute())
     return {"data": res.data}
 
+def _parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """Interpreta un unico rango ``bytes=inicio-fin``; ``None`` si no es satisfacible."""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Sufijo: los ultimos N bytes.
+            start, end = max(0, size - int(end_text)), size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start < 0 or start > end:
+        return None
+    return start, end
+
+
 @router.get("/{report_id}/download")
-async def download_report_pdf(report_id: str):
-    """Renderiza on-the-fly el PDF desde el JSON almacenado"""
+async def download_report_pdf(report_id: str, request: Request):
+    """Sirve el PDF desde cache; solo se renderiza on-the-fly si el reporte cambio"""
     client = get_supabase_client()
-    res = client.table("reports").select("*").eq("id", report_id).execute()
+    res = await run_supabase(
+        lambda: client.table("reports").select("id, report_code, generated_at, period_start, period_end").eq("id", report_id).execute()
+    )
     
     if not res.data:
         raise HTTPException(status_code=404, detail="Reporte no encontrado")
         
     report = res.data[0]
-    summary_data = report.get("summary_data")
-    
-    if not summary_data:
-        raise HTTPException(status_code=500, detail="Data del reporte corrupta")
-        
-    pdf_bytes = generate_pdf_from_summary(summary_data)
-    
-    filename = f"{report['report_code']}.pdf"
+    # El PDF incluye la lista de tickets del periodo: editar uno cambia la clave y el ETag.
+    tickets_version = await run_supabase(
+        lambda: get_tickets_version(report.get("period_start"), report.get("period_end"))
+    )
+    cacheable = tickets_version is not None
+    cache_key = pdf_cache_key(report_id, report.get("generated_at"), tickets_version or "")
+    etag = f'"{cache_key}"'
+    headers = {
+        "Content-Disposition": f"attachment; filename={report['report_code']}.pdf",
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+    }
+    if cacheable:
+        headers["ETag"] = etag
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+
+    pdf_bytes = report_pdf_cache.get(report_id, cache_key) if cacheable else None
+    if pdf_bytes is None:
+        detail = await run_supabase(
+            lambda: client.table("reports").select("summary_data").eq("id", report_id).execute()
+        )
+        summary_data = (detail.data or [{}])[0].get("summary_data")
+        if not summary_data:
+            raise HTTPException(status_code=500, detail="Data del reporte corrupta")
+        # La lista de tickets solo se consulta aqui, cuando el PDF la necesita.
+        full_summary = await run_supabase(lambda: with_tickets_list(summary_data))
+        pdf_bytes = await document_render_pool.render(generate_pdf_from_summary, full_summary)
+        if cacheable:
+            report_pdf_cache.put(report_id, cache_key, pdf_bytes)
+
+    range_header = request.headers.get("range")
+    if range_header and cacheable and request.headers.get("if-range", etag) == etag:
+        byte_range = _parse_range(range_header, len(pdf_bytes))
+        if byte_range is None:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{len(pdf_bytes)}"}
+            )
+        start, end = byte_range
+        return Response(
+            content=pdf_bytes[start:end + 1],
+            status_code=206,
+            media_type="application/pdf",
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{len(pdf_bytes)}"},
+        )
+
     return Response(
         content=pdf_bytes,
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers=headers
     )
 
 @router.post("/generate")
@@ -1,5 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from app.db.supabase import get_supabase_client
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.db.supabase import get_supabase_client, run_supabase
 from app.models.supabase_models import TicketUpdate
 
 router = APIRouter(prefix="/api/tickets", tags=["tickets"])
@@ -7,34 +14,120 @@ router = APIRouter(prefix="/api/tickets", tags=["tickets"])
 # Omitimos require_roles para simplificar, pero en prod importarias:
 # from app.routers.auth_api import require_roles, ADMIN_ROLES
 
+TICKET_COLUMNS = (
+    "id, ticket_code, issue_type, priority, status, resolution_notes, created_at, occurrence_count, last_seen_at"
+)
+EVENT_COLUMNS = "sensor_id, event_type, branch_label, irms, power, detected_at"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: str, ticket_id: str) -> str:
+    raw = json.dumps([created_at, ticket_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, ticket_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+        return str(created_at), str(uuid.UUID(str(ticket_id)))
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursor de paginacion invalido")
+
+
+def _apply_filters(query, status_filter, priority, sensor_id, date_from, date_to):
+    if status_filter:
+        query = query.eq("status", status_filter)
+    if priority:
+        query = query.eq("priority", priority)
+    if sensor_id:
+        query = query.eq("audit_events.sensor_id", sensor_id)
+    if date_from:
+        query = query.gte("created_at", date_from.isoformat())
+    if date_to:
+        query = query.lte("created_at", date_to.isoformat())
+    return query
+
+
+def _embed(sensor_id: Optional[str], columns: str) -> str:
+    # Con filtro por sensor el join debe ser inner para descartar tickets de otros ramales.
+    return f"audit_events!inner({columns})" if sensor_id else f"audit_events({columns})"
+
+
+def _flatten_ticket(t: dict) -> dict:
+    event = t.get("audit_events") or {}
+    return {
+        "id": t.get("id"),
+        "ticket_code": t.get("ticket_code"),
+        "issue_type": t.get("issue_type"),
+        "priority": t.get("priority"),
+        "status": t.get("status"),
+        "resolution_notes": t.get("resolution_notes"),
+        "created_at": t.get("created_at"),
+        "occurrence_count": t.get("occurrence_count") or 1,
+        "last_seen_at": t.get("last_seen_at"),
+        "sensor_id": event.get("sensor_id", "—"),
+        "branch_label": event.get("branch_label", "—"),
+        "event_type": event.get("event_type", t.get("issue_type", "—")),
+        "irms": event.get("irms"),
+        "power": event.get("power"),
+    }
+
+
 @router.get("/")
-async def get_tickets():
+async def get_tickets(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = None,
+    sensor_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Pagina por keyset sobre ``(created_at, id)``: el costo no crece con el historial."""
     client = get_supabase_client()
-    # Join con audit_events para obtener sensor_id, event_type y branch_label
-    res = client.table("maintenance_tickets").select(
-        "id, ticket_code, issue_type, priority, status, resolution_notes, created_at, "
-        "audit_events(sensor_id, event_type, branch_label, irms, power, detected_at)"
-    ).order("created_at", desc=True).execute()
-    
+    after = decode_cursor(cursor) if cursor else None
+
+    def query():
+        # Join con audit_events para obtener sensor_id, event_type y branch_label
+        q = client.table("maintenance_tickets").select(f"{TICKET_COLUMNS}, {_embed(sensor_id, EVENT_COLUMNS)}")
+        q = _apply_filters(q, status_filter, priority, sensor_id, date_from, date_to)
+        if after:
+            created_at, ticket_id = after
+            q = q.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{ticket_id})')
+        # Se pide una fila extra para saber si hay pagina siguiente.
+        return q.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+
+    res = await run_supabase(query)
+    rows = res.data or []
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
     # Aplanar la respuesta para facilitar el consumo en el frontend
-    flattened = []
-    for t in (res.data or []):
-        event = t.get("audit_events") or {}
-        flattened.append({
-            "id": t.get("id"),
-            "ticket_code": t.get("ticket_code"),
-            "issue_type": t.get("issue_type"),
-            "priority": t.get("priority"),
-            "status": t.get("status"),
-            "resolution_notes": t.get("resolution_notes"),
-            "created_at": t.get("created_at"),
-            "sensor_id": event.get("sensor_id", "—"),
-            "branch_label": event.get("branch_label", "—"),
-            "event_type": event.get("event_type", t.get("issue_type", "—")),
-            "irms": event.get("irms"),
-            "power": event.get("power"),
-        })
-    return {"data": flattened}
+    return {"data": [_flatten_ticket(t) for t in rows], "next_cursor": next_cursor, "limit": limit}
+
+
+@router.get("/count")
+async def count_tickets(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = None,
+    sensor_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Total de tickets con los mismos filtros, sin transferir filas."""
+    client = get_supabase_client()
+
+    def query():
+        q = client.table("maintenance_tickets").select(f"id, {_embed(sensor_id, 'sensor_id')}", count="exact", head=True)
+        return _apply_filters(q, status_filter, priority, sensor_id, date_from, date_to).execute()
+
+    res = await run_supabase(query)
+    return {"count": res.count or 0}
 
 @router.patch("/{ticket_id}")
 async def update_ticket(ticket_id: str, update_data: TicketUpdate):
@@ -45,7 +138,8 @@ async def update_ticket(ticket_id: str, update_data: TicketUpdate):
     if not data:
         raise HTTPException(status_code=400, detail="No data provided to update")
         
-    res = client.table("maintenance_tickets").update(data).eq("id", ticket_id).execute()
+    # closed_at y los agregados del reporte los actualizan triggers en Postgres.
+    res = await run_supabase(lambda: client.table("maintenance_tickets").update(data).eq("id", ticket_id).execute())
     if not res.data:
         raise HTTPException(status_code=404, detail="Ticket not found")
         
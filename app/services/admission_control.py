@@ -0,0 +1,153 @@
+"""Control de admision para la ingesta IoT con token buckets."""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+DEFAULT_SENSOR_RATE_PER_SECOND = 5.0
+DEFAULT_SENSOR_BURST = 20.0
+DEFAULT_TOKEN_RATE_PER_SECOND = 50.0
+DEFAULT_TOKEN_BURST = 100.0
+DEFAULT_MAX_TRACKED_KEYS = 1024
+
+
+def _read_float_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _admission_enabled() -> bool:
+    return os.getenv("IOT_ADMISSION_ENABLED", "true").lower() in {"1", "true", "yes"}
+
+
+@dataclass
+class TokenBucket:
+    """Bucket con recarga perezosa: se recalcula solo cuando alguien lo consulta."""
+
+    rate_per_second: float
+    capacity: float
+    tokens: float
+    updated_at: float
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_seconds(self, now: float) -> float:
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        if self.rate_per_second <= 0:
+            return math.inf
+        return (1.0 - self.tokens) / self.rate_per_second
+
+    def consume(self) -> None:
+        self.tokens -= 1.0
+
+
+@dataclass(frozen=True)
+class AdmissionDecision:
+    admitted: bool
+    retry_after_seconds: float = 0.0
+    scope: str = ""
+
+
+class AdmissionController:
+    """Buckets por sensor y por token IoT; rechaza antes de cualquier I/O."""
+
+    def __init__(
+        self,
+        sensor_rate_per_second: float = DEFAULT_SENSOR_RATE_PER_SECOND,
+        sensor_burst: float = DEFAULT_SENSOR_BURST,
+        token_rate_per_second: float = DEFAULT_TOKEN_RATE_PER_SECOND,
+        token_burst: float = DEFAULT_TOKEN_BURST,
+        *,
+        max_tracked_keys: int = DEFAULT_MAX_TRACKED_KEYS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._limits = {
+            "sensor": (sensor_rate_per_second, max(1.0, sensor_burst)),
+            "token": (token_rate_per_second, max(1.0, token_burst)),
+        }
+        self._buckets: OrderedDict[tuple[str, str], TokenBucket] = OrderedDict()
+        self._max_tracked_keys = max_tracked_keys
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected: dict[str, int] = {"sensor": 0, "token": 0}
+
+    def _bucket(self, scope: str, key: str, now: float) -> TokenBucket:
+        bucket_key = (scope, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            rate, capacity = self._limits[scope]
+            bucket = TokenBucket(rate_per_second=rate, capacity=capacity, tokens=capacity, updated_at=now)
+            self._buckets[bucket_key] = bucket
+            while len(self._buckets) > self._max_tracked_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
+
+    def admit(self, sensor_id: str, token: str) -> AdmissionDecision:
+        now = self._clock()
+        token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            buckets = {
+                "token": self._bucket("token", token_key, now),
+                "sensor": self._bucket("sensor", sensor_id, now),
+            }
+            waits = {scope: bucket.wait_seconds(now) for scope, bucket in buckets.items()}
+            blocking_scope = max(waits, key=lambda scope: waits[scope])
+            if waits[blocking_scope] > 0:
+                self.rejected[blocking_scope] += 1
+                return AdmissionDecision(False, waits[blocking_scope], blocking_scope)
+            # Solo se consume cuando ambos buckets admiten la lectura.
+            for bucket in buckets.values():
+                bucket.consume()
+            self.admitted += 1
+            return AdmissionDecision(True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.admitted = 0
+            self.rejected = {"sensor": 0, "token": 0}
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": _admission_enabled(),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "rejected_total": sum(self.rejected.values()),
+                "tracked_buckets": len(self._buckets),
+            }
+
+
+def retry_after_header(decision: AdmissionDecision) -> str:
+    if math.isinf(decision.retry_after_seconds):
+        return "60"
+    return str(max(1, math.ceil(decision.retry_after_seconds)))
+
+
+def admit_iot_reading(sensor_id: str, token: str) -> AdmissionDecision:
+    if not _admission_enabled():
+        return AdmissionDecision(True)
+    return iot_admission_controller.admit(sensor_id, token)
+
+
+iot_admission_controller = AdmissionController(
+    sensor_rate_per_second=_read_float_env("IOT_ADMISSION_SENSOR_RATE_PER_SECOND", DEFAULT_SENSOR_RATE_PER_SECOND),
+    sensor_burst=_read_float_env("IOT_ADMISSION_SENSOR_BURST", DEFAULT_SENSOR_BURST),
+    token_rate_per_second=_read_float_env("IOT_ADMISSION_TOKEN_RATE_PER_SECOND", DEFAULT_TOKEN_RATE_PER_SECOND),
+    token_burst=_read_float_env("IOT_ADMISSION_TOKEN_BURST", DEFAULT_TOKEN_BURST),
+)
@@ -0,0 +1,294 @@
+"""Agrupa alertas de varios ramales de una misma sala en una sola notificacion."""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any, Mapping, Protocol
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.cooldown_store import default_cooldown_db_path
+
+EmitCallback = Callable[[str, str, list[dict[str, Any]]], Awaitable[None]]
+
+
+class AlertWindowStore(Protocol):
+    def add_member(
+        self, room_id: str, event_type: str, sensor_id: str, snapshot: Mapping[str, Any], window_seconds: float, now: float
+    ) -> tuple[bool, str, float]:
+        """Suma el ramal a la ventana de ``(sala, tipo)``; devuelve ``(abrio, window_id, cierra_en)``."""
+
+    def take_window(self, room_id: str, event_type: str, window_id: str) -> list[dict[str, Any]]:
+        """Retira la ventana y sus ramales; solo un llamador la obtiene."""
+
+    def open_windows(self) -> list[tuple[str, str, str, float]]: ...
+
+    def clear(self) -> None: ...
+
+
+class InMemoryAlertWindowStore:
+    """Ventanas del proceso actual (un solo worker)."""
+
+    backend = "memory"
+
+    def __init__(self) -> None:
+        self._windows: dict[tuple[str, str], tuple[str, float, dict[str, dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+
+    def add_member(
+        self, room_id: str, event_type: str, sensor_id: str, snapshot: Mapping[str, Any], window_seconds: float, now: float
+    ) -> tuple[bool, str, float]:
+        with self._lock:
+            key = (room_id, event_type)
+            opened = key not in self._windows
+            if opened:
+                self._windows[key] = (uuid.uuid4().hex, now + window_seconds, {})
+            window_id, closes_at, members = self._windows[key]
+            members[sensor_id] = dict(snapshot)
+            return opened, window_id, closes_at
+
+    def take_window(self, room_id: str, event_type: str, window_id: str) -> list[dict[str, Any]]:
+        with self._lock:
+            window = self._windows.get((room_id, event_type))
+            if window is None or window[0] != window_id:
+                return []
+            del self._windows[(room_id, event_type)]
+            return list(window[2].values())
+
+    def open_windows(self) -> list[tuple[str, str, str, float]]:
+        with self._lock:
+            return [(room_id, event_type, window[0], window[1]) for (room_id, event_type), window in self._windows.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+
+class SqliteAlertWindowStore:
+    """Ventanas en SQLite: todos los workers del host suman ramales a la misma ventana
+    y una ventana abierta sobrevive a un reinicio del proceso."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS alert_windows (
+                room_id TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                window_id TEXT NOT NULL,
+                closes_at REAL NOT NULL,
+                PRIMARY KEY (room_id, event_type)
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS alert_window_members (
+                window_id TEXT NOT NULL,
+                sensor_id TEXT NOT NULL,
+                snapshot TEXT NOT NULL,
+                PRIMARY KEY (window_id, sensor_id)
+            )
+            """
+        )
+
+    def add_member(
+        self, room_id: str, event_type: str, sensor_id: str, snapshot: Mapping[str, Any], window_seconds: float, now: float
+    ) -> tuple[bool, str, float]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT window_id, closes_at FROM alert_windows WHERE room_id = ? AND event_type = ?",
+                    (room_id, event_type),
+                ).fetchone()
+                opened = row is None
+                window_id, closes_at = (uuid.uuid4().hex, now + window_seconds) if opened else row
+                if opened:
+                    self._conn.execute(
+                        "INSERT INTO alert_windows (room_id, event_type, window_id, closes_at) VALUES (?, ?, ?, ?)",
+                        (room_id, event_type, window_id, closes_at),
+                    )
+                # La ultima lectura de cada ramal reemplaza a la anterior dentro de la ventana.
+                self._conn.execute(
+                    """
+                    INSERT INTO alert_window_members (window_id, sensor_id, snapshot) VALUES (?, ?, ?)
+                    ON CONFLICT(window_id, sensor_id) DO UPDATE SET snapshot = excluded.snapshot
+                    """,
+                    (window_id, sensor_id, json.dumps(dict(snapshot), ensure_ascii=False)),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return opened, window_id, closes_at
+
+    def take_window(self, room_id: str, event_type: str, window_id: str) -> list[dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._conn.execute(
+                    "DELETE FROM alert_windows WHERE room_id = ? AND event_type = ? AND window_id = ?",
+                    (room_id, event_type, window_id),
+                ).rowcount
+                rows = []
+                if deleted:
+                    rows = self._conn.execute(
+                        "SELECT snapshot FROM alert_window_members WHERE window_id = ? ORDER BY rowid", (window_id,)
+                    ).fetchall()
+                    self._conn.execute("DELETE FROM alert_window_members WHERE window_id = ?", (window_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [json.loads(row[0]) for row in rows]
+
+    def open_windows(self) -> list[tuple[str, str, str, float]]:
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT room_id, event_type, window_id, closes_at FROM alert_windows ORDER BY closes_at"
+            ).fetchall()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM alert_windows")
+            self._conn.execute("DELETE FROM alert_window_members")
+
+
+def build_alert_window_store() -> AlertWindowStore:
+    # Mismo backend y archivo que los cooldowns: ambos deben verse igual desde todos los workers.
+    if os.getenv("ALERT_COOLDOWN_STORE", "sqlite").strip().lower() == "memory":
+        return InMemoryAlertWindowStore()
+    try:
+        return SqliteAlertWindowStore(default_cooldown_db_path())
+    except (OSError, sqlite3.Error) as exc:
+        print(f"[ALERTAS] No se pudo abrir el store SQLite de ventanas, se usa memoria del proceso: {exc}")
+        return InMemoryAlertWindowStore()
+
+
+class AlertCoalescer:
+    """Ventana por ``(sala, tipo de evento)``: la primera alerta abre la ventana,
+    las siguientes se suman y al cerrarse se emite una sola notificacion.
+
+    Los ramales de cada ventana viven en ``store``; cada worker que suma un ramal
+    programa un cierre local y solo el primero que retira la ventana la emite.
+    ``add`` puede llamarse desde el threadpool pasando el ``loop`` de la app: el
+    store (SQLite) no bloquea el event loop y el cierre se programa en el loop.
+    """
+
+    def __init__(self, emit: EmitCallback, store: AlertWindowStore | None = None, *, clock: Callable[[], float] = time.time) -> None:
+        self._emit = emit
+        self._store = store if store is not None else InMemoryAlertWindowStore()
+        self._clock = clock
+        self._timers: dict[tuple[str, str, str], asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.windows_emitted = 0
+        self.alerts_coalesced = 0
+
+    def add(
+        self,
+        room_id: str,
+        event_type: str,
+        sensor: Mapping[str, Any],
+        window_seconds: float,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> dict[str, Any]:
+        snapshot = dict(sensor)
+        sensor_key = str(snapshot.get("id") or "")
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+        if window_seconds <= 0 or loop is None:
+            return {"coalesced": False, "window_open": False, "sensors": [snapshot]}
+
+        opened, window_id, closes_at = self._store.add_member(
+            room_id, event_type, sensor_key, snapshot, window_seconds, self._clock()
+        )
+        # Tambien al sumarse: si el worker que abrio la ventana murio, este la cierra.
+        self._schedule_close_threadsafe(loop, (room_id, event_type, window_id), closes_at)
+        if not opened:
+            self.alerts_coalesced += 1
+            return {"coalesced": True, "window_open": True}
+        return {"coalesced": False, "window_open": True}
+
+    def recover(self) -> int:
+        """Programa el cierre de las ventanas que quedaron abiertas (p. ej. tras un reinicio)."""
+        loop = asyncio.get_running_loop()
+        windows = self._store.open_windows()
+        for room_id, event_type, window_id, closes_at in windows:
+            self._schedule_close(loop, (room_id, event_type, window_id), closes_at)
+        return len(windows)
+
+    def _schedule_close(self, loop: asyncio.AbstractEventLoop, key: tuple[str, str, str], closes_at: float) -> None:
+        if key not in self._timers:
+            self._timers[key] = loop.call_later(max(0.0, closes_at - self._clock()), self._close_window, key)
+
+    def _schedule_close_threadsafe(self, loop: asyncio.AbstractEventLoop, key: tuple[str, str, str], closes_at: float) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._schedule_close(loop, key, closes_at)
+        else:
+            # Desde el threadpool: los timers solo se tocan en el hilo del loop.
+            loop.call_soon_threadsafe(self._schedule_close, loop, key, closes_at)
+
+    def _close_window(self, key: tuple[str, str, str]) -> None:
+        self._timers.pop(key, None)
+        task = asyncio.get_running_loop().create_task(self._take_and_emit(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _take_and_emit(self, key: tuple[str, str, str]) -> None:
+        room_id, event_type, window_id = key
+        sensors = await run_in_threadpool(self._store.take_window, room_id, event_type, window_id)
+        if not sensors:
+            # Otro worker ya la emitio.
+            return
+        await self._run_emit(room_id, event_type, sensors)
+
+    async def _run_emit(self, room_id: str, event_type: str, sensors: list[dict[str, Any]]) -> None:
+        self.windows_emitted += 1
+        try:
+            await self._emit(room_id, event_type, sensors)
+        except Exception as exc:
+            print(f"[ALERTAS] Error emitiendo alerta agrupada {room_id}/{event_type}: {exc}")
+
+    async def flush(self) -> None:
+        """Cierra las ventanas que este worker tiene programadas (p. ej. al apagar la app)."""
+        for key, timer in list(self._timers.items()):
+            timer.cancel()
+            self._close_window(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def reset(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._store.clear()
+        self.windows_emitted = 0
+        self.alerts_coalesced = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "open_windows": len(self._store.open_windows()),
+            "windows_emitted": self.windows_emitted,
+            "alerts_coalesced": self.alerts_coalesced,
+            "backend": getattr(self._store, "backend", "memory"),
+        }
@@ -0,0 +1,108 @@
+"""Almacen de cooldowns/deduplicacion de alertas, local o compartido entre workers."""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Protocol
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class CooldownStore(Protocol):
+    def try_acquire(self, key: str, cooldown_seconds: float, now: float | None = None) -> bool:
+        """Check-and-set atomico: ``True`` si el cooldown vencio y se registro ``now``."""
+
+    def clear(self) -> None: ...
+
+    def snapshot(self) -> dict[str, Any]: ...
+
+
+class InMemoryCooldownStore:
+    """Cooldowns del proceso actual (un solo worker)."""
+
+    backend = "memory"
+
+    def __init__(self, entries: dict[str, float] | None = None) -> None:
+        self._entries = entries if entries is not None else {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key: str, cooldown_seconds: float, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            if now - self._entries.get(key, 0) < cooldown_seconds:
+                return False
+            self._entries[key] = now
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {"backend": self.backend, "keys": len(self._entries)}
+
+
+class SqliteCooldownStore:
+    """Cooldowns en SQLite: compartidos por todos los workers del host y persistentes entre reinicios."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS alert_cooldowns (key TEXT PRIMARY KEY, last_at REAL NOT NULL)"
+        )
+
+    def try_acquire(self, key: str, cooldown_seconds: float, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            # Un solo UPSERT condicional: SQLite lo serializa entre procesos, sin ventana de carrera.
+            cursor = self._conn.execute(
+                """
+                INSERT INTO alert_cooldowns (key, last_at) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET last_at = excluded.last_at
+                WHERE excluded.last_at - alert_cooldowns.last_at >= ?
+                """,
+                (key, now, cooldown_seconds),
+            )
+            return cursor.rowcount == 1
+
+    def purge_older_than(self, cutoff: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM alert_cooldowns WHERE last_at < ?", (cutoff,)).rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM alert_cooldowns")
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            (keys,) = self._conn.execute("SELECT COUNT(*) FROM alert_cooldowns").fetchone()
+        return {"backend": self.backend, "keys": keys, "path": self.path}
+
+
+def default_cooldown_db_path() -> str:
+    configured = os.getenv("ALERT_COOLDOWN_DB_PATH", "").strip()
+    if configured:
+        return configured
+    if os.getenv("VERCEL") == "1":
+        return os.path.join(tempfile.gettempdir(), "safyra_alert_cooldowns.sqlite3")
+    return os.path.join(BASE_DIR, "var", "alert_cooldowns.sqlite3")
+
+
+def build_cooldown_store(entries: dict[str, float] | None = None) -> CooldownStore:
+    backend = os.getenv("ALERT_COOLDOWN_STORE", "sqlite").strip().lower()
+    if backend == "memory":
+        return InMemoryCooldownStore(entries)
+    try:
+        return SqliteCooldownStore(default_cooldown_db_path())
+    except (OSError, sqlite3.Error) as exc:
+        print(f"[COOLDOWN] No se pudo abrir el store SQLite, se usa memoria del proceso: {exc}")
+        return InMemoryCooldownStore(entries)
@@ -0,0 +1,233 @@
+"""Renderizadores de documentos (PDF de reportes y Excel de historial).
+
+Son funciones puras sobre datos serializables, sin Firebase ni Supabase, para
+poder ejecutarlas en los procesos de ``render_pool``.
+"""
+import io
+from datetime import datetime
+from functools import lru_cache
+
+INCIDENT_TRANSLATIONS = {
+    "overload": "Sobrecarga",
+    "out_of_schedule_consumption": "Consumo fuera de horario"
+}
+
+
+def preload() -> None:
+    """Importa fpdf y openpyxl de antemano (p. ej. al calentar los procesos del pool)."""
+    _premium_pdf_class()
+    import openpyxl  # noqa: F401
+
+
+@lru_cache(maxsize=1)
+def _premium_pdf_class() -> type:
+    # fpdf se importa en el primer PDF, no al arrancar la API.
+    from fpdf import FPDF
+
+    class PremiumPDF(FPDF):
+        def header(self):
+            # Fondo oscuro para el header (color ink #0d2440)
+            self.set_fill_color(13, 36, 64)
+            self.rect(0, 0, 210, 35, 'F')
+
+            # Titulo principal
+            self.set_font("Arial", 'B', 24)
+            self.set_text_color(255, 255, 255)
+            self.set_y(8)
+            self.set_x(15)
+            self.cell(0, 10, "SafyraShield IoT", ln=1, align='L')
+
+            # Subtitulo
+            self.set_font("Arial", '', 12)
+            self.set_text_color(0, 245, 255) # accent cyan
+            self.set_x(15)
+            self.cell(0, 8, "Reporte Ejecutivo de Mantenimiento", ln=1, align='L')
+            self.ln(15)
+
+        def footer(self):
+            self.set_y(-15)
+            self.set_font("Arial", 'I', 9)
+            self.set_text_color(150, 150, 150)
+            self.cell(0, 10, f"Generado automaticamente - Pagina {self.page_no()}", 0, 0, 'C')
+
+    return PremiumPDF
+
+def generate_pdf_from_summary(summary_data: dict) -> bytes:
+    """Genera un PDF en memoria a partir de los datos JSON con diseño premium"""
+    pdf = _premium_pdf_class()()
+    pdf.add_page()
+    
+    start_date = summary_data['period_start'][:10]
+    end_date = summary_data['period_end'][:10]
+    
+    # Calcular si es mensual o semanal basado en la diferencia de dias
+    try:
+        d1 = datetime.strptime(start_date, "%Y-%m-%d")
+        d2 = datetime.strptime(end_date, "%Y-%m-%d")
+        days_diff = (d2 - d1).days
+        tipo_reporte = "Mensual" if days_diff > 20 else "Semanal"
+    except:
+        tipo_reporte = "Ejecutivo"
+
+    # Tarjeta de Periodo
+    pdf.set_fill_color(240, 244, 248) # Fondo gris muy claro
+    pdf.set_draw_color(200, 210, 220)
+    pdf.set_xy(15, 45)
+    pdf.cell(180, 12, "", border=1, fill=True, align='C')
+    pdf.set_xy(15, 46)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_text_color(23, 93, 182) # Color primary blue
+    pdf.cell(180, 10, txt=f"Resumen {tipo_reporte} ({start_date} al {end_date})", align='C')
+    
+    pdf.ln(20)
+    
+    # Metricas en recuadros
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_text_color(50, 60, 70)
+    pdf.set_x(15)
+    pdf.cell(0, 8, txt="Metricas Generales:", ln=1)
+    
+    # Dibujar metricas
+    pdf.set_fill_color(255, 255, 255)
+    pdf.set_font("Arial", '', 11)
+    
+    metrics = [
+        ("Total de Alertas", str(summary_data['total_alerts'])),
+        ("Total de Tickets", str(summary_data['total_tickets'])),
+        ("Pico Max. Corriente", f"{summary_data['peak_current']} A"),
+    ]
+    
+    x_start = 15
+    y_start = pdf.get_y() + 2
+    for title, val in metrics:
+        pdf.set_xy(x_start, y_start)
+        pdf.set_fill_color(248, 250, 252)
+        pdf.rect(x_start, y_start, 55, 20, 'DF')
+        
+        pdf.set_xy(x_start, y_start + 3)
+        pdf.set_font("Arial", '', 9)
+        pdf.set_text_color(100, 110, 120)
+        pdf.cell(55, 5, txt=title, align='C')
+        
+        pdf.set_xy(x_start, y_start + 9)
+        pdf.set_font("Arial", 'B', 14)
+        pdf.set_text_color(15, 111, 209)
+        pdf.cell(55, 8, txt=val, align='C')
+        x_start += 60
+        
+    pdf.set_y(y_start + 25)
+    
+    branches = ", ".join(summary_data['affected_branches']) if summary_data['affected_branches'] else "Ninguno"
+    pdf.set_font("Arial", 'B', 11)
+    pdf.set_text_color(50, 60, 70)
+    pdf.set_x(15)
+    pdf.cell(0, 8, txt="Ramales Afectados:", ln=0)
+    pdf.set_font("Arial", '', 11)
+    pdf.set_text_color(100, 110, 120)
+    pdf.set_x(55)
+    pdf.cell(0, 8, txt=branches, ln=1)
+    
+    pdf.ln(10)
+    
+    # Tabla de Tickets
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_text_color(23, 93, 182)
+    pdf.set_x(15)
+    pdf.cell(0, 10, txt="Detalle de Tickets Creados", ln=1)
+    pdf.ln(2)
+    
+    # Cabecera tabla
+    pdf.set_fill_color(13, 36, 64)
+    pdf.set_text_color(255, 255, 255)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_x(15)
+    pdf.cell(40, 10, "Ticket", 1, 0, 'C', 1)
+    pdf.cell(60, 10, "Incidente", 1, 0, 'C', 1)
+    pdf.cell(40, 10, "Prioridad", 1, 0, 'C', 1)
+    pdf.cell(40, 10, "Estado", 1, 1, 'C', 1)
+    
+    # Filas
+    pdf.set_font("Arial", '', 9)
+    pdf.set_text_color(50, 50, 50)
+    pdf.set_fill_color(248, 250, 252)
+    fill = False
+    
+    if not summary_data.get('tickets_list'):
+        pdf.set_x(15)
+        pdf.cell(180, 10, "No se registraron tickets en este periodo.", 1, 1, 'C')
+    else:
+        for t in summary_data['tickets_list']:
+            pdf.set_x(15)
+            issue_type = t.get('issue_type', '')
+            issue_type_es = INCIDENT_TRANSLATIONS.get(issue_type, issue_type.capitalize().replace('_', ' '))
+            pdf.cell(40, 10, t['ticket_code'], 1, 0, 'C', fill)
+            pdf.cell(60, 10, issue_type_es, 1, 0, 'C', fill)
+            pdf.cell(40, 10, t['priority'], 1, 0, 'C', fill)
+            pdf.cell(40, 10, t['status'], 1, 1, 'C', fill)
+            fill = not fill
+        
+    out = pdf.output(dest='S')
+    if isinstance(out, str):
+        return out.encode('latin1')
+    return bytes(out)
+
+
+HISTORY_HEADERS = ["Sensor ID", "Fecha/Hora (ISO)", "Corriente (A)", "Potencia (W)", "Dispositivo Detectado", "Estado"]
+
+def render_history_workbook(rows: list) -> bytes:
+    """Excel con estilos a partir de filas ``[sensor, timestamp, irms, potencia, dispositivo, estado]``."""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Historial SafyraShield"
+    
+    header_font = Font(bold=True, color="FFFFFF", name="Inter")
+    header_fill = PatternFill(start_color="0A0E27", end_color="0A0E27", fill_type="solid")
+    cell_font = Font(name="Inter")
+    center_align = Alignment(horizontal="center", vertical="center")
+    left_align = Alignment(horizontal="left", vertical="center")
+    thin_border = Border(left=Side(style='thin'), 
+                         right=Side(style='thin'), 
+                         top=Side(style='thin'), 
+                         bottom=Side(style='thin'))
+
+    headers = HISTORY_HEADERS
+    ws.append(headers)
+    
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col_num)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = thin_border
+        cell.alignment = center_align
+        ws.row_dimensions[1].height = 25
+
+    row_idx = 2
+    for row_data in rows:
+        ws.append(list(row_data))
+        
+        for col_num in range(1, len(headers) + 1):
+            cell = ws.cell(row=row_idx, column=col_num)
+            cell.border = thin_border
+            cell.font = cell_font
+            if col_num in [1, 5, 6]: cell.alignment = center_align
+            else: cell.alignment = left_align
+            if col_num == 3: cell.number_format = '0.000 "A"'
+            if col_num == 4: cell.number_format = '0.00 "W"'
+        
+        ws.row_dimensions[row_idx].height = 20
+        row_idx += 1
+    
+    ws.column_dimensions[get_column_letter(1)].width = 15
+    ws.column_dimensions[get_column_letter(2)].width = 28
+    ws.column_dimensions[get_column_letter(3)].width = 15
+    ws.column_dimensions[get_column_letter(4)].width = 15
+    ws.column_dimensions[get_column_letter(5)].width = 25
+    ws.column_dimensions[get_column_letter(6)].width = 12
+    
+    with io.BytesIO() as buffer:
+        wb.save(buffer)
+        return buffer.getvalue()
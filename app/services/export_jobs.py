@@ -0,0 +1,331 @@
+"""Exportaciones de historial en segundo plano, con progreso y descarga posterior."""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from app.db.firebase import LOCAL_TIMEZONE, SENSOR_IDS, collect_history_rows
+from app.services.document_renderers import render_history_workbook
+from app.services.render_pool import document_render_pool
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+CSV_HEADER = "Sensor ID,Fecha/Hora,Corriente (A),Potencia (W),Dispositivo,Estado\n"
+PENDING_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("done", "failed")
+JOB_COLUMNS = (
+    "id, fingerprint, params, status, sensors_total, sensors_done, rows, path, error, created_at, updated_at, finished_at"
+)
+
+
+def _read_float_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def default_export_spool_dir() -> str:
+    configured = os.getenv("EXPORT_SPOOL_DIR", "").strip()
+    return configured or os.path.join(tempfile.gettempdir(), "safyra_exports")
+
+
+def export_fingerprint(params: dict[str, Any]) -> str:
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ExportJob:
+    id: str
+    fingerprint: str
+    params: dict[str, Any]
+    status: str = "queued"
+    sensors_total: int = 0
+    sensors_done: int = 0
+    rows: int = 0
+    path: str | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    finished_at: float | None = None
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "ExportJob":
+        (job_id, fingerprint, params, status, sensors_total, sensors_done, rows, path, error,
+         created_at, updated_at, finished_at) = row
+        return cls(
+            id=job_id,
+            fingerprint=fingerprint,
+            params=json.loads(params),
+            status=status,
+            sensors_total=sensors_total,
+            sensors_done=sensors_done,
+            rows=rows,
+            path=path,
+            error=error,
+            created_at=created_at,
+            updated_at=updated_at,
+            finished_at=finished_at,
+        )
+
+    @property
+    def filename(self) -> str:
+        _, extension = EXPORT_FORMATS[self.params["format"]]
+        return f"safyrashield_export_{self.params.get('sensor_id') or 'all'}.{extension}"
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.params["format"]][0]
+
+    def to_dict(self) -> dict[str, Any]:
+        progress = self.sensors_done / self.sensors_total if self.sensors_total else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": round(1.0 if self.status == "done" else progress, 3),
+            "sensors_done": self.sensors_done,
+            "sensors_total": self.sensors_total,
+            "rows": self.rows,
+            "error": self.error,
+            **{key: value for key, value in self.params.items() if value is not None},
+        }
+
+
+class ExportJobManager:
+    """Un pool pequeno de hilos produce los archivos en un spool temporal.
+
+    El estado de cada trabajo vive en SQLite junto al spool, asi cualquier worker
+    del host responde su progreso y su descarga. Los trabajos con los mismos
+    parametros se reutilizan mientras su archivo siga vigente (``ttl_seconds``);
+    si el rango no tiene fin (o llega hasta hoy) solo durante
+    ``open_range_reuse_seconds``, porque siguen llegando lecturas.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str,
+        *,
+        workers: int = 1,
+        ttl_seconds: float = 3600,
+        open_range_reuse_seconds: float = 60,
+        stale_seconds: float = 600,
+        db_path: str | None = None,
+        clock=time.time,
+    ) -> None:
+        self.spool_dir = spool_dir
+        self.ttl_seconds = ttl_seconds
+        self.open_range_reuse_seconds = open_range_reuse_seconds
+        self.stale_seconds = stale_seconds
+        self.db_path = db_path or os.path.join(spool_dir, "export_jobs.sqlite3")
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="safyra-export")
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.jobs_deduplicated = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Se abre al primer uso: importar el modulo no debe tocar el disco.
+        if self._conn is None:
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            if self.db_path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS export_jobs (
+                    id TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    sensors_total INTEGER NOT NULL DEFAULT 0,
+                    sensors_done INTEGER NOT NULL DEFAULT 0,
+                    rows INTEGER NOT NULL DEFAULT 0,
+                    path TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_export_jobs_fingerprint ON export_jobs (fingerprint, created_at)")
+            self._conn = conn
+        return self._conn
+
+    def submit(self, export_format: str, sensor_id: str | None, start_date: str | None, end_date: str | None) -> tuple[ExportJob, bool]:
+        params = {"format": export_format, "sensor_id": sensor_id, "start_date": start_date, "end_date": end_date}
+        fingerprint = export_fingerprint(params)
+        now = self._clock()
+        with self._lock:
+            conn = self._connection()
+            # BEGIN IMMEDIATE: dos workers con la misma peticion no encolan dos trabajos.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge_expired(conn, now)
+                row = conn.execute(
+                    f"SELECT {JOB_COLUMNS} FROM export_jobs WHERE fingerprint = ? AND status != 'failed' "
+                    "ORDER BY created_at DESC LIMIT 1",
+                    (fingerprint,),
+                ).fetchone()
+                existing = ExportJob.from_row(row) if row else None
+                if existing is not None and self._reusable(existing, now):
+                    conn.execute("COMMIT")
+                    self.jobs_deduplicated += 1
+                    return existing, True
+                job = ExportJob(
+                    id=uuid.uuid4().hex, fingerprint=fingerprint, params=params, created_at=now, updated_at=now
+                )
+                conn.execute(
+                    f"INSERT INTO export_jobs ({JOB_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.fingerprint, json.dumps(params), job.status, 0, 0, 0, None, None, now, now, None),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def _reusable(self, job: ExportJob, now: float) -> bool:
+        if job.status in PENDING_STATUSES and now - job.updated_at > self.stale_seconds:
+            # El worker que lo producia murio sin terminarlo.
+            return False
+        if self._is_open_range(job.params.get("end_date"), now):
+            return now - job.created_at <= self.open_range_reuse_seconds
+        return True
+
+    @staticmethod
+    def _is_open_range(end_date: str | None, now: float) -> bool:
+        if not end_date:
+            return True
+        today = datetime.fromtimestamp(now, LOCAL_TIMEZONE).date().isoformat()
+        return end_date[:10] >= today
+
+    def get(self, job_id: str) -> ExportJob | None:
+        with self._lock:
+            conn = self._connection()
+            self._purge_expired(conn, self._clock())
+            row = conn.execute(f"SELECT {JOB_COLUMNS} FROM export_jobs WHERE id = ?", (job_id,)).fetchone()
+        return ExportJob.from_row(row) if row else None
+
+    def wait(self, job_id: str, timeout: float, poll_seconds: float = 0.05) -> ExportJob | None:
+        """Espera a que el trabajo termine (en este u otro worker); devuelve su ultimo estado."""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job.status in PENDING_STATUSES and time.monotonic() < deadline:
+            time.sleep(poll_seconds)
+            job = self.get(job_id)
+        return job
+
+    def _save(self, job: ExportJob) -> None:
+        job.updated_at = self._clock()
+        with self._lock:
+            self._connection().execute(
+                """
+                UPDATE export_jobs SET status = ?, sensors_total = ?, sensors_done = ?, rows = ?, path = ?,
+                    error = ?, updated_at = ?, finished_at = ?
+                WHERE id = ?
+                """,
+                (job.status, job.sensors_total, job.sensors_done, job.rows, job.path,
+                 job.error, job.updated_at, job.finished_at, job.id),
+            )
+
+    def _run(self, job: ExportJob) -> None:
+        params = job.params
+        sensors = [params["sensor_id"]] if params["sensor_id"] else list(SENSOR_IDS)
+        job.sensors_total = len(sensors)
+        job.status = "running"
+        self._save(job)
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            _, extension = EXPORT_FORMATS[params["format"]]
+            path = os.path.join(self.spool_dir, f"{job.id}.{extension}")
+            if params["format"] == "csv":
+                self._write_csv(job, sensors, path)
+            else:
+                self._write_excel(job, sensors, path)
+            job.path = path
+            job.status = "done"
+        except Exception as exc:
+            print(f"[EXPORT] Error en exportacion {job.id}: {exc}")
+            job.status = "failed"
+            job.error = str(exc)
+        finally:
+            job.finished_at = self._clock()
+            self._save(job)
+
+    def _sensor_rows(self, job: ExportJob, sensor_id: str) -> list[list]:
+        # Sin el tope de 1000 lecturas por sensor de la exportacion sincrona.
+        rows = collect_history_rows(sensor_id, job.params["start_date"], job.params["end_date"], limit=None)
+        job.rows += len(rows)
+        return rows
+
+    def _sensor_finished(self, job: ExportJob) -> None:
+        job.sensors_done += 1
+        # El progreso se publica por sensor; tambien sirve de latido del trabajo.
+        self._save(job)
+
+    def _write_csv(self, job: ExportJob, sensors: list[str], path: str) -> None:
+        with open(path, "w", encoding="utf-8", newline="") as handle:
+            handle.write(CSV_HEADER)
+            for sid in sensors:
+                for row in self._sensor_rows(job, sid):
+                    handle.write(f"{row[0]},{row[1]},{row[2]:.3f},{row[3]:.2f},{row[4]},{row[5]}\n")
+                self._sensor_finished(job)
+
+    def _write_excel(self, job: ExportJob, sensors: list[str], path: str) -> None:
+        rows: list[list] = []
+        for sid in sensors:
+            rows.extend(self._sensor_rows(job, sid))
+            self._sensor_finished(job)
+        content = document_render_pool.run_blocking(render_history_workbook, rows)
+        with open(path, "wb") as handle:
+            handle.write(content)
+
+    @staticmethod
+    def _remove_files(paths: list[tuple]) -> None:
+        for (path,) in paths:
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _purge_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        # Trabajos pendientes sin latido durante todo el TTL tambien se descartan.
+        condition = "COALESCE(finished_at, updated_at) < ?"
+        self._remove_files(conn.execute(f"SELECT path FROM export_jobs WHERE {condition}", (cutoff,)).fetchall())
+        conn.execute(f"DELETE FROM export_jobs WHERE {condition}", (cutoff,))
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connection()
+            self._remove_files(conn.execute("SELECT path FROM export_jobs").fetchall())
+            conn.execute("DELETE FROM export_jobs")
+            self.jobs_deduplicated = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM export_jobs GROUP BY status").fetchall()
+            return {"jobs": dict(rows), "deduplicated": self.jobs_deduplicated, "path": self.db_path}
+
+
+export_job_manager = ExportJobManager(
+    default_export_spool_dir(),
+    workers=int(_read_float_env("EXPORT_JOB_WORKERS", 1)),
+    ttl_seconds=_read_float_env("EXPORT_JOB_TTL_SECONDS", 3600),
+    open_range_reuse_seconds=_read_float_env("EXPORT_OPEN_RANGE_REUSE_SECONDS", 60),
+)
@@ -0,0 +1,244 @@
+"""Cache de identidad: usuarios por username/uid/email y sus consentimientos.
+
+Los dicts de datos son los de ``auth_api`` (``fake_users_db``/``fake_consent_db``);
+aqui se lleva su frescura, los indices secundarios y los listeners de Firebase.
+Mientras el cache esta fresco, las verificaciones de rol no hacen I/O.
+"""
+import threading
+import time
+from collections.abc import Callable, Mapping, MutableMapping
+from typing import Any, Optional
+
+UserRecord = dict[str, Any]
+
+
+def consent_records_from(data: Any) -> list[dict[str, Any]]:
+    """Nodo ``/app_consents/{username}`` (push ids) -> registros ordenados por fecha."""
+    if not isinstance(data, dict):
+        return []
+    records = [record for record in data.values() if isinstance(record, dict)]
+    records.sort(key=lambda record: str(record.get("accepted_at", "")))
+    return records
+
+
+def _record_matches_identity(user_record: Mapping[str, Any], uid: str, email: Optional[str]) -> bool:
+    record_uid = str(user_record.get("uid", "")).strip()
+    record_email = str(user_record.get("email", "")).strip().lower()
+    if record_uid and record_uid == uid:
+        return True
+    return bool(email and record_email and record_email == email)
+
+
+class IdentityCache:
+    """Frescura por TTL; con listeners activos el cache se da por vigente y cada
+    cambio remoto marca como vencido solo lo que toco."""
+
+    def __init__(
+        self,
+        users: MutableMapping[str, UserRecord],
+        consents: MutableMapping[str, list[dict[str, Any]]],
+        *,
+        ttl_seconds: float,
+        normalize_user: Callable[[Mapping[str, Any]], UserRecord] = dict,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.users = users
+        self.consents = consents
+        self.ttl_seconds = ttl_seconds
+        self._normalize_user = normalize_user
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._users_loaded_at: float | None = None
+        self._all_consents_loaded_at: float | None = None
+        self._consents_loaded_at: dict[str, float] = {}
+        self._stale_consents: set[str] = set()
+        self._uid_index: dict[str, str] = {}
+        self._email_index: dict[str, str] = {}
+        self._index_dirty = True
+        self._listeners: list[Any] = []
+        self.store_reads = 0
+        self.listener_events = 0
+
+    def _is_fresh(self, loaded_at: float | None) -> bool:
+        if loaded_at is None:
+            return False
+        if self._listeners:
+            return True
+        return self._clock() - loaded_at < self.ttl_seconds
+
+    def users_fresh(self) -> bool:
+        with self._lock:
+            return self._is_fresh(self._users_loaded_at)
+
+    def consents_fresh(self, username: str) -> bool:
+        with self._lock:
+            if username in self._stale_consents:
+                return False
+            return self._is_fresh(self._all_consents_loaded_at) or self._is_fresh(
+                self._consents_loaded_at.get(username)
+            )
+
+    def replace_users(self, records: Mapping[str, Any]) -> None:
+        with self._lock:
+            self.store_reads += 1
+            for username, user_record in records.items():
+                if isinstance(user_record, dict):
+                    self.users[str(username)] = self._normalize_user(user_record)
+            self._users_loaded_at = self._clock()
+            self._index_dirty = True
+
+    def replace_all_consents(self, data: Mapping[str, Any]) -> None:
+        with self._lock:
+            self.store_reads += 1
+            for username in set(self.consents) | set(data):
+                self.consents[username] = consent_records_from(data.get(username))
+            self._all_consents_loaded_at = self._clock()
+            self._consents_loaded_at.clear()
+            self._stale_consents.clear()
+
+    def replace_consents(self, username: str, records: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self.store_reads += 1
+            self.consents[username] = records
+            self._consents_loaded_at[username] = self._clock()
+            self._stale_consents.discard(username)
+
+    def mark_user_changed(self, username: str) -> None:
+        """Escritura local (alta/edicion): el registro ya esta en ``users``; solo se reindexa."""
+        with self._lock:
+            self._index_dirty = True
+
+    def find_by_identity(self, uid: str, email: Optional[str]) -> Optional[UserRecord]:
+        normalized_email = email.strip().lower() if email else None
+        with self._lock:
+            # Un acierto se verifica contra el registro actual; si no coincide
+            # (usuario editado o agregado a mano) se reconstruye el indice una vez.
+            for attempt in range(2):
+                if self._index_dirty:
+                    self._rebuild_index()
+                for index, key in ((self._uid_index, uid), (self._email_index, normalized_email)):
+                    username = index.get(key) if key else None
+                    user_record = self.users.get(username) if username else None
+                    if user_record is not None and _record_matches_identity(user_record, uid, normalized_email):
+                        return user_record
+                if attempt == 0:
+                    self._index_dirty = True
+        return None
+
+    def _rebuild_index(self) -> None:
+        self._uid_index = {}
+        self._email_index = {}
+        for username, user_record in list(self.users.items()):
+            record_uid = str(user_record.get("uid", "")).strip()
+            record_email = str(user_record.get("email", "")).strip().lower()
+            if record_uid:
+                self._uid_index.setdefault(record_uid, username)
+            if record_email:
+                self._email_index.setdefault(record_email, username)
+        self._index_dirty = False
+
+    def start_listeners(self, reference: Callable[[str], Any], users_path: str, consents_path: str) -> bool:
+        """Escucha ``/app_users`` y ``/app_consents``; el primer evento trae el arbol completo."""
+        if self._listeners:
+            return True
+        try:
+            self._listeners = [
+                reference(users_path).listen(self._on_users_event),
+                reference(consents_path).listen(self._on_consents_event),
+            ]
+        except Exception as exc:
+            print(f"[IDENTIDAD] No se pudieron iniciar los listeners, se usa TTL: {exc}")
+            self.stop_listeners()
+            return False
+        return True
+
+    def stop_listeners(self) -> None:
+        with self._lock:
+            listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            try:
+                listener.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _event_child(event: Any) -> str:
+        return str(getattr(event, "path", "/") or "/").strip("/").split("/", 1)[0]
+
+    @staticmethod
+    def _event_segments(event: Any) -> list[str]:
+        return [segment for segment in str(getattr(event, "path", "/") or "/").split("/") if segment]
+
+    def _put_user(self, username: str, data: Any) -> None:
+        if isinstance(data, dict):
+            self.users[username] = self._normalize_user(data)
+        else:
+            self.users.pop(username, None)
+        self._index_dirty = True
+
+    def _on_users_event(self, event: Any) -> None:
+        """Aplica el cambio al registro afectado; solo lo que no se puede aplicar fuerza una relectura."""
+        with self._lock:
+            self.listener_events += 1
+            segments = self._event_segments(event)
+            data = event.data
+            if not segments and event.event_type == "put":
+                self.replace_users(data if isinstance(data, dict) else {})
+            elif not segments and event.event_type == "patch" and isinstance(data, dict):
+                for username, user_data in data.items():
+                    self._put_user(str(username), user_data)
+            elif len(segments) == 1 and event.event_type == "put":
+                self._put_user(segments[0], data)
+            elif segments and segments[0] in self.users and event.event_type in {"put", "patch"}:
+                # Cambio dentro de un usuario (p. ej. /ana o /ana/role): se fusiona sobre el registro.
+                record = dict(self.users[segments[0]])
+                node = record
+                for segment in segments[1:-1] if event.event_type == "put" else segments[1:]:
+                    child = node.get(segment)
+                    node[segment] = child = dict(child) if isinstance(child, dict) else {}
+                    node = child
+                if event.event_type == "put":
+                    if data is None:
+                        node.pop(segments[-1], None)
+                    else:
+                        node[segments[-1]] = data
+                else:
+                    for key, value in (data if isinstance(data, dict) else {}).items():
+                        if value is None:
+                            node.pop(key, None)
+                        else:
+                            node[key] = value
+                self._put_user(segments[0], record)
+            else:
+                self._users_loaded_at = None
+
+    def _on_consents_event(self, event: Any) -> None:
+        with self._lock:
+            self.listener_events += 1
+            child = self._event_child(event)
+            if not child and event.event_type == "put":
+                self.replace_all_consents(event.data if isinstance(event.data, dict) else {})
+            elif child:
+                self._stale_consents.add(child)
+            else:
+                self._all_consents_loaded_at = None
+                self._consents_loaded_at.clear()
+
+    def reset(self) -> None:
+        """Olvida la frescura (no los datos): la proxima consulta vuelve a leer el store."""
+        with self._lock:
+            self._users_loaded_at = None
+            self._all_consents_loaded_at = None
+            self._consents_loaded_at.clear()
+            self._stale_consents.clear()
+            self._index_dirty = True
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self.users),
+                "users_fresh": self._is_fresh(self._users_loaded_at),
+                "listeners": bool(self._listeners),
+                "store_reads": self.store_reads,
+                "listener_events": self.listener_events,
+            }
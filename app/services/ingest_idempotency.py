@@ -0,0 +1,138 @@
+"""Deduplicacion de lecturas IoT reenviadas por el dispositivo."""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+DEFAULT_MAX_KEYS_PER_SENSOR = 256
+DEFAULT_TTL_SECONDS = 120.0
+
+
+def _read_int_env(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _read_float_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def idempotency_key_for(device_seq: int | None, idempotency_key: str | None) -> str | None:
+    """Normaliza el identificador de reintento enviado por el dispositivo."""
+    if idempotency_key and idempotency_key.strip():
+        return f"key:{idempotency_key.strip()}"
+    if device_seq is not None:
+        return f"seq:{device_seq}"
+    return None
+
+
+class IngestIdempotencyCache:
+    """LRU acotada por sensor con los resultados de lecturas ya procesadas.
+
+    Un reintento que llega mientras la lectura original sigue en proceso
+    espera ese mismo resultado en lugar de volver a escribir en Firebase.
+    """
+
+    def __init__(self, max_keys_per_sensor: int = DEFAULT_MAX_KEYS_PER_SENSOR, ttl_seconds: float = DEFAULT_TTL_SECONDS) -> None:
+        self.max_keys_per_sensor = max_keys_per_sensor
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, OrderedDict[str, tuple[float, dict[str, Any]]]] = {}
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def get(self, sensor_id: str, key: str) -> dict[str, Any] | None:
+        with self._lock:
+            sensor_entries = self._entries.get(sensor_id)
+            if not sensor_entries or key not in sensor_entries:
+                return None
+            stored_at, result = sensor_entries[key]
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del sensor_entries[key]
+                return None
+            sensor_entries.move_to_end(key)
+            return result
+
+    def put(self, sensor_id: str, key: str, result: dict[str, Any]) -> None:
+        with self._lock:
+            sensor_entries = self._entries.setdefault(sensor_id, OrderedDict())
+            sensor_entries[key] = (time.monotonic(), result)
+            sensor_entries.move_to_end(key)
+            while len(sensor_entries) > self.max_keys_per_sensor:
+                sensor_entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._inflight.clear()
+            self.replays = 0
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "sensors": len(self._entries),
+                "keys": sum(len(entries) for entries in self._entries.values()),
+                "inflight": len(self._inflight),
+                "replays": self.replays,
+            }
+
+    async def replay(self, sensor_id: str, key: str) -> dict[str, Any] | None:
+        """Resultado ya guardado (o en proceso) para la clave; ``None`` si es una lectura nueva."""
+        stored = self.get(sensor_id, key)
+        if stored is None:
+            pending = self._inflight.get((sensor_id, key))
+            if pending is None:
+                return None
+            stored = await asyncio.shield(pending)
+        self._count_replay()
+        return stored
+
+    async def resolve(
+        self,
+        sensor_id: str,
+        key: str,
+        producer: Callable[[], Awaitable[dict[str, Any]]],
+    ) -> tuple[dict[str, Any], bool]:
+        """Devuelve ``(resultado, reenviado)`` ejecutando ``producer`` una sola vez por clave."""
+        replayed = await self.replay(sensor_id, key)
+        if replayed is not None:
+            return replayed, True
+
+        inflight_key = (sensor_id, key)
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            result = await producer()
+        except BaseException as exc:
+            # No se memoriza el fallo: el siguiente reintento vuelve a intentarlo.
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            elif not future.done():
+                future.set_exception(exc)
+                future.exception()
+            raise
+        else:
+            self.put(sensor_id, key, result)
+            if not future.done():
+                future.set_result(result)
+            return result, False
+        finally:
+            self._inflight.pop(inflight_key, None)
+
+    def _count_replay(self) -> None:
+        with self._lock:
+            self.replays += 1
+
+
+ingest_idempotency_cache = IngestIdempotencyCache(
+    max_keys_per_sensor=_read_int_env("IOT_IDEMPOTENCY_MAX_KEYS_PER_SENSOR", DEFAULT_MAX_KEYS_PER_SENSOR),
+    ttl_seconds=_read_float_env("IOT_IDEMPOTENCY_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+)
@@ -0,0 +1,309 @@
+"""Listener TCP/UDP opcional para gateways on-prem con protocolo de lineas.
+
+Formato::
+
+    AUTH <token IoT>
+    sensor_id,irms,potencia,voltage,seq
+
+``potencia``, ``voltage`` y ``seq`` pueden ir vacios. En TCP la autenticacion
+se envia una vez por conexion; en UDP cada datagrama empieza con ``AUTH``.
+Cada lectura recibe una linea ``OK <sensor_id> <seq> <estado>`` o
+``ERR <codigo> <sensor_id> <seq> <detalle>``. En UDP los datagramas sin token
+valido se descartan sin respuesta (la direccion de origen puede ser falsa).
+Las conexiones TCP estan acotadas en cantidad y se cierran tras un tiempo sin
+recibir lineas, autenticadas o no.
+"""
+import asyncio
+import os
+import socket
+from typing import Any
+
+from fastapi import BackgroundTasks, HTTPException
+from pydantic import ValidationError
+
+DEFAULT_LINE_PORT = 9100
+MAX_LINE_BYTES = 256
+MAX_LINES_PER_DATAGRAM = 64
+DEFAULT_UDP_MAX_INFLIGHT = 32
+DEFAULT_TCP_MAX_CONNECTIONS = 64
+DEFAULT_TCP_IDLE_TIMEOUT_SECONDS = 60.0
+
+_tcp_server: asyncio.AbstractServer | None = None
+_tcp_slots: asyncio.Semaphore | None = None
+_udp_transport: asyncio.DatagramTransport | None = None
+_pending_tasks: set[asyncio.Task] = set()
+_line_stats = {
+    "inflight": 0,
+    "dropped_unauthenticated": 0,
+    "dropped_busy": 0,
+    "dropped_lines": 0,
+    "tcp_connections": 0,
+    "tcp_rejected_busy": 0,
+    "tcp_idle_closed": 0,
+}
+
+
+def _line_listener_enabled() -> bool:
+    return os.getenv("IOT_LINE_LISTENER_ENABLED", "false").lower() in {"1", "true", "yes"}
+
+
+def _read_port_env(name: str, default: int) -> int:
+    # 0 usa un puerto efimero; un valor negativo desactiva ese transporte.
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _reuse_port() -> bool:
+    # Con varios workers de uvicorn todos escuchan el mismo puerto y el kernel reparte conexiones.
+    return hasattr(socket, "SO_REUSEPORT") and os.getenv("IOT_LINE_REUSE_PORT", "true").lower() in {"1", "true", "yes"}
+
+
+def _udp_max_inflight() -> int:
+    try:
+        return max(1, int(os.getenv("IOT_LINE_UDP_MAX_INFLIGHT", str(DEFAULT_UDP_MAX_INFLIGHT))))
+    except ValueError:
+        return DEFAULT_UDP_MAX_INFLIGHT
+
+
+def _tcp_max_connections() -> int:
+    try:
+        return max(1, int(os.getenv("IOT_LINE_TCP_MAX_CONNECTIONS", str(DEFAULT_TCP_MAX_CONNECTIONS))))
+    except ValueError:
+        return DEFAULT_TCP_MAX_CONNECTIONS
+
+
+def _tcp_idle_timeout_seconds() -> float:
+    try:
+        return max(0.1, float(os.getenv("IOT_LINE_TCP_IDLE_TIMEOUT_SECONDS", str(DEFAULT_TCP_IDLE_TIMEOUT_SECONDS))))
+    except ValueError:
+        return DEFAULT_TCP_IDLE_TIMEOUT_SECONDS
+
+
+def _optional_float(value: str) -> float | None:
+    value = value.strip()
+    return float(value) if value else None
+
+
+def parse_reading_line(line: str) -> dict[str, Any]:
+    fields = [field.strip() for field in line.split(",")]
+    if len(fields) < 2 or len(fields) > 5:
+        raise ValueError("Se esperaba sensor_id,irms,potencia,voltage,seq")
+    fields += [""] * (5 - len(fields))
+    sensor_id, irms, potencia, voltage, seq = fields
+    reading: dict[str, Any] = {
+        "sensor_id": sensor_id,
+        "irms": float(irms),
+        "potencia": _optional_float(potencia),
+    }
+    if voltage:
+        reading["voltage"] = float(voltage)
+    if seq:
+        reading["device_seq"] = int(seq)
+    return reading
+
+
+def _authenticate(auth_line: str) -> str | None:
+    from app.routers.data_api import _require_iot_token
+
+    command, _, token = auth_line.strip().partition(" ")
+    if command.upper() != "AUTH":
+        return None
+    try:
+        return _require_iot_token(token.strip())
+    except HTTPException:
+        return None
+
+
+def _release_udp_slot(_task: asyncio.Task) -> None:
+    _line_stats["inflight"] -= 1
+
+
+def _track(task: asyncio.Task) -> None:
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+async def handle_reading_line(line: str, iot_token: str) -> str:
+    """Procesa una linea con el mismo pipeline que ``POST /api/data/iot/readings``."""
+    from app.routers.data_api import IotReadingPayload, process_iot_reading
+
+    sensor_label, _, rest = line.partition(",")
+    seq_label = rest.rsplit(",", 1)[-1].strip() if rest.count(",") >= 3 else ""
+    reference = f"{sensor_label.strip() or '-'} {seq_label or '-'}"
+    try:
+        reading = IotReadingPayload(**parse_reading_line(line))
+    except (ValueError, ValidationError) as exc:
+        detail = exc.errors()[0]["msg"] if isinstance(exc, ValidationError) else str(exc)
+        return f"ERR 422 {reference} {detail}"
+
+    background_tasks = BackgroundTasks()
+    try:
+        result, replayed = await process_iot_reading(reading, iot_token, background_tasks)
+    except HTTPException as exc:
+        return f"ERR {exc.status_code} {reference} {exc.detail}"
+
+    if background_tasks.tasks:
+        # Tickets de Supabase fuera del camino de respuesta, igual que BackgroundTasks en HTTP.
+        _track(asyncio.create_task(background_tasks()))
+    estado = str(result.get("sensor", {}).get("estado") or "")
+    return f"OK {reference} {estado}{' REPLAY' if replayed else ''}".rstrip()
+
+
+async def _read_tcp_line(reader: asyncio.StreamReader) -> bytes:
+    return await asyncio.wait_for(reader.readline(), timeout=_tcp_idle_timeout_seconds())
+
+
+async def _handle_tcp_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    slots = _tcp_slots
+    if slots is None or slots.locked():
+        # Cupo lleno: se rechaza de inmediato en vez de dejar el socket esperando.
+        _line_stats["tcp_rejected_busy"] += 1
+        try:
+            writer.write(b"ERR 503 Demasiadas conexiones\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+        return
+    async with slots:
+        _line_stats["tcp_connections"] += 1
+        try:
+            await _serve_tcp_client(reader, writer)
+        finally:
+            _line_stats["tcp_connections"] -= 1
+
+
+async def _serve_tcp_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        auth_line = (await _read_tcp_line(reader)).decode("utf-8", errors="replace")
+        iot_token = _authenticate(auth_line)
+        if iot_token is None:
+            writer.write(b"ERR 401 Token IoT invalido\n")
+            await writer.drain()
+            return
+        writer.write(b"OK AUTH\n")
+        await writer.drain()
+
+        while True:
+            raw_line = await _read_tcp_line(reader)
+            if not raw_line:
+                break
+            line = raw_line.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            writer.write((await handle_reading_line(line, iot_token) + "\n").encode("utf-8"))
+            await writer.drain()
+    except asyncio.TimeoutError:
+        # Un cliente callado (antes o despues de AUTH) no retiene su tarea ni su cupo.
+        _line_stats["tcp_idle_closed"] += 1
+        writer.write(b"ERR 408 Conexion inactiva\n")
+    except (asyncio.LimitOverrunError, ValueError):
+        writer.write(b"ERR 413 Linea demasiado larga\n")
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class _LineDatagramProtocol(asyncio.DatagramProtocol):
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: tuple[str, int]) -> None:
+        lines = [line.strip() for line in data.decode("utf-8", errors="replace").splitlines() if line.strip()]
+        iot_token = _authenticate(lines[0]) if lines else None
+        if iot_token is None:
+            # Sin respuesta: contestar a un origen no autenticado convierte el listener en reflector.
+            _line_stats["dropped_unauthenticated"] += 1
+            return
+        if _line_stats["inflight"] >= _udp_max_inflight():
+            # Cola acotada: con el pipeline saturado se descarta y el gateway reintenta con el mismo seq.
+            _line_stats["dropped_busy"] += 1
+            return
+        extra_lines = len(lines) - 1 - MAX_LINES_PER_DATAGRAM
+        if extra_lines > 0:
+            _line_stats["dropped_lines"] += extra_lines
+            print(
+                f"[LINE-INGEST] Datagrama de {addr[0]} con {extra_lines} lectura(s) sobre el maximo de "
+                f"{MAX_LINES_PER_DATAGRAM}; se descartan"
+            )
+        _line_stats["inflight"] += 1
+        task = asyncio.create_task(self._process(lines[1:MAX_LINES_PER_DATAGRAM + 1], iot_token, addr))
+        task.add_done_callback(_release_udp_slot)
+        _track(task)
+
+    async def _process(self, lines: list[str], iot_token: str, addr: tuple[str, int]) -> None:
+        replies = []
+        for line in lines:
+            if len(line.encode("utf-8")) > MAX_LINE_BYTES:
+                replies.append("ERR 413 - - Linea demasiado larga")
+                continue
+            replies.append(await handle_reading_line(line, iot_token))
+        if replies:
+            self.transport.sendto(("\n".join(replies) + "\n").encode("utf-8"), addr)
+
+
+def line_ingest_snapshot() -> dict[str, int]:
+    return dict(_line_stats)
+
+
+async def start_line_ingest_listener(
+    host: str | None = None,
+    tcp_port: int | None = None,
+    udp_port: int | None = None,
+) -> dict[str, int]:
+    """Arranca los listeners configurados y devuelve los puertos efectivos."""
+    global _tcp_server, _tcp_slots, _udp_transport
+
+    host = host or os.getenv("IOT_LINE_LISTENER_HOST", "0.0.0.0")
+    tcp_port = _read_port_env("IOT_LINE_TCP_PORT", DEFAULT_LINE_PORT) if tcp_port is None else tcp_port
+    udp_port = _read_port_env("IOT_LINE_UDP_PORT", DEFAULT_LINE_PORT) if udp_port is None else udp_port
+    ports: dict[str, int] = {}
+    loop = asyncio.get_running_loop()
+
+    if tcp_port >= 0 and _tcp_server is None:
+        _tcp_slots = asyncio.Semaphore(_tcp_max_connections())
+        _tcp_server = await asyncio.start_server(
+            _handle_tcp_client,
+            host,
+            tcp_port,
+            limit=MAX_LINE_BYTES,
+            reuse_port=_reuse_port(),
+        )
+        ports["tcp"] = _tcp_server.sockets[0].getsockname()[1]
+    if udp_port >= 0 and _udp_transport is None:
+        _udp_transport, _ = await loop.create_datagram_endpoint(
+            _LineDatagramProtocol,
+            local_addr=(host, udp_port),
+            reuse_port=_reuse_port(),
+        )
+        ports["udp"] = _udp_transport.get_extra_info("sockname")[1]
+
+    print(f"[LINE-INGEST] Listener activo en {host}: {ports}")
+    return ports
+
+
+async def start_line_ingest_listener_if_enabled() -> None:
+    if not _line_listener_enabled():
+        return
+    try:
+        await start_line_ingest_listener()
+    except OSError as exc:
+        print(f"[LINE-INGEST] No se pudo abrir el listener (el app continuara): {exc}")
+
+
+async def stop_line_ingest_listener() -> None:
+    global _tcp_server, _tcp_slots, _udp_transport
+
+    if _tcp_server is not None:
+        _tcp_server.close()
+        await _tcp_server.wait_closed()
+        _tcp_server = None
+        _tcp_slots = None
+    if _udp_transport is not None:
+        _udp_transport.close()
+        _udp_transport = None
+    if _pending_tasks:
+        await asyncio.gather(*list(_pending_tasks), return_exceptions=True)
@@ -0,0 +1,296 @@
+"""Outbox persistente (SQLite) y circuit breaker para los webhooks de alertas."""
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+DEFAULT_LEASE_SECONDS = 60.0
+DEFAULT_BACKOFF_BASE_SECONDS = 2.0
+DEFAULT_BACKOFF_MAX_SECONDS = 900.0
+DEFAULT_BREAKER_FAILURE_THRESHOLD = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30.0
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def default_outbox_path() -> str:
+    configured = os.getenv("NOTIFICATION_OUTBOX_PATH", "").strip()
+    if configured:
+        return configured
+    if os.getenv("VERCEL") == "1":
+        # En Vercel solo /tmp es escribible.
+        return os.path.join(tempfile.gettempdir(), "safyra_notification_outbox.sqlite3")
+    return os.path.join(BASE_DIR, "var", "notification_outbox.sqlite3")
+
+
+def backoff_seconds(
+    attempts: int,
+    base: float = DEFAULT_BACKOFF_BASE_SECONDS,
+    maximum: float = DEFAULT_BACKOFF_MAX_SECONDS,
+) -> float:
+    """Backoff exponencial con jitter completo, acotado por ``maximum``."""
+    ceiling = min(maximum, base * (2 ** min(attempts, 20)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+@dataclass(frozen=True)
+class OutboxMessage:
+    id: int
+    payload: dict[str, Any]
+    attempts: int
+    created_at: float
+
+
+class NotificationOutbox:
+    """Cola durable: cada alerta se guarda antes de enviarse y se borra al confirmar."""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lease_seconds = lease_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0,
+                last_error TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox (next_attempt_at, leased_until)"
+        )
+
+    def enqueue(self, payload: dict[str, Any]) -> int:
+        now = self._clock()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO notification_outbox (payload, created_at, next_attempt_at) VALUES (?, ?, ?)",
+                (json.dumps(payload, ensure_ascii=False), now, now),
+            )
+            return int(cursor.lastrowid)
+
+    def claim(self, limit: int = 1) -> list[OutboxMessage]:
+        """Reserva mensajes vencidos con un lease; si el proceso muere, el lease expira y se reintentan."""
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    """
+                    SELECT id, payload, attempts, created_at FROM notification_outbox
+                    WHERE next_attempt_at <= ? AND leased_until <= ?
+                    ORDER BY next_attempt_at, id LIMIT ?
+                    """,
+                    (now, now, limit),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE notification_outbox SET leased_until = ? WHERE id = ?",
+                    [(now + self._lease_seconds, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            OutboxMessage(id=row[0], payload=json.loads(row[1]), attempts=row[2], created_at=row[3])
+            for row in rows
+        ]
+
+    def replace_payload(self, message_id: int, payload: dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE notification_outbox SET payload = ? WHERE id = ?",
+                (json.dumps(payload, ensure_ascii=False), message_id),
+            )
+
+    def complete(self, message_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM notification_outbox WHERE id = ?", (message_id,))
+
+    def retry_later(self, message_id: int, delay_seconds: float, error: str) -> None:
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE notification_outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, leased_until = 0, last_error = ?
+                WHERE id = ?
+                """,
+                (now + delay_seconds, error[:500], message_id),
+            )
+
+    def release(self, message_id: int) -> None:
+        """Devuelve un mensaje reservado sin contar intento (p. ej. circuito abierto)."""
+        with self._lock:
+            self._conn.execute("UPDATE notification_outbox SET leased_until = 0 WHERE id = ?", (message_id,))
+
+    def seconds_until_next_due(self) -> float | None:
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(MAX(next_attempt_at, leased_until)) FROM notification_outbox"
+            ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - now)
+
+    def stats(self) -> dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            depth, oldest, retrying, leased = self._conn.execute(
+                """
+                SELECT COUNT(*), MIN(created_at),
+                       COALESCE(SUM(attempts > 0), 0), COALESCE(SUM(leased_until > ?), 0)
+                FROM notification_outbox
+                """,
+                (now,),
+            ).fetchone()
+        return {
+            "depth": depth,
+            "oldest_age_seconds": round(now - oldest, 1) if oldest is not None else 0.0,
+            "retrying": retrying,
+            "in_flight": leased,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM notification_outbox")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CircuitBreaker:
+    """Abre tras N fallos seguidos y deja pasar una sola prueba al vencer el enfriamiento."""
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_BREAKER_RESET_SECONDS,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self._clock() - self.opened_at >= self._reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def seconds_until_retry(self) -> float:
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.opened_at + self._reset_seconds - self._clock())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self._failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = self._clock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.opened_at = 0.0
+            self.times_opened = 0
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+            }
+
+
+class NotificationBodyStore:
+    """Cuerpos HTML ya renderizados (payload v2) que n8n puede pedir por URL firmada."""
+
+    def __init__(self, path: str, *, clock: Callable[[], float] = time.time) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS notification_bodies (
+                alert_id TEXT PRIMARY KEY,
+                body_html TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+
+    def put(self, alert_id: str, body_html: str, ttl_seconds: float) -> None:
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("DELETE FROM notification_bodies WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO notification_bodies (alert_id, body_html, expires_at) VALUES (?, ?, ?)",
+                (alert_id, body_html, now + ttl_seconds),
+            )
+
+    def get(self, alert_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body_html FROM notification_bodies WHERE alert_id = ? AND expires_at >= ?",
+                (alert_id, self._clock()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM notification_bodies")
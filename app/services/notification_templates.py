@@ -0,0 +1,40 @@
+"""Plantillas Jinja2 precompiladas para correos y WhatsApp de alertas.
+
+El cuerpo del correo se renderiza una vez por alerta; por destinatario solo se
+renderiza la cabecera con el saludo.
+"""
+import os
+from typing import Any, Mapping
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates", "notifications")
+
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+)
+# Se compilan al importar el modulo: en caliente solo se ejecuta el codigo generado.
+_EMAIL_HEADER = _environment.get_template("alert_email_header.html")
+_EMAIL_BODY = _environment.get_template("alert_email_body.html")
+_WHATSAPP = _environment.get_template("alert_whatsapp.txt")
+
+
+def render_email_body(context: Mapping[str, Any]) -> str:
+    return _EMAIL_BODY.render(context).strip()
+
+
+def render_email_header(recipient_name: str) -> str:
+    return _EMAIL_HEADER.render(recipient_name=recipient_name)
+
+
+def render_email_html(body_html: str, recipient_name: str) -> str:
+    return render_email_header(recipient_name) + body_html
+
+
+def render_whatsapp_text(context: Mapping[str, Any]) -> str:
+    return _WHATSAPP.render(context)
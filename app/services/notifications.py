@@ -1,31 +1,179 @@
+"""Servicios externos de SafyraShield."""
+import asyncio
 import json
 import os
-import atexit
+import time
+from collections import deque
 from collections.abc import Callable
-from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Mapping
+from urllib.parse import urlsplit
 
-import requests
+import httpx
+from starlette.concurrency import run_in_threadpool
 
-DEFAULT_ALERT_TIMEOUT_SECONDS = 60.0
-_NOTIFICATION_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="safyra-alert")
-atexit.register(_NOTIFICATION_EXECUTOR.shutdown, wait=False, cancel_futures=True)
+from app.services.notification_outbox import (
+    DEFAULT_BACKOFF_BASE_SECONDS,
+    DEFAULT_BACKOFF_MAX_SECONDS,
+    DEFAULT_BREAKER_FAILURE_THRESHOLD,
+    DEFAULT_BREAKER_RESET_SECONDS,
+    CircuitBreaker,
+    NotificationOutbox,
+    OutboxMessage,
+    backoff_seconds,
+    default_outbox_path,
+)
+
+DEFAULT_ALERT_TIMEOUT_SECONDS = 10.0
+DEFAULT_CONNECT_TIMEOUT_SECONDS = 3.0
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 8
+DEFAULT_DISPATCH_WORKERS = 4
+LATENCY_SAMPLE_SIZE = 512
+IDLE_POLL_SECONDS = 1.0
 
 
 def _notifications_enabled() -> bool:
     return os.getenv("ALERT_NOTIFICATION_ENABLED", "false").lower() in {"1", "true", "yes"}
 
 
-def _request_timeout_seconds() -> float:
-    raw_value = os.getenv("N8N_ALERT_TIMEOUT_SECONDS", str(int(DEFAULT_ALERT_TIMEOUT_SECONDS)))
+def _read_float_env(name: str, default: float, minimum: float) -> float:
+    raw_value = os.getenv(name, str(default))
+    try:
+        return max(minimum, float(raw_value))
+    except ValueError:
+        return default
+
+
+def _read_int_env(name: str, default: int) -> int:
     try:
-        return max(1.0, float(raw_value))
+        return max(1, int(os.getenv(name, str(default))))
     except ValueError:
-        return DEFAULT_ALERT_TIMEOUT_SECONDS
+        return default
+
+
+def _request_timeout_seconds() -> float:
+    return _read_float_env("N8N_ALERT_TIMEOUT_SECONDS", DEFAULT_ALERT_TIMEOUT_SECONDS, 1.0)
+
+
+def _connect_timeout_seconds() -> float:
+    return _read_float_env("N8N_CONNECT_TIMEOUT_SECONDS", DEFAULT_CONNECT_TIMEOUT_SECONDS, 0.1)
+
+
+def _max_connections_per_host() -> int:
+    return _read_int_env("N8N_MAX_CONNECTIONS_PER_HOST", DEFAULT_MAX_CONNECTIONS_PER_HOST)
+
+
+def _http2_available() -> bool:
+    if os.getenv("N8N_HTTP2_ENABLED", "true").lower() not in {"1", "true", "yes"}:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _webhook_url() -> str:
+    return os.getenv("N8N_ALERT_WEBHOOK_URL", "").strip()
+
+
+class WebhookMetrics:
+    """Contadores y latencias recientes de los POST salientes."""
+
+    def __init__(self, sample_size: int = LATENCY_SAMPLE_SIZE) -> None:
+        self.sent = 0
+        self.failed = 0
+        self._latencies_ms: deque[float] = deque(maxlen=sample_size)
+
+    def record(self, latency_ms: float, ok: bool) -> None:
+        self._latencies_ms.append(latency_ms)
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def reset(self) -> None:
+        self.sent = 0
+        self.failed = 0
+        self._latencies_ms.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        samples = sorted(self._latencies_ms)
+
+        def percentile(fraction: float) -> float | None:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(fraction * len(samples)))], 1)
+
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "latency_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(samples[-1], 1) if samples else None,
+                "samples": len(samples),
+            },
+        }
+
+
+webhook_metrics = WebhookMetrics()
+
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+_host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+
+def _build_http_client() -> httpx.AsyncClient:
+    max_connections = _max_connections_per_host()
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(
+            _request_timeout_seconds(),
+            connect=_connect_timeout_seconds(),
+            pool=_connect_timeout_seconds(),
+        ),
+        limits=httpx.Limits(
+            max_connections=max_connections * 4,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=60.0,
+        ),
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente compartido (keep-alive) ligado al event loop actual."""
+    global _http_client, _http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = _build_http_client()
+        _http_client_loop = loop
+        _host_semaphores.clear()
+    return _http_client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_max_connections_per_host())
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+async def close_http_client() -> None:
+    global _http_client, _http_client_loop
 
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+    _host_semaphores.clear()
 
-def _post_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
-    webhook_url = os.getenv("N8N_ALERT_WEBHOOK_URL", "").strip()
+
+async def _post_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
+    webhook_url = _webhook_url()
     webhook_token = os.getenv("N8N_ALERT_WEBHOOK_TOKEN", "").strip()
 
     print(f"[WEBHOOK] Intentando enviar alerta a: {webhook_url}")
@@ -38,49 +186,231 @@ def _post_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
         "Content-Type": "application/json",
         "X-Safyra-Token": webhook_token,
     }
+    body = json.dumps(dict(payload), ensure_ascii=False).encode("utf-8")
 
+    started_at = time.perf_counter()
     try:
-        response = requests.post(
-            webhook_url,
-            data=json.dumps(dict(payload), ensure_ascii=False).encode("utf-8"),
-            headers=headers,
-            timeout=_request_timeout_seconds(),
+        async with _host_semaphore(webhook_url):
+            response = await get_http_client().post(webhook_url, content=body, headers=headers)
+    except httpx.HTTPError as exc:
+        webhook_metrics.record((time.perf_counter() - started_at) * 1000, ok=False)
+        print(f"[WEBHOOK] EXCEPCIÓN al enviar POST: {exc!r}")
+        return {"sent": False, "reason": str(exc) or exc.__class__.__name__}
+
+    latency_ms = (time.perf_counter() - started_at) * 1000
+    webhook_metrics.record(latency_ms, ok=response.is_success)
+    print(f"[WEBHOOK] Respuesta de n8n: Status={response.status_code}, Ok={response.is_success}, {latency_ms:.0f} ms")
+    if not response.is_success:
+        print(f"[WEBHOOK] Detalle de error: {response.text[:200]}")
+    return {
+        "sent": response.is_success,
+        "status_code": response.status_code,
+        "response": response.text[:500],
+        "reason": "" if response.is_success else response.reason_phrase,
+        "latency_ms": round(latency_ms, 1),
+    }
+
+
+async def send_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
+    return await _post_alert_notification(payload)
+
+
+_payload_builders: dict[str, Callable[[Mapping[str, Any]], Mapping[str, Any]]] = {}
+
+
+def register_payload_builder(name: str, builder: Callable[[Mapping[str, Any]], Mapping[str, Any]]) -> None:
+    """Registra como completar un registro crudo del outbox (destinatarios, plantillas)."""
+    _payload_builders[name] = builder
+
+
+def build_queued_payload(builder: str, inputs: Mapping[str, Any]) -> dict[str, Any]:
+    if builder not in _payload_builders:
+        raise LookupError(f"Constructor de payload no registrado: {builder}")
+    return dict(_payload_builders[builder](inputs))
+
+
+class AlertDispatcher:
+    """Persiste cada alerta en el outbox y la envia con workers asyncio.
+
+    ``submit`` guarda de inmediato los datos crudos de la alerta; un worker
+    construye el payload completo, lo reemplaza en el outbox y lo envia con
+    reintentos, backoff y circuit breaker fuera del camino de respuesta.
+    """
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._workers: list[asyncio.Task] = []
+        self._outbox: NotificationOutbox | None = None
+        self.breaker = CircuitBreaker(
+            failure_threshold=_read_int_env("N8N_BREAKER_FAILURE_THRESHOLD", DEFAULT_BREAKER_FAILURE_THRESHOLD),
+            reset_seconds=_read_float_env("N8N_BREAKER_RESET_SECONDS", DEFAULT_BREAKER_RESET_SECONDS, 1.0),
         )
-        print(f"[WEBHOOK] Respuesta de n8n: Status={response.status_code}, Ok={response.ok}")
-        if not response.ok:
-            print(f"[WEBHOOK] Detalle de error: {response.text[:200]}")
-        return {
-            "sent": response.ok,
-            "status_code": response.status_code,
-            "response": response.text[:500],
-            "reason": "" if response.ok else response.reason,
-        }
-    except requests.RequestException as exc:
-        print(f"[WEBHOOK] EXCEPCIÓN al enviar POST: {str(exc)}")
-        return {"sent": False, "reason": str(exc)}
 
+    @property
+    def outbox(self) -> NotificationOutbox:
+        if self._outbox is None:
+            self._outbox = NotificationOutbox(default_outbox_path())
+        return self._outbox
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._workers = [
+                loop.create_task(self._worker(), name=f"safyra-alert-{index}")
+                for index in range(_read_int_env("N8N_DISPATCH_WORKERS", DEFAULT_DISPATCH_WORKERS))
+            ]
+
+    def start(self) -> None:
+        """Arranca los workers para drenar alertas que quedaron pendientes de un reinicio."""
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _wake(self) -> None:
+        try:
+            self._ensure_started()
+        except RuntimeError:
+            # Desde un hilo (p. ej. el threadpool) o antes de arrancar: el registro ya esta
+            # en el outbox y sale cuando un worker lo reclame.
+            loop = self._loop
+            if loop is not None and not loop.is_closed() and loop.is_running():
+                loop.call_soon_threadsafe(self._wakeup.set)
+            return
+        self._wakeup.set()
 
+    def submit(self, builder: str, inputs: Mapping[str, Any]) -> int:
+        """Guarda los datos crudos de la alerta; el payload se construye en el worker."""
+        message_id = self.outbox.enqueue({"_build": {"builder": builder, "inputs": dict(inputs)}})
+        self._wake()
+        return message_id
 
-def send_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
-    return _post_alert_notification(payload)
+    def submit_payload(self, payload: Mapping[str, Any]) -> None:
+        """Guarda el payload de inmediato; si no hay loop activo se enviara al arrancar."""
+        self.outbox.enqueue(dict(payload))
+        self._wake()
+
+    async def _enrich(self, message: OutboxMessage) -> dict[str, Any]:
+        pending_build = message.payload.get("_build")
+        if not isinstance(pending_build, Mapping):
+            return message.payload
+        payload = await run_in_threadpool(build_queued_payload, pending_build["builder"], pending_build["inputs"])
+        await run_in_threadpool(self.outbox.replace_payload, message.id, payload)
+        return payload
+
+    def _retry_delay(self, attempts: int) -> float:
+        return backoff_seconds(
+            attempts,
+            base=_read_float_env("N8N_RETRY_BASE_SECONDS", DEFAULT_BACKOFF_BASE_SECONDS, 0.0),
+            maximum=_read_float_env("N8N_RETRY_MAX_SECONDS", DEFAULT_BACKOFF_MAX_SECONDS, 1.0),
+        )
+
+    async def _idle(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            return
+        self._wakeup.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            retry_in = self.breaker.seconds_until_retry()
+            if retry_in > 0:
+                await self._idle(retry_in)
+                continue
+            messages = await run_in_threadpool(self.outbox.claim, 1)
+            if not messages:
+                next_due = await run_in_threadpool(self.outbox.seconds_until_next_due)
+                await self._idle(min(IDLE_POLL_SECONDS, next_due) if next_due is not None else IDLE_POLL_SECONDS)
+                continue
+
+            message = messages[0]
+            try:
+                payload = await self._enrich(message)
+            except Exception as exc:
+                # Los datos crudos siguen en el outbox: se reintenta la construccion, no se descarta.
+                delay = self._retry_delay(message.attempts)
+                print(f"[WEBHOOK] Error preparando alerta {message.id}; reintentara en {delay:.1f} s: {exc}")
+                await run_in_threadpool(self.outbox.retry_later, message.id, delay, f"build: {exc}")
+                continue
+
+            if not self.breaker.allow():
+                # Otro worker esta haciendo la prueba half-open: se espera a que termine.
+                await run_in_threadpool(self.outbox.release, message.id)
+                await self._idle(max(self.breaker.seconds_until_retry(), IDLE_POLL_SECONDS))
+                continue
+
+            try:
+                result = await _post_alert_notification(payload)
+            except Exception as exc:
+                result = {"sent": False, "reason": str(exc) or exc.__class__.__name__}
+            if result.get("sent"):
+                self.breaker.record_success()
+                await run_in_threadpool(self.outbox.complete, message.id)
+            else:
+                if result.get("reason") != "notifications_disabled":
+                    self.breaker.record_failure()
+                delay = self._retry_delay(message.attempts)
+                print(f"[WEBHOOK] Alerta {message.id} reintentara en {delay:.1f} s (intento {message.attempts + 1}).")
+                await run_in_threadpool(self.outbox.retry_later, message.id, delay, str(result.get("reason") or ""))
+            # Despierta a los workers que esperaban el resultado de la prueba half-open.
+            self._wakeup.set()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {**self.outbox.stats(), "breaker": self.breaker.snapshot()}
+
+    async def shutdown(self, timeout_seconds: float = 5.0) -> None:
+        if self._loop is asyncio.get_running_loop():
+            deadline = time.monotonic() + timeout_seconds
+            # Lo que no alcance a salir queda en el outbox para el siguiente arranque.
+            while time.monotonic() < deadline and self.breaker.state == "closed":
+                stats = self.outbox.stats()
+                next_due = self.outbox.seconds_until_next_due()
+                if next_due is None or (stats["in_flight"] == 0 and next_due > deadline - time.monotonic()):
+                    break
+                await asyncio.sleep(0.02)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._loop = None
+        self._wakeup = None
+
+
+alert_dispatcher = AlertDispatcher()
 
 
 def queue_alert_notification(payload: Mapping[str, Any]) -> dict[str, Any]:
-    if not _notifications_enabled() or not os.getenv("N8N_ALERT_WEBHOOK_URL", "").strip():
+    if not _notifications_enabled() or not _webhook_url():
         return {"queued": False, "reason": "notifications_disabled"}
 
-    future: Future[dict[str, Any]] = _NOTIFICATION_EXECUTOR.submit(_post_alert_notification, dict(payload))
-    return {"queued": True, "done": future.done()}
+    alert_dispatcher.submit_payload(payload)
+    return {"queued": True, "done": False}
 
 
-def _build_and_send_alert(payload_factory: Callable[[], Mapping[str, Any]]) -> dict[str, Any]:
-    payload = payload_factory()
-    return _post_alert_notification(payload)
+def queue_raw_alert_notification(builder: str, inputs: Mapping[str, Any]) -> dict[str, Any]:
+    """Encola los datos crudos de una alerta; ``builder`` arma el payload al enviarla."""
+    if not _notifications_enabled() or not _webhook_url():
+        return {"queued": False, "reason": "notifications_disabled"}
 
+    alert_dispatcher.submit(builder, inputs)
+    return {"queued": True, "done": False}
+
+
+def notification_metrics_snapshot() -> dict[str, Any]:
+    return {
+        **webhook_metrics.snapshot(),
+        "outbox": alert_dispatcher.snapshot(),
+        "http2": _http2_available(),
+    }
+
+
+def start_notification_dispatcher() -> None:
+    if _notifications_enabled() and _webhook_url():
+        alert_dispatcher.start()
 
-def queue_alert_notification_factory(payload_factory: Callable[[], Mapping[str, Any]]) -> dict[str, Any]:
-    if not _notifications_enabled() or not os.getenv("N8N_ALERT_WEBHOOK_URL", "").strip():
-        return {"queued": False, "reason": "notifications_disabled"}
 
-    future: Future[dict[str, Any]] = _NOTIFICATION_EXECUTOR.submit(_build_and_send_alert, payload_factory)
-    return {"queued": True, "done": future.done()}
+async def shutdown_notifications() -> None:
+    await alert_dispatcher.shutdown()
+    await close_http_client()
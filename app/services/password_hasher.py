@@ -0,0 +1,111 @@
+"""bcrypt en un pool de hilos acotado para no congelar el event loop durante los logins."""
+import asyncio
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, TypeVar
+
+from fastapi import HTTPException
+
+T = TypeVar("T")
+
+
+def _read_int_env(name: str, default: int, minimum: int) -> int:
+    try:
+        return max(minimum, int(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+class PasswordHashPool:
+    """Hilos dedicados (bcrypt libera el GIL), cola acotada y limite de logins simultaneos por IP.
+
+    Si la cola esta llena se responde 503 de inmediato en lugar de acumular
+    trabajos de ~200 ms que nadie va a esperar.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, max_per_client: int) -> None:
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self.max_per_client = max(1, max_per_client)
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._per_client: dict[str, int] = {}
+        self.jobs_completed = 0
+        self.jobs_rejected = 0
+        self.logins_throttled = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.jobs_rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Servicio de autenticacion ocupado, intenta nuevamente",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            result = await asyncio.wrap_future(self._get_executor().submit(func, *args))
+            with self._lock:
+                self.jobs_completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @asynccontextmanager
+    async def login_slot(self, client_key: str) -> AsyncIterator[None]:
+        """Cupo de logins en curso por cliente: un solo origen no puede acaparar el pool."""
+        with self._lock:
+            if self._per_client.get(client_key, 0) >= self.max_per_client:
+                self.logins_throttled += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Demasiados inicios de sesion simultaneos; reintente mas tarde",
+                    headers={"Retry-After": "1"},
+                )
+            self._per_client[client_key] = self._per_client.get(client_key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                remaining = self._per_client.get(client_key, 1) - 1
+                if remaining <= 0:
+                    self._per_client.pop(client_key, None)
+                else:
+                    self._per_client[client_key] = remaining
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "clients_in_flight": len(self._per_client),
+                "completed": self.jobs_completed,
+                "rejected": self.jobs_rejected,
+                "throttled": self.logins_throttled,
+            }
+
+
+password_hash_pool = PasswordHashPool(
+    max_workers=_read_int_env("PASSWORD_HASH_WORKERS", 2, 1),
+    max_pending=_read_int_env("PASSWORD_HASH_MAX_PENDING", 16, 1),
+    max_per_client=_read_int_env("LOGIN_MAX_CONCURRENT_PER_IP", 2, 1),
+)
@@ -0,0 +1,187 @@
+"""Cache de PDFs de reportes: LRU en memoria respaldado por un nivel en disco."""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MB = 1024 * 1024
+
+
+def _read_float_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def default_pdf_cache_dir() -> str:
+    configured = os.getenv("REPORT_PDF_CACHE_DIR", "").strip()
+    if configured:
+        return configured
+    if os.getenv("VERCEL") == "1":
+        return os.path.join(tempfile.gettempdir(), "safyra_report_pdfs")
+    return os.path.join(BASE_DIR, "var", "report_pdfs")
+
+
+def pdf_cache_key(report_id: str, generated_at: str | None, tickets_version: str = "") -> str:
+    """Clave por contenido: cambia cuando el reporte se regenera (nuevo ``generated_at``)
+    o cuando cambian los tickets del periodo que el PDF lista."""
+    return hashlib.sha256(f"{report_id}|{generated_at or ''}|{tickets_version}".encode("utf-8")).hexdigest()[:32]
+
+
+class ReportPdfCache:
+    """Los PDFs se guardan como ``<report_id>--<clave>.pdf``; el prefijo permite invalidar por reporte."""
+
+    def __init__(self, directory: str | None, memory_max_bytes: int, disk_max_bytes: int) -> None:
+        self.directory = directory
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _prefix(report_id: str) -> str:
+        safe_id = "".join(char for char in report_id if char.isalnum() or char in "-_")
+        return f"{safe_id}--"
+
+    def _path(self, report_id: str, key: str) -> str:
+        return os.path.join(self.directory, f"{self._prefix(report_id)}{key}.pdf")
+
+    def get(self, report_id: str, key: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get((report_id, key))
+            if data is not None:
+                self._memory.move_to_end((report_id, key))
+                self.hits += 1
+                return data
+        data = self._read_disk(report_id, key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(report_id, key, data)
+        return data
+
+    def put(self, report_id: str, key: str, data: bytes) -> None:
+        with self._lock:
+            self._remember(report_id, key, data)
+        self._write_disk(report_id, key, data)
+
+    def _remember(self, report_id: str, key: str, data: bytes) -> None:
+        if len(data) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop((report_id, key), None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[(report_id, key)] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _read_disk(self, report_id: str, key: str) -> bytes | None:
+        if not self.directory:
+            return None
+        path = self._path(report_id, key)
+        try:
+            with open(path, "rb") as handle:
+                data = handle.read()
+            os.utime(path)  # mtime hace de marca LRU en disco
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, report_id: str, key: str, data: bytes) -> None:
+        if not self.directory or len(data) > self.disk_max_bytes:
+            return
+        path = self._path(report_id, key)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as exc:
+            print(f"[REPORTES] No se pudo guardar el PDF en cache de disco: {exc}")
+
+    def _evict_disk(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pdf"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
+
+    def invalidate(self, report_id: str) -> None:
+        """Descarta todas las versiones cacheadas de un reporte."""
+        with self._lock:
+            for cached in [cached for cached in self._memory if cached[0] == report_id]:
+                self._memory_bytes -= len(self._memory.pop(cached))
+        if not self.directory:
+            return
+        prefix = self._prefix(report_id)
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self.hits = self.disk_hits = self.misses = 0
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith(".pdf"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+def _build_pdf_cache() -> ReportPdfCache:
+    memory_max = int(_read_float_env("REPORT_PDF_CACHE_MEMORY_MB", 16) * MB)
+    disk_max = int(_read_float_env("REPORT_PDF_CACHE_DISK_MB", 256) * MB)
+    directory = default_pdf_cache_dir() if disk_max > 0 else None
+    try:
+        return ReportPdfCache(directory, memory_max, disk_max)
+    except OSError as exc:
+        print(f"[REPORTES] Cache de PDFs solo en memoria: {exc}")
+        return ReportPdfCache(None, memory_max, disk_max)
+
+
+report_pdf_cache = _build_pdf_cache()
@@ -0,0 +1,185 @@
+"""Pool de procesos para renderizar PDFs y Excel fuera del event loop y del GIL."""
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+
+def _read_float_env(name: str, default: float, minimum: float) -> float:
+    try:
+        return max(minimum, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+def _warm_worker() -> None:
+    # Importa fpdf/openpyxl una sola vez por proceso, antes del primer trabajo.
+    from app.services.document_renderers import preload
+
+    preload()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class DocumentRenderPool:
+    """Procesos ``spawn`` calientes, cola acotada y timeout por trabajo.
+
+    Con ``max_workers=0`` (o si el pool se rompe) los documentos se renderizan
+    en el threadpool, como antes. Un trabajo que excede el timeout se cancela y
+    los procesos se reciclan, para que un render colgado no ocupe un worker.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, timeout_seconds: float) -> None:
+        self.max_workers = max_workers
+        self.max_pending = max(1, max_pending)
+        self.timeout_seconds = timeout_seconds
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._pending = 0
+        self.jobs_completed = 0
+        self.jobs_rejected = 0
+        self.jobs_timed_out = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor | None:
+        if self.max_workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_warm_worker,
+                    )
+                except (OSError, NotImplementedError) as exc:
+                    print(f"[DOCUMENTOS] Pool de procesos no disponible, se usa el threadpool: {exc}")
+                    self.max_workers = 0
+            return self._executor
+
+    def start(self) -> None:
+        """Arranca los procesos de antemano para que la primera descarga no pague el spawn."""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        for _ in range(self.max_workers):
+            executor.submit(_ping)
+
+    def _acquire_slot(self, wait_seconds: float = 0) -> bool:
+        with self._slot_freed:
+            if wait_seconds > 0:
+                self._slot_freed.wait_for(lambda: self._pending < self.max_pending, timeout=wait_seconds)
+            if self._pending >= self.max_pending:
+                self.jobs_rejected += 1
+                return False
+            self._pending += 1
+            return True
+
+    def _release_slot(self) -> None:
+        with self._slot_freed:
+            self._pending -= 1
+            self._slot_freed.notify()
+
+    async def render(self, func: Callable[..., Any], *args: Any) -> Any:
+        """``func`` y sus argumentos deben ser serializables (pickle)."""
+        if not self._acquire_slot():
+            raise HTTPException(status_code=503, detail="Generador de documentos ocupado, intenta nuevamente")
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                result = await asyncio.wait_for(run_in_threadpool(func, *args), timeout=self.timeout_seconds)
+            else:
+                future = executor.submit(func, *args)
+                try:
+                    result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout_seconds)
+                except asyncio.TimeoutError:
+                    future.cancel()
+                    self._reset_executor()
+                    raise
+                except BrokenProcessPool:
+                    self._reset_executor()
+                    raise
+            with self._lock:
+                self.jobs_completed += 1
+            return result
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.jobs_timed_out += 1
+            raise HTTPException(status_code=504, detail="La generacion del documento excedio el tiempo limite")
+        finally:
+            self._release_slot()
+
+    def run_blocking(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Variante sincrona para hilos de fondo (p. ej. trabajos de exportacion).
+
+        Cuenta contra el mismo cupo que ``render``, pero espera un lugar libre
+        (hasta ``timeout_seconds``) en vez de rechazar de inmediato.
+        """
+        if not self._acquire_slot(wait_seconds=self.timeout_seconds):
+            raise RuntimeError("Generador de documentos ocupado")
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                result = func(*args)
+            else:
+                future = executor.submit(func, *args)
+                try:
+                    result = future.result(timeout=self.timeout_seconds)
+                except FutureTimeoutError:
+                    with self._lock:
+                        self.jobs_timed_out += 1
+                    future.cancel()
+                    self._reset_executor()
+                    raise TimeoutError("La generacion del documento excedio el tiempo limite") from None
+                except BrokenProcessPool:
+                    self._reset_executor()
+                    raise
+            with self._lock:
+                self.jobs_completed += 1
+            return result
+        finally:
+            self._release_slot()
+
+    def _reset_executor(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # shutdown() no detiene un trabajo en curso: los procesos se terminan y el
+        # siguiente trabajo arranca un pool nuevo.
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def shutdown(self) -> None:
+        self._reset_executor()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self.jobs_completed,
+                "rejected": self.jobs_rejected,
+                "timed_out": self.jobs_timed_out,
+            }
+
+
+document_render_pool = DocumentRenderPool(
+    # En Vercel no hay procesos hijos utiles: se renderiza en el threadpool.
+    max_workers=int(_read_float_env("DOCUMENT_RENDER_WORKERS", 0 if os.getenv("VERCEL") == "1" else 2, 0)),
+    max_pending=int(_read_float_env("DOCUMENT_RENDER_MAX_PENDING", 8, 1)),
+    timeout_seconds=_read_float_env("DOCUMENT_RENDER_TIMEOUT_SECONDS", 60, 1),
+)
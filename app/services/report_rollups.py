@@ -0,0 +1,71 @@
+"""Agregados diarios de reportes.
+
+Los mantienen triggers de Postgres sobre ``audit_events`` y ``maintenance_tickets``
+(supabase/migrations/20261022_report_daily_rollups.sql); aqui solo se leen.
+No incluyen energia (kWh): las lecturas de potencia no pasan por Postgres, solo
+las alertas, y ``avg_alert_power`` es la potencia media de esas alertas.
+"""
+from datetime import datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable
+
+from app.db.firebase import LOCAL_TIMEZONE
+from app.db.supabase import get_supabase_client
+
+ROLLUP_TABLE = "report_daily_rollups"
+
+
+def rollup_day(moment: datetime | None = None) -> str:
+    """Dia local del colegio al que se imputa un evento."""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(LOCAL_TIMEZONE).date().isoformat()
+
+
+def fetch_rollups(start_day: str, end_day: str) -> list[dict]:
+    res = get_supabase_client().table(ROLLUP_TABLE) \
+        .select("event_type, branch_label, alerts, tickets_opened, tickets_closed, peak_current, peak_power, power_sum") \
+        .gte("day", start_day) \
+        .lte("day", end_day) \
+        .execute()
+    return res.data or []
+
+
+def fold_rollups(rows: Iterable[dict]) -> Dict[str, Any]:
+    """Suma las filas diarias del periodo; el costo depende de dias x tipos x ramales, no de eventos."""
+    totals = {"total_alerts": 0, "total_tickets": 0, "tickets_closed": 0, "peak_current": 0.0, "peak_power": 0.0}
+    power_sum = 0.0
+    branches = set()
+    alerts_by_type: Dict[str, int] = {}
+    for row in rows:
+        alerts = int(row.get("alerts") or 0)
+        totals["total_alerts"] += alerts
+        totals["total_tickets"] += int(row.get("tickets_opened") or 0)
+        totals["tickets_closed"] += int(row.get("tickets_closed") or 0)
+        totals["peak_current"] = max(totals["peak_current"], float(row.get("peak_current") or 0))
+        totals["peak_power"] = max(totals["peak_power"], float(row.get("peak_power") or 0))
+        power_sum += float(row.get("power_sum") or 0)
+        if alerts:
+            branches.add(row.get("branch_label") or "Desconocido")
+            event_type = row.get("event_type") or "desconocido"
+            alerts_by_type[event_type] = alerts_by_type.get(event_type, 0) + alerts
+    return {
+        **totals,
+        "peak_current": round(totals["peak_current"], 3),
+        "peak_power": round(totals["peak_power"], 1),
+        "avg_alert_power": round(power_sum / totals["total_alerts"], 1) if totals["total_alerts"] else 0.0,
+        "affected_branches": sorted(branches),
+        "alerts_by_type": alerts_by_type,
+    }
+
+
+def period_bounds(days: int, now: datetime | None = None) -> tuple[str, str, datetime]:
+    """Ultimos ``days`` dias locales completos, hoy incluido: ``(dia_inicio, dia_fin, inicio)``.
+
+    Los agregados son por dia, asi que el periodo empieza a medianoche local;
+    ``inicio`` es ese instante, para que la consulta SQL cubra lo mismo.
+    """
+    now = now or datetime.now(timezone.utc)
+    end_day = now.astimezone(LOCAL_TIMEZONE).date()
+    start_day = end_day - timedelta(days=max(1, days) - 1)
+    period_start = datetime.combine(start_day, time.min, tzinfo=LOCAL_TIMEZONE)
+    return start_day.isoformat(), end_day.isoformat(), period_start
+
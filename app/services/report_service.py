@@ -1,224 +1,87 @@
 from datetime import datetime, timedelta, timezone
 import json
 import logging
-from fpdf import FPDF
-from app.db.supabase import get_supabase_client
+from app.db.supabase import get_supabase_client, run_supabase
 from app.services.notifications import queue_alert_notification
-from typing import Dict, Any
+from app.services.document_renderers import generate_pdf_from_summary  # noqa: F401 (reexportado)
+from app.services.pdf_cache import report_pdf_cache
+from app.services.report_rollups import fetch_rollups, fold_rollups, period_bounds
+from typing import Dict, Any, List
 import os
 
 logger = logging.getLogger(__name__)
 
-INCIDENT_TRANSLATIONS = {
-    "overload": "Sobrecarga",
-    "out_of_schedule_consumption": "Consumo fuera de horario"
-}
 
 def get_period_data(days: int = 7) -> Dict[str, Any]:
-    client = get_supabase_client()
+    """Resumen de los ultimos ``days`` dias locales a partir de los agregados diarios (``report_daily_rollups``)."""
     now = datetime.now(timezone.utc)
-    period_start = now - timedelta(days=days)
+    start_day, end_day, period_start = period_bounds(days, now)
     
     start_str = period_start.isoformat()
     end_str = now.isoformat()
     
-    # Tickets creados en el periodo
-    tickets_res = client.table("maintenance_tickets") \
-        .select("id, ticket_code, issue_type, priority, status, created_at") \
-        .gte("created_at", start_str) \
-        .lte("created_at", end_str) \
-        .execute()
-    tickets = tickets_res.data or []
-    
-    # Audit events del periodo (usa detected_at que es la columna de la tabla)
-    events_res = client.table("audit_events") \
-        .select("id, irms, branch_label, event_type, sensor_id, detected_at") \
-        .gte("detected_at", start_str) \
-        .lte("detected_at", end_str) \
-        .execute()
-    events = events_res.data or []
-    
-    total_tickets = len(tickets)
-    total_alerts = len(events)
-    
-    peak_current = 0.0
-    affected_branches = set()
-    alerts_by_type: Dict[str, int] = {}
-    
-    for ev in events:
-        irms_val = ev.get("irms") or 0
-        try:
-            irms_float = float(irms_val)
-            if irms_float > peak_current:
-                peak_current = irms_float
-        except (TypeError, ValueError):
-            pass
-        label = ev.get("branch_label") or ev.get("sensor_id") or "Desconocido"
-        affected_branches.add(label)
-        etype = ev.get("event_type") or "desconocido"
-        alerts_by_type[etype] = alerts_by_type.get(etype, 0) + 1
+    try:
+        aggregates = fold_rollups(fetch_rollups(start_day, end_day))
+    except Exception as exc:
+        # Sin la tabla de agregados (migracion pendiente): agregados SQL sobre las tablas fuente.
+        logger.warning(f"Agregados diarios no disponibles, se calcula sobre las tablas fuente: {exc}")
+        res = get_supabase_client().rpc("report_period_summary", {"period_start": start_str, "period_end": end_str}).execute()
+        aggregates = res.data or {}
+        if isinstance(aggregates, list):
+            aggregates = aggregates[0] if aggregates else {}
             
     summary_data = {
         "period_start": start_str,
         "period_end": end_str,
-        "total_alerts": total_alerts,
-        "total_tickets": total_tickets,
-        "peak_current": round(peak_current, 3),
-        "affected_branches": sorted(list(affected_branches)),
-        "alerts_by_type": alerts_by_type,
-        "tickets_list": tickets
+        "total_alerts": int(aggregates.get("total_alerts") or 0),
+        "total_tickets": int(aggregates.get("total_tickets") or 0),
+        "tickets_closed": int(aggregates.get("tickets_closed") or 0),
+        "peak_current": round(float(aggregates.get("peak_current") or 0), 3),
+        "peak_power": round(float(aggregates.get("peak_power") or 0), 1),
+        "avg_alert_power": round(float(aggregates.get("avg_alert_power") or 0), 1),
+        "affected_branches": sorted(aggregates.get("affected_branches") or []),
+        "alerts_by_type": aggregates.get("alerts_by_type") or {},
     }
     
     return summary_data
 
-class PremiumPDF(FPDF):
-    def header(self):
-        # Fondo oscuro para el header (color ink #0d2440)
-        self.set_fill_color(13, 36, 64)
-        self.rect(0, 0, 210, 35, 'F')
-        
-        # Titulo principal
-        self.set_font("Arial", 'B', 24)
-        self.set_text_color(255, 255, 255)
-        self.set_y(8)
-        self.set_x(15)
-        self.cell(0, 10, "SafyraShield IoT", ln=1, align='L')
-        
-        # Subtitulo
-        self.set_font("Arial", '', 12)
-        self.set_text_color(0, 245, 255) # accent cyan
-        self.set_x(15)
-        self.cell(0, 8, "Reporte Ejecutivo de Mantenimiento", ln=1, align='L')
-        self.ln(15)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font("Arial", 'I', 9)
-        self.set_text_color(150, 150, 150)
-        self.cell(0, 10, f"Generado automaticamente - Pagina {self.page_no()}", 0, 0, 'C')
+def get_period_tickets(period_start: str, period_end: str) -> List[Dict[str, Any]]:
+    """Tickets del periodo; solo se consultan al renderizar el PDF."""
+    client = get_supabase_client()
+    res = client.table("maintenance_tickets") \
+        .select("ticket_code, issue_type, priority, status, created_at") \
+        .gte("created_at", period_start) \
+        .lte("created_at", period_end) \
+        .order("created_at") \
+        .execute()
+    return res.data or []
 
-def generate_pdf_from_summary(summary_data: dict) -> bytes:
-    """Genera un PDF en memoria a partir de los datos JSON con diseño premium"""
-    pdf = PremiumPDF()
-    pdf.add_page()
-    
-    start_date = summary_data['period_start'][:10]
-    end_date = summary_data['period_end'][:10]
-    
-    # Calcular si es mensual o semanal basado en la diferencia de dias
+def get_tickets_version(period_start: str, period_end: str) -> str | None:
+    """Cantidad y ultima edicion de los tickets del periodo; ``None`` si no se pudo consultar."""
     try:
-        d1 = datetime.strptime(start_date, "%Y-%m-%d")
-        d2 = datetime.strptime(end_date, "%Y-%m-%d")
-        days_diff = (d2 - d1).days
-        tipo_reporte = "Mensual" if days_diff > 20 else "Semanal"
-    except:
-        tipo_reporte = "Ejecutivo"
+        res = get_supabase_client().table("maintenance_tickets") \
+            .select("updated_at", count="exact") \
+            .gte("created_at", period_start) \
+            .lte("created_at", period_end) \
+            .order("updated_at", desc=True) \
+            .limit(1) \
+            .execute()
+    except Exception as exc:
+        logger.warning(f"No se pudo leer la version de tickets del periodo: {exc}")
+        return None
+    latest = (res.data or [{}])[0].get("updated_at") or ""
+    return f"{res.count or 0}:{latest}"
 
-    # Tarjeta de Periodo
-    pdf.set_fill_color(240, 244, 248) # Fondo gris muy claro
-    pdf.set_draw_color(200, 210, 220)
-    pdf.set_xy(15, 45)
-    pdf.cell(180, 12, "", border=1, fill=True, align='C')
-    pdf.set_xy(15, 46)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(23, 93, 182) # Color primary blue
-    pdf.cell(180, 10, txt=f"Resumen {tipo_reporte} ({start_date} al {end_date})", align='C')
-    
-    pdf.ln(20)
-    
-    # Metricas en recuadros
-    pdf.set_font("Arial", 'B', 12)
-    pdf.set_text_color(50, 60, 70)
-    pdf.set_x(15)
-    pdf.cell(0, 8, txt="Metricas Generales:", ln=1)
-    
-    # Dibujar metricas
-    pdf.set_fill_color(255, 255, 255)
-    pdf.set_font("Arial", '', 11)
-    
-    metrics = [
-        ("Total de Alertas", str(summary_data['total_alerts'])),
-        ("Total de Tickets", str(summary_data['total_tickets'])),
-        ("Pico Max. Corriente", f"{summary_data['peak_current']} A"),
-    ]
-    
-    x_start = 15
-    y_start = pdf.get_y() + 2
-    for title, val in metrics:
-        pdf.set_xy(x_start, y_start)
-        pdf.set_fill_color(248, 250, 252)
-        pdf.rect(x_start, y_start, 55, 20, 'DF')
-        
-        pdf.set_xy(x_start, y_start + 3)
-        pdf.set_font("Arial", '', 9)
-        pdf.set_text_color(100, 110, 120)
-        pdf.cell(55, 5, txt=title, align='C')
-        
-        pdf.set_xy(x_start, y_start + 9)
-        pdf.set_font("Arial", 'B', 14)
-        pdf.set_text_color(15, 111, 209)
-        pdf.cell(55, 8, txt=val, align='C')
-        x_start += 60
-        
-    pdf.set_y(y_start + 25)
-    
-    branches = ", ".join(summary_data['affected_branches']) if summary_data['affected_branches'] else "Ninguno"
-    pdf.set_font("Arial", 'B', 11)
-    pdf.set_text_color(50, 60, 70)
-    pdf.set_x(15)
-    pdf.cell(0, 8, txt="Ramales Afectados:", ln=0)
-    pdf.set_font("Arial", '', 11)
-    pdf.set_text_color(100, 110, 120)
-    pdf.set_x(55)
-    pdf.cell(0, 8, txt=branches, ln=1)
-    
-    pdf.ln(10)
-    
-    # Tabla de Tickets
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_text_color(23, 93, 182)
-    pdf.set_x(15)
-    pdf.cell(0, 10, txt="Detalle de Tickets Creados", ln=1)
-    pdf.ln(2)
-    
-    # Cabecera tabla
-    pdf.set_fill_color(13, 36, 64)
-    pdf.set_text_color(255, 255, 255)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.set_x(15)
-    pdf.cell(40, 10, "Ticket", 1, 0, 'C', 1)
-    pdf.cell(60, 10, "Incidente", 1, 0, 'C', 1)
-    pdf.cell(40, 10, "Prioridad", 1, 0, 'C', 1)
-    pdf.cell(40, 10, "Estado", 1, 1, 'C', 1)
-    
-    # Filas
-    pdf.set_font("Arial", '', 9)
-    pdf.set_text_color(50, 50, 50)
-    pdf.set_fill_color(248, 250, 252)
-    fill = False
-    
-    if not summary_data['tickets_list']:
-        pdf.set_x(15)
-        pdf.cell(180, 10, "No se registraron tickets en este periodo.", 1, 1, 'C')
-    else:
-        for t in summary_data['tickets_list']:
-            pdf.set_x(15)
-            issue_type = t.get('issue_type', '')
-            issue_type_es = INCIDENT_TRANSLATIONS.get(issue_type, issue_type.capitalize().replace('_', ' '))
-            pdf.cell(40, 10, t['ticket_code'], 1, 0, 'C', fill)
-            pdf.cell(60, 10, issue_type_es, 1, 0, 'C', fill)
-            pdf.cell(40, 10, t['priority'], 1, 0, 'C', fill)
-            pdf.cell(40, 10, t['status'], 1, 1, 'C', fill)
-            fill = not fill
-        
-    out = pdf.output(dest='S')
-    if isinstance(out, str):
-        return out.encode('latin1')
-    return bytes(out)
+def with_tickets_list(summary_data: dict) -> dict:
+    """Completa el resumen con la lista de tickets; los reportes antiguos ya la traen guardada."""
+    if "tickets_list" in summary_data:
+        return summary_data
+    tickets = get_period_tickets(summary_data["period_start"], summary_data["period_end"])
+    return {**summary_data, "tickets_list": tickets}
 
 async def generate_and_save_report(days: int = 7):
     """Llamado por el cron job o manualmente para procesar el periodo, guardar en BD y enviar a n8n"""
-    summary = get_period_data(days=days)
+    summary = await run_supabase(lambda: get_period_data(days=days))
     
     year = datetime.now().year
     month = datetime.now().month
@@ -241,9 +104,13 @@ async def generate_and_save_report(days: int = 7):
     }
     
     try:
-        response = client.table("reports").upsert(report_row, on_conflict="report_code").execute()
+        response = await run_supabase(
+            lambda: client.table("reports").upsert(report_row, on_conflict="report_code").execute()
+        )
         if response.data:
             report_id = response.data[0]["id"]
+            # Mismo report_code regenerado: las versiones cacheadas del PDF quedan obsoletas.
+            report_pdf_cache.invalidate(report_id)
             logger.info(f"Reporte {report_code} guardado en BD con ID {report_id}")
             
             # Enviar la notificacion via n8n
@@ -5,12 +5,18 @@ import logging
 logger = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
+WEEKLY_REPORT_DEDUP_SECONDS = 3600
 
 async def generate_weekly_report_job():
     logger.info("Iniciando generacion de reporte semanal por Cron...")
     # Aqui importaremos y llamaremos a la logica de report_service
     # Para evitar circular imports, se importa dentro de la funcion o se estructura despues
     from app.services.report_service import generate_and_save_report
+    from app.routers.data_api import alert_cooldown_store
+    # Con varios workers cada uno tiene su scheduler: solo el primero en tomar el turno genera el reporte.
+    if not alert_cooldown_store.try_acquire("job:weekly_report", WEEKLY_REPORT_DEDUP_SECONDS):
+        logger.info("Reporte semanal ya generado por otro worker; se omite.")
+        return
     try:
         await generate_and_save_report(days=7)
         logger.info("Reporte semanal generado y enviado con exito.")
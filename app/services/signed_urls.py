@@ -0,0 +1,36 @@
+"""URLs firmadas (HMAC) para que n8n descargue el cuerpo renderizado de una alerta."""
+import hashlib
+import hmac
+import os
+import time
+from urllib.parse import urlencode
+
+
+def _signing_secret() -> bytes:
+    # Secreto propio: no se reutiliza la clave que firma las sesiones (JWT).
+    return os.getenv("N8N_BODY_URL_SECRET", "").strip().encode("utf-8")
+
+
+def body_url_signature(alert_id: str, email: str, name: str, expires_at: int) -> str:
+    message = "\n".join((alert_id, email.lower(), name, str(expires_at))).encode("utf-8")
+    return hmac.new(_signing_secret(), message, hashlib.sha256).hexdigest()
+
+
+def build_signed_body_url(base_url: str, alert_id: str, email: str, name: str, ttl_seconds: float) -> str:
+    expires_at = int(time.time() + ttl_seconds)
+    query = urlencode(
+        {
+            "to": email,
+            "name": name,
+            "exp": expires_at,
+            "sig": body_url_signature(alert_id, email, name, expires_at),
+        }
+    )
+    return f"{base_url.rstrip('/')}/api/data/notifications/{alert_id}/email?{query}"
+
+
+def verify_body_url(alert_id: str, email: str, name: str, expires_at: int, signature: str) -> bool:
+    if not _signing_secret() or expires_at < time.time():
+        return False
+    expected = body_url_signature(alert_id, email, name, expires_at)
+    return hmac.compare_digest(expected, signature)
@@ -1,11 +1,18 @@
 import uuid
 import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
 from datetime import datetime
 from app.db.supabase import get_supabase_client
 from app.models.supabase_models import AuditEventCreate, TicketCreate
 import math
 
 logger = logging.getLogger(__name__)
+BATCH_RETRY_ATTEMPTS = 3
+BATCH_RETRY_BACKOFF_SECONDS = 0.5
 
 def generate_ticket_code() -> str:
     # Genera un codigo unico TCK-YYYY-XXXX
@@ -23,12 +30,15 @@ def create_audit_event(event_data: AuditEventCreate) -> str:
         return response.data[0]["id"]
     raise Exception("No se pudo crear el evento de auditoria")
 
+def _priority_for_severity(severity: str) -> str:
+    return "Alta" if severity == "Alta" else ("Media" if severity == "Media" else "Baja")
+
 def create_maintenance_ticket(event_id: str, event_type: str, severity: str) -> str:
     """Crea un ticket vinculado a un evento"""
     client = get_supabase_client()
     
     # Determinar prioridad basada en severidad
-    priority = "Alta" if severity == "Alta" else ("Media" if severity == "Media" else "Baja")
+    priority = _priority_for_severity(severity)
     
     ticket_code = generate_ticket_code()
     ticket_data = TicketCreate(
@@ -43,8 +53,202 @@ def create_maintenance_ticket(event_id: str, event_type: str, severity: str) ->
         return response.data[0]["id"]
     raise Exception("No se pudo crear el ticket de mantenimiento")
 
-def handle_critical_alert(event_type: str, sensor_id: str, severity: str = "Media", irms: float = None, power: float = None, branch_label: str = None):
-    """Función principal que orquesta la auditoría y creación de ticket"""
+def _read_float_env(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, str(default))))
+    except ValueError:
+        return default
+
+
+@dataclass
+class _PendingTicket:
+    event_row: dict
+    ticket_row: dict
+    future: Future
+
+
+class TicketBatcher:
+    """Agrupa alertas durante una ventana corta y las inserta en bloque.
+
+    Cada lote es una sola llamada a ``create_alert_tickets`` (Postgres): el
+    evento y su ticket se insertan juntos o ninguno, y una fila invalida solo
+    falla su propia alerta. Si el sensor ya tiene un ticket abierto del mismo
+    tipo, Postgres suma la ocurrencia a ese ticket en vez de abrir otro. Los
+    IDs de ``audit_events`` se generan en el cliente, asi reintentar un lote no
+    duplica filas ni ocurrencias.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 0.25,
+        max_batch: int = 50,
+        client_factory=get_supabase_client,
+        retry_backoff_seconds: float = BATCH_RETRY_BACKOFF_SECONDS,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_batch = max(1, max_batch)
+        self._client_factory = client_factory
+        self._retry_backoff_seconds = retry_backoff_seconds
+        self._pending: list[_PendingTicket] = []
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._in_flight = 0
+        self.batches_flushed = 0
+        self.tickets_created = 0
+        self.occurrences_merged = 0
+        self.rows_failed = 0
+
+    def submit(self, event: AuditEventCreate, event_type: str, severity: str) -> Future:
+        """Encola el evento y su ticket; el ``Future`` se resuelve con el ID del ticket."""
+        event_row = {"id": str(uuid.uuid4()), **event.model_dump(exclude_none=True)}
+        ticket_row = TicketCreate(
+            event_id=event_row["id"],
+            ticket_code=generate_ticket_code(),
+            issue_type=event_type,
+            priority=_priority_for_severity(severity),
+        ).model_dump(exclude_none=True)
+        pending = _PendingTicket(event_row=event_row, ticket_row=ticket_row, future=Future())
+        if self.window_seconds <= 0:
+            # Sin ventana: lote de una sola alerta en el hilo que llama.
+            self._flush([pending])
+            return pending.future
+        with self._condition:
+            self._pending.append(pending)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="safyra-ticket-batcher", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return pending.future
+
+    def _take_batch(self) -> list[_PendingTicket]:
+        with self._condition:
+            while not self._pending:
+                if not self._condition.wait(timeout=30):
+                    # Sin trabajo: el hilo termina y se vuelve a crear con el siguiente submit.
+                    self._thread = None
+                    return []
+            deadline = time.monotonic() + self.window_seconds
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(timeout=remaining)
+                if not self._pending:
+                    # flush() ya se llevo las alertas de esta ventana.
+                    break
+            batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch :]
+            if batch:
+                self._in_flight += 1
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self._flush(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    def flush(self, timeout: float = 30.0) -> int:
+        """Inserta ya las alertas pendientes (p. ej. al apagar la app), con los mismos
+        reintentos, y espera el lote que el hilo ya tenia en curso. Devuelve cuantas drenó."""
+        with self._condition:
+            pending, self._pending = self._pending, []
+            # Despierta al hilo: sin pendientes, deja de esperar la ventana.
+            self._condition.notify_all()
+        for start in range(0, len(pending), self.max_batch):
+            self._flush(pending[start : start + self.max_batch])
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"[TICKET] Apagado sin esperar {self._in_flight} lote(s) en curso")
+                    break
+                self._condition.wait(timeout=remaining)
+        return len(pending)
+
+    def _insert_batch(self, batch: list[_PendingTicket]) -> list[dict]:
+        rows = [{"event": item.event_row, "ticket": item.ticket_row} for item in batch]
+        for attempt in range(BATCH_RETRY_ATTEMPTS):
+            try:
+                response = self._client_factory().rpc("create_alert_tickets", {"p_rows": rows}).execute()
+                return response.data or []
+            except Exception as exc:
+                if attempt == BATCH_RETRY_ATTEMPTS - 1:
+                    raise
+                print(f"[TICKET] Reintentando lote de {len(batch)} tickets ({attempt + 1}/{BATCH_RETRY_ATTEMPTS}): {exc}")
+                time.sleep(self._retry_backoff_seconds * 2 ** attempt)
+        return []
+
+    def _flush(self, batch: list[_PendingTicket]) -> None:
+        try:
+            results = self._insert_batch(batch)
+        except Exception as exc:
+            print(f"[TICKET] ❌ ERROR insertando lote de {len(batch)} tickets: {exc}")
+            for item in batch:
+                item.future.set_exception(exc)
+            return
+
+        self.batches_flushed += 1
+        results_by_code = {row.get("ticket_code"): row for row in results}
+        for item in batch:
+            result = results_by_code.get(item.ticket_row["ticket_code"]) or {}
+            if not result.get("id"):
+                self.rows_failed += 1
+                error = result.get("error") or "sin respuesta"
+                print(f"[TICKET] ❌ Alerta de {item.event_row.get('sensor_id')} rechazada: {error}")
+                item.future.set_exception(Exception(f"No se pudo crear el ticket de mantenimiento: {error}"))
+                continue
+            created = bool(result.get("created", True))
+            if created:
+                self.tickets_created += 1
+            else:
+                self.occurrences_merged += 1
+            item.future.set_result(result["id"])
+        print(f"[TICKET] Lote insertado: {len(batch)} evento(s) y ticket(s) en 1 llamada")
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "window_seconds": self.window_seconds,
+            "pending": pending,
+            "batches_flushed": self.batches_flushed,
+            "tickets_created": self.tickets_created,
+            "occurrences_merged": self.occurrences_merged,
+            "rows_failed": self.rows_failed,
+        }
+
+
+ticket_batcher = TicketBatcher(
+    window_seconds=_read_float_env("TICKET_BATCH_WINDOW_SECONDS", 0.25),
+    max_batch=int(_read_float_env("TICKET_BATCH_MAX_SIZE", 50)),
+)
+
+
+def _ticket_done(future: Future, event_type: str, sensor_id: str) -> None:
+    """Se ejecuta al insertarse el lote: nunca bloquea a quien reporto la alerta."""
+    try:
+        ticket_id = future.result()
+    except Exception as exc:
+        print(f"[TICKET] ❌ ERROR creando ticket para {sensor_id}: {exc}")
+        logger.error(f"❌ Error al crear ticket para {sensor_id}: {exc}")
+        return
+    print(f"[TICKET] ✅ Ticket {ticket_id} para sensor {sensor_id}")
+    logger.info(f"✅ Ticket: {ticket_id} (sensor={sensor_id}, tipo={event_type})")
+
+
+def handle_critical_alert(event_type: str, sensor_id: str, severity: str = "Media", irms: float = None, power: float = None, branch_label: str = None) -> Future | None:
+    """Función principal que orquesta la auditoría y creación de ticket.
+
+    No espera al insert: devuelve un ``Future`` con el ID del ticket (o ``None``
+    si la alerta no se pudo encolar).
+    """
     print(f"\n[TICKET] Iniciando creación de ticket para sensor={sensor_id}, tipo={event_type}, severidad={severity}")
     try:
         # Validar y limpiar NaN o nulos
@@ -64,14 +268,10 @@ def handle_critical_alert(event_type: str, sensor_id: str, severity: str = "Medi
             power=valid_power,
             branch_label=branch_label or "Desconocido"
         )
-        print(f"[TICKET] Insertando audit_event en Supabase: {event.model_dump()}")
-        event_id = create_audit_event(event)
-        print(f"[TICKET] audit_event creado con ID: {event_id}")
-        
-        ticket_id = create_maintenance_ticket(event_id, event_type, severity)
-        print(f"[TICKET] ✅ Ticket creado con ID: {ticket_id} para sensor {sensor_id}")
-        logger.info(f"✅ Ticket creado: {ticket_id} (sensor={sensor_id}, tipo={event_type})")
-        return ticket_id
+        # Si hay un ticket abierto del mismo sensor y tipo, Postgres le suma la ocurrencia.
+        future = ticket_batcher.submit(event, event_type, severity)
+        future.add_done_callback(lambda done: _ticket_done(done, event_type, sensor_id))
+        return future
     except Exception as e:
         import traceback
         print(f"[TICKET] ❌ ERROR creando ticket para {sensor_id}: {str(e)}")
@@ -0,0 +1,78 @@
+"""Calentamiento de caches y conexiones al arrancar, y estado para ``/ready``."""
+import asyncio
+import os
+import time
+from collections.abc import Callable, Mapping
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+
+def _warmup_timeout_seconds() -> float:
+    try:
+        return max(1.0, float(os.getenv("WARMUP_TIMEOUT_SECONDS", "20")))
+    except ValueError:
+        return 20.0
+
+
+class WarmupState:
+    """Resultado por paso; la instancia queda lista al terminar el calentamiento,
+    aunque algun paso falle (se informa como ``degraded``)."""
+
+    def __init__(self) -> None:
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.steps: dict[str, dict[str, Any]] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    async def run(self, steps: Mapping[str, Callable[[], Any]], timeout_seconds: float | None = None) -> None:
+        """Ejecuta los pasos en paralelo (cada uno en el threadpool) con un timeout comun."""
+        timeout_seconds = timeout_seconds or _warmup_timeout_seconds()
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.steps = {}
+        await asyncio.gather(*(self._run_step(name, step, timeout_seconds) for name, step in steps.items()))
+        self.finished_at = time.monotonic()
+        print(f"[WARMUP] Listo en {self.elapsed_ms():.0f} ms: {self.status()}")
+
+    async def _run_step(self, name: str, step: Callable[[], Any], timeout_seconds: float) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(run_in_threadpool(step), timeout=timeout_seconds)
+            self.steps[name] = {"ok": True}
+        except asyncio.TimeoutError:
+            self.steps[name] = {"ok": False, "error": "timeout"}
+        except Exception as exc:
+            self.steps[name] = {"ok": False, "error": str(exc)[:200]}
+        self.steps[name]["ms"] = round((time.monotonic() - started) * 1000, 1)
+
+    def elapsed_ms(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return ((self.finished_at or time.monotonic()) - self.started_at) * 1000
+
+    def status(self) -> str:
+        if self.started_at is None:
+            return "pending"
+        if not self.ready:
+            return "warming"
+        return "ready" if all(step["ok"] for step in self.steps.values()) else "degraded"
+
+    def reset(self) -> None:
+        self.started_at = None
+        self.finished_at = None
+        self.steps = {}
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "status": self.status(),
+            "ready": self.ready,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "steps": dict(self.steps),
+        }
+
+
+warmup_state = WarmupState()
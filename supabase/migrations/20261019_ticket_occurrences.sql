@@ -0,0 +1,19 @@
+-- Deduplicacion de tickets abiertos: las alertas repetidas del mismo sensor y tipo
+-- incrementan el contador del ticket abierto en vez de crear uno nuevo.
+ALTER TABLE maintenance_tickets
+    ADD COLUMN IF NOT EXISTS occurrence_count integer NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS last_seen_at timestamptz;
+
+-- Unica definicion de "ticket cerrado": la usan este indice, la deduplicacion por
+-- open_key (20261023) y el sellado de closed_at (20261022).
+CREATE OR REPLACE FUNCTION ticket_is_closed(p_status text)
+RETURNS boolean
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT lower(btrim(COALESCE(p_status, ''))) IN ('cerrado', 'resuelto', 'closed');
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_tickets_open
+    ON maintenance_tickets (issue_type, created_at)
+    WHERE NOT ticket_is_closed(status);
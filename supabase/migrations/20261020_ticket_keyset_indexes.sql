@@ -0,0 +1,12 @@
+-- Paginacion keyset de GET /api/tickets/: orden (created_at DESC, id DESC) y filtros frecuentes.
+CREATE INDEX IF NOT EXISTS idx_maintenance_tickets_keyset
+    ON maintenance_tickets (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_tickets_status_keyset
+    ON maintenance_tickets (status, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_tickets_priority_keyset
+    ON maintenance_tickets (priority, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_audit_events_sensor
+    ON audit_events (sensor_id);
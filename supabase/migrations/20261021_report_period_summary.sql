@@ -0,0 +1,34 @@
+-- Agregados de reportes calculados en Postgres: el backend ya no descarga cada
+-- evento y ticket del periodo para sumarlos en Python.
+CREATE INDEX IF NOT EXISTS idx_audit_events_detected_at
+    ON audit_events (detected_at);
+
+CREATE OR REPLACE FUNCTION report_period_summary(period_start timestamptz, period_end timestamptz)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+AS $$
+    WITH events AS (
+        SELECT
+            irms,
+            COALESCE(NULLIF(branch_label, ''), NULLIF(sensor_id, ''), 'Desconocido') AS branch,
+            COALESCE(NULLIF(event_type, ''), 'desconocido') AS event_type
+        FROM audit_events
+        WHERE detected_at BETWEEN period_start AND period_end
+    )
+    SELECT jsonb_build_object(
+        'total_alerts', (SELECT count(*) FROM events),
+        'peak_current', (SELECT COALESCE(max(irms), 0) FROM events),
+        'affected_branches', (
+            SELECT COALESCE(jsonb_agg(DISTINCT branch ORDER BY branch), '[]'::jsonb) FROM events
+        ),
+        'alerts_by_type', (
+            SELECT COALESCE(jsonb_object_agg(event_type, total), '{}'::jsonb)
+            FROM (SELECT event_type, count(*) AS total FROM events GROUP BY event_type) AS by_type
+        ),
+        'total_tickets', (
+            SELECT count(*) FROM maintenance_tickets
+            WHERE created_at BETWEEN period_start AND period_end
+        )
+    );
+$$;
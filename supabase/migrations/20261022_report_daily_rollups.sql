@@ -0,0 +1,221 @@
+-- Agregados diarios que se actualizan con cada alerta y cierre de ticket; los
+-- reportes solo suman las filas del periodo (a lo sumo dias x tipos x ramales).
+-- Los mantienen triggers sobre audit_events y maintenance_tickets, en la misma
+-- transaccion que la fila fuente: un agregado no puede quedar atras de su evento.
+-- No hay agregado de energia (kWh): las lecturas de potencia viven solo en Firebase
+-- (/history) y aqui solo llegan las alertas, asi que un trigger no puede integrar
+-- potencia x intervalo. power_sum es la suma de la potencia de las alertas.
+CREATE TABLE IF NOT EXISTS report_daily_rollups (
+    day date NOT NULL,
+    event_type text NOT NULL,
+    branch_label text NOT NULL,
+    alerts integer NOT NULL DEFAULT 0,
+    tickets_opened integer NOT NULL DEFAULT 0,
+    tickets_closed integer NOT NULL DEFAULT 0,
+    peak_current double precision NOT NULL DEFAULT 0,
+    peak_power double precision NOT NULL DEFAULT 0,
+    power_sum double precision NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, event_type, branch_label)
+);
+
+CREATE OR REPLACE FUNCTION bump_report_rollup(
+    p_day date,
+    p_event_type text,
+    p_branch_label text,
+    p_alerts integer,
+    p_tickets_opened integer,
+    p_tickets_closed integer,
+    p_irms double precision,
+    p_power double precision
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO report_daily_rollups AS r
+        (day, event_type, branch_label, alerts, tickets_opened, tickets_closed, peak_current, peak_power, power_sum)
+    VALUES
+        (p_day, p_event_type, p_branch_label, p_alerts, p_tickets_opened, p_tickets_closed,
+         p_irms, p_power, p_power * p_alerts)
+    ON CONFLICT (day, event_type, branch_label) DO UPDATE SET
+        alerts = r.alerts + EXCLUDED.alerts,
+        tickets_opened = r.tickets_opened + EXCLUDED.tickets_opened,
+        tickets_closed = r.tickets_closed + EXCLUDED.tickets_closed,
+        peak_current = GREATEST(r.peak_current, EXCLUDED.peak_current),
+        peak_power = GREATEST(r.peak_power, EXCLUDED.peak_power),
+        power_sum = r.power_sum + EXCLUDED.power_sum;
+$$;
+
+-- Momento del cierre: los cierres se imputan al dia en que ocurrieron.
+ALTER TABLE maintenance_tickets
+    ADD COLUMN IF NOT EXISTS closed_at timestamptz;
+
+-- Tickets cerrados antes de esta migracion: sin registro del cierre, se usa la
+-- ultima ocurrencia o la creacion como aproximacion.
+UPDATE maintenance_tickets
+SET closed_at = COALESCE(last_seen_at, created_at)
+WHERE closed_at IS NULL
+  AND ticket_is_closed(status);
+
+CREATE OR REPLACE FUNCTION report_rollup_on_audit_event()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM bump_report_rollup(
+        (NEW.detected_at AT TIME ZONE 'America/Lima')::date,
+        COALESCE(NULLIF(NEW.event_type, ''), 'desconocido'),
+        COALESCE(NULLIF(NEW.branch_label, ''), NULLIF(NEW.sensor_id, ''), 'Desconocido'),
+        1, 0, 0,
+        COALESCE(NEW.irms, 0),
+        COALESCE(NEW.power, 0)
+    );
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_report_rollup_audit_event ON audit_events;
+CREATE TRIGGER trg_report_rollup_audit_event
+    AFTER INSERT ON audit_events
+    FOR EACH ROW EXECUTE FUNCTION report_rollup_on_audit_event();
+
+-- Sella o limpia closed_at cuando el ticket entra o sale de un estado cerrado.
+CREATE OR REPLACE FUNCTION stamp_ticket_closed_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    was_closed boolean := ticket_is_closed(OLD.status);
+    is_closed boolean := ticket_is_closed(NEW.status);
+BEGIN
+    IF is_closed AND NOT was_closed THEN
+        NEW.closed_at := now();
+    ELSIF was_closed AND NOT is_closed THEN
+        NEW.closed_at := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_stamp_ticket_closed_at ON maintenance_tickets;
+CREATE TRIGGER trg_stamp_ticket_closed_at
+    BEFORE UPDATE OF status ON maintenance_tickets
+    FOR EACH ROW EXECUTE FUNCTION stamp_ticket_closed_at();
+
+-- Tickets abiertos y cerrados, con el tipo y ramal del evento que los origino.
+CREATE OR REPLACE FUNCTION report_rollup_on_ticket()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_event_type text;
+    v_branch text;
+BEGIN
+    SELECT
+        COALESCE(NULLIF(e.event_type, ''), 'desconocido'),
+        COALESCE(NULLIF(e.branch_label, ''), NULLIF(e.sensor_id, ''), 'Desconocido')
+    INTO v_event_type, v_branch
+    FROM audit_events e
+    WHERE e.id = NEW.event_id;
+    v_event_type := COALESCE(v_event_type, NULLIF(NEW.issue_type, ''), 'desconocido');
+    v_branch := COALESCE(v_branch, 'Desconocido');
+
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_report_rollup(
+            (NEW.created_at AT TIME ZONE 'America/Lima')::date, v_event_type, v_branch, 0, 1, 0, 0, 0
+        );
+    ELSIF OLD.closed_at IS DISTINCT FROM NEW.closed_at THEN
+        -- Reapertura: se descuenta el cierre del dia en que se habia contado.
+        IF OLD.closed_at IS NOT NULL THEN
+            PERFORM bump_report_rollup(
+                (OLD.closed_at AT TIME ZONE 'America/Lima')::date, v_event_type, v_branch, 0, 0, -1, 0, 0
+            );
+        END IF;
+        IF NEW.closed_at IS NOT NULL THEN
+            PERFORM bump_report_rollup(
+                (NEW.closed_at AT TIME ZONE 'America/Lima')::date, v_event_type, v_branch, 0, 0, 1, 0, 0
+            );
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_report_rollup_ticket ON maintenance_tickets;
+CREATE TRIGGER trg_report_rollup_ticket
+    AFTER INSERT OR UPDATE OF closed_at, status ON maintenance_tickets
+    FOR EACH ROW EXECUTE FUNCTION report_rollup_on_ticket();
+
+-- Reconstruccion de un rango de dias a partir de las tablas fuente, con las
+-- mismas reglas que los triggers: alertas por detected_at, tickets abiertos
+-- por created_at y cerrados por closed_at.
+CREATE OR REPLACE FUNCTION rebuild_report_rollups(p_from date, p_to date)
+RETURNS void
+LANGUAGE sql
+AS $$
+    DELETE FROM report_daily_rollups WHERE day BETWEEN p_from AND p_to;
+
+    WITH alerts AS (
+        SELECT
+            (e.detected_at AT TIME ZONE 'America/Lima')::date AS day,
+            COALESCE(NULLIF(e.event_type, ''), 'desconocido') AS event_type,
+            COALESCE(NULLIF(e.branch_label, ''), NULLIF(e.sensor_id, ''), 'Desconocido') AS branch_label,
+            count(*) AS alerts,
+            0 AS tickets_opened,
+            0 AS tickets_closed,
+            COALESCE(max(e.irms), 0) AS peak_current,
+            COALESCE(max(e.power), 0) AS peak_power,
+            COALESCE(sum(e.power), 0) AS power_sum
+        FROM audit_events e
+        WHERE (e.detected_at AT TIME ZONE 'America/Lima')::date BETWEEN p_from AND p_to
+        GROUP BY 1, 2, 3
+    ),
+    tickets AS (
+        SELECT
+            t.created_at,
+            t.closed_at,
+            COALESCE(NULLIF(e.event_type, ''), NULLIF(t.issue_type, ''), 'desconocido') AS event_type,
+            COALESCE(NULLIF(e.branch_label, ''), NULLIF(e.sensor_id, ''), 'Desconocido') AS branch_label
+        FROM maintenance_tickets t
+        LEFT JOIN audit_events e ON e.id = t.event_id
+    ),
+    opened AS (
+        SELECT (created_at AT TIME ZONE 'America/Lima')::date AS day, event_type, branch_label,
+               0 AS alerts, count(*) AS tickets_opened, 0 AS tickets_closed,
+               0 AS peak_current, 0 AS peak_power, 0 AS power_sum
+        FROM tickets
+        WHERE (created_at AT TIME ZONE 'America/Lima')::date BETWEEN p_from AND p_to
+        GROUP BY 1, 2, 3
+    ),
+    closed AS (
+        SELECT (closed_at AT TIME ZONE 'America/Lima')::date AS day, event_type, branch_label,
+               0 AS alerts, 0 AS tickets_opened, count(*) AS tickets_closed,
+               0 AS peak_current, 0 AS peak_power, 0 AS power_sum
+        FROM tickets
+        WHERE closed_at IS NOT NULL
+          AND (closed_at AT TIME ZONE 'America/Lima')::date BETWEEN p_from AND p_to
+        GROUP BY 1, 2, 3
+    )
+    INSERT INTO report_daily_rollups
+        (day, event_type, branch_label, alerts, tickets_opened, tickets_closed, peak_current, peak_power, power_sum)
+    SELECT day, event_type, branch_label,
+           sum(alerts), sum(tickets_opened), sum(tickets_closed),
+           max(peak_current), max(peak_power), sum(power_sum)
+    FROM (
+        SELECT * FROM alerts
+        UNION ALL SELECT * FROM opened
+        UNION ALL SELECT * FROM closed
+    ) AS parts
+    GROUP BY 1, 2, 3;
+$$;
+
+-- Backfill de todo el historico: los reportes pueden leer solo los agregados.
+SELECT rebuild_report_rollups(
+    COALESCE(
+        LEAST(
+            (SELECT min((detected_at AT TIME ZONE 'America/Lima')::date) FROM audit_events),
+            (SELECT min((created_at AT TIME ZONE 'America/Lima')::date) FROM maintenance_tickets)
+        ),
+        current_date
+    ),
+    (now() AT TIME ZONE 'America/Lima')::date
+);
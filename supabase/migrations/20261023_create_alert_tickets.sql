@@ -0,0 +1,120 @@
+-- Lote de alertas en una sola llamada (create_alert_tickets): cada fila inserta
+-- su audit_event y su ticket dentro de un subbloque, asi ambos entran juntos o
+-- ninguno y una fila invalida no tumba el resto del lote.
+--
+-- Deduplicacion de tickets abiertos en Postgres: cada ticket abierto lleva
+-- open_key = '<sensor_id>:<issue_type>' con un indice unico parcial, asi una
+-- alerta repetida suma occurrence_count en el servidor (sin contar desde el
+-- backend) y todos los workers ven el mismo ticket abierto.
+ALTER TABLE maintenance_tickets
+    ADD COLUMN IF NOT EXISTS open_key text;
+
+-- Tickets abiertos actuales: si hay duplicados previos, el mas reciente queda como destino.
+UPDATE maintenance_tickets AS t
+SET open_key = latest.open_key
+FROM (
+    SELECT DISTINCT ON (e.sensor_id, t2.issue_type)
+        t2.id,
+        e.sensor_id || ':' || t2.issue_type AS open_key
+    FROM maintenance_tickets t2
+    JOIN audit_events e ON e.id = t2.event_id
+    WHERE NOT ticket_is_closed(t2.status)
+      AND e.sensor_id IS NOT NULL
+    ORDER BY e.sensor_id, t2.issue_type, t2.created_at DESC
+) AS latest
+WHERE t.id = latest.id AND t.open_key IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_maintenance_tickets_open_key
+    ON maintenance_tickets (open_key)
+    WHERE open_key IS NOT NULL;
+
+-- Al cerrarse, el ticket deja de absorber ocurrencias; la siguiente alerta abre uno nuevo.
+CREATE OR REPLACE FUNCTION release_ticket_open_key()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF ticket_is_closed(NEW.status) THEN
+        NEW.open_key := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_release_ticket_open_key ON maintenance_tickets;
+CREATE TRIGGER trg_release_ticket_open_key
+    BEFORE UPDATE OF status ON maintenance_tickets
+    FOR EACH ROW EXECUTE FUNCTION release_ticket_open_key();
+
+-- p_rows: [{"event": {...audit_events}, "ticket": {...maintenance_tickets}}, ...]
+-- El ticket se inserta con upsert sobre open_key: si ya hay uno abierto para el
+-- sensor y tipo, se incrementa su contador.
+-- Devuelve [{"ticket_code", "id", "created"} | {"ticket_code", "error"}, ...].
+-- Es idempotente por id de evento: el backend puede reintentar el lote.
+CREATE OR REPLACE FUNCTION create_alert_tickets(p_rows jsonb)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    item jsonb;
+    ev jsonb;
+    tk jsonb;
+    v_open_key text;
+    v_inserted integer;
+    v_ticket_id uuid;
+    v_created boolean;
+    results jsonb := '[]'::jsonb;
+BEGIN
+    FOR item IN SELECT value FROM jsonb_array_elements(p_rows) LOOP
+        ev := item->'event';
+        tk := item->'ticket';
+        v_open_key := (ev->>'sensor_id') || ':' || (tk->>'issue_type');
+        BEGIN
+            INSERT INTO audit_events (id, event_type, sensor_id, branch_label, irms, power, severity, source)
+            VALUES (
+                (ev->>'id')::uuid,
+                ev->>'event_type',
+                ev->>'sensor_id',
+                ev->>'branch_label',
+                (ev->>'irms')::double precision,
+                (ev->>'power')::double precision,
+                COALESCE(ev->>'severity', 'Media'),
+                COALESCE(ev->>'source', 'Firebase')
+            )
+            ON CONFLICT (id) DO NOTHING;
+            GET DIAGNOSTICS v_inserted = ROW_COUNT;
+
+            IF v_inserted = 0 THEN
+                -- Reintento de un lote ya aplicado: la ocurrencia no se vuelve a contar.
+                SELECT id, ticket_code = tk->>'ticket_code' INTO v_ticket_id, v_created
+                FROM maintenance_tickets
+                WHERE ticket_code = tk->>'ticket_code' OR open_key = v_open_key
+                ORDER BY (ticket_code = tk->>'ticket_code') DESC
+                LIMIT 1;
+            ELSE
+                INSERT INTO maintenance_tickets (event_id, ticket_code, issue_type, priority, assigned_to, open_key, last_seen_at)
+                VALUES (
+                    (tk->>'event_id')::uuid,
+                    tk->>'ticket_code',
+                    tk->>'issue_type',
+                    tk->>'priority',
+                    tk->>'assigned_to',
+                    v_open_key,
+                    now()
+                )
+                ON CONFLICT (open_key) WHERE open_key IS NOT NULL DO UPDATE SET
+                    occurrence_count = maintenance_tickets.occurrence_count + 1,
+                    last_seen_at = now()
+                RETURNING id, (xmax = 0) INTO v_ticket_id, v_created;
+            END IF;
+
+            results := results || jsonb_build_object(
+                'ticket_code', tk->>'ticket_code', 'id', v_ticket_id, 'created', COALESCE(v_created, false)
+            );
+        EXCEPTION WHEN OTHERS THEN
+            results := results || jsonb_build_object('ticket_code', tk->>'ticket_code', 'error', SQLERRM);
+        END;
+    END LOOP;
+    RETURN results;
+END;
+$$;
@@ -0,0 +1,26 @@
+-- Ultima edicion visible de un ticket: forma parte de la clave del PDF cacheado
+-- de cada reporte (GET /api/reports/{id}/download), que lista los tickets del periodo.
+ALTER TABLE maintenance_tickets
+    ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+
+-- Solo cambian los campos que muestra el PDF; sumar ocurrencias no invalida reportes.
+CREATE OR REPLACE FUNCTION touch_ticket_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF (NEW.ticket_code, NEW.issue_type, NEW.priority, NEW.status, NEW.created_at)
+        IS DISTINCT FROM (OLD.ticket_code, OLD.issue_type, OLD.priority, OLD.status, OLD.created_at) THEN
+        NEW.updated_at := now();
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_touch_ticket_updated_at ON maintenance_tickets;
+CREATE TRIGGER trg_touch_ticket_updated_at
+    BEFORE UPDATE ON maintenance_tickets
+    FOR EACH ROW EXECUTE FUNCTION touch_ticket_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_tickets_created_updated
+    ON maintenance_tickets (created_at, updated_at DESC);
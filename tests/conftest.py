@@ -7,6 +7,7 @@ Incluye fixtures compartidos y configuraciÃ³n de pytest
 import pytest
 import os
 import secrets
+import tempfile
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
 from datetime import datetime
@@ -36,9 +37,16 @@ os.environ["TEST_ADMIN_PASSWORD"] = TEST_ADMIN_PASSWORD
 os.environ["TERMS_VERSION"] = "2026-test"
 os.environ["TERMS_REQUIRED_ROLES"] = "admin,auditor"
 os.environ["SAFYRA_IOT_TOKEN"] = "test-iot-token"
+os.environ["NOTIFICATION_OUTBOX_PATH"] = ":memory:"
+os.environ["ALERT_COALESCE_WINDOW_SECONDS"] = "0"
+os.environ["ALERT_COOLDOWN_STORE"] = "memory"
+os.environ["REPORT_PDF_CACHE_DISK_MB"] = "0"
+os.environ["DOCUMENT_RENDER_WORKERS"] = "0"
+os.environ["EXPORT_SPOOL_DIR"] = tempfile.mkdtemp(prefix="safyra_exports_test_")
 
 from app.main import app
-from app.routers.auth_api import create_access_token, fake_users_db, fake_consent_db, pwd_context, TERMS_VERSION
+from app.db.firebase import invalidate_alert_recipient_directory, invalidate_config_cache
+from app.routers.auth_api import clear_auth_caches, create_access_token, fake_users_db, fake_consent_db, pwd_context, TERMS_VERSION
 
 fake_users_db.update({
     "auditor": {
@@ -170,6 +178,9 @@ def mock_thresholds():
 @pytest.fixture(autouse=True)
 def reset_firebase_mock():
     """Resetea los mocks de Firebase antes de cada prueba"""
+    invalidate_alert_recipient_directory()
+    invalidate_config_cache()
+    clear_auth_caches()
     with patch('app.db.firebase.db') as mock_db:
         yield mock_db
 
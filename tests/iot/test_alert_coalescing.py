@@ -0,0 +1,234 @@
+import asyncio
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.routers import data_api
+from app.services.alert_coalescer import AlertCoalescer, SqliteAlertWindowStore
+from app.services.notifications import build_queued_payload
+
+
+def _overload_branch(sensor_id: str, irms: float) -> dict:
+    return {
+        "id": sensor_id,
+        "room_name": "Laboratorio de Computo",
+        "schedule_room_id": "LAB-PC-01",
+        "circuito": sensor_id,
+        "irms": irms,
+        "potencia": round(irms * 220, 1),
+        "is_overload": True,
+        "is_out_of_schedule": False,
+        "timestamp": "2026-06-03T06:15:30-05:00",
+        "estado": "Sobrecarga",
+        "threshold": {"corriente": 11.0, "potencia": 2420.0},
+        "schedule": {"is_scheduled_now": True, "blocked_by_no_class": False, "label": "En horario"},
+    }
+
+
+async def _queue_in_window(sensors: list[dict]) -> list[dict]:
+    results = [data_api._queue_sensor_alert(sensor) for sensor in sensors]
+    await asyncio.sleep(0.08)
+    await data_api.alert_coalescer.flush()
+    return results
+
+
+@pytest.mark.unitaria
+class TestAlertCoalescing:
+    def setup_method(self) -> None:
+        data_api._alert_notification_cache.clear()
+        data_api.alert_coalescer.reset()
+
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=[])
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification", return_value={"queued": True})
+    def test_sobrecarga_de_varios_ramales_emite_la_primera_y_un_resumen(self, mock_queue, mock_ticket, mock_contacts):
+        sensors = [_overload_branch("C-01", 12.5), _overload_branch("C-02", 16.0), _overload_branch("C-03", 13.1)]
+
+        with patch.dict("os.environ", {"ALERT_COALESCE_WINDOW_SECONDS": "0.03"}):
+            results = asyncio.run(_queue_in_window(sensors))
+            payload = build_queued_payload(*mock_queue.call_args.args)
+
+        assert [result.get("reason", "") for result in results] == ["", "coalesced", "coalesced"]
+        assert mock_queue.call_count == 2
+        assert mock_queue.call_args_list[0].args[1]["sensor"]["id"] == "C-01"
+        mock_ticket.assert_called_once()
+        assert mock_ticket.call_args.kwargs["sensor_id"] == "C-02"
+        assert mock_ticket.call_args.kwargs["branch_label"] == "C-01, C-02, C-03"
+        assert payload["branch_count"] == 3
+        assert [branch["sensor_id"] for branch in payload["affected_branches"]] == ["C-01", "C-02", "C-03"]
+        assert "Ramal monitoreado" in payload["notification"]["email_html"]
+        assert "C-01, C-02, C-03" in payload["notification"]["whatsapp_text"]
+        assert data_api.alert_coalescer.snapshot()["alerts_coalesced"] == 2
+
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification", return_value={"queued": True})
+    def test_alerta_aislada_sale_sin_esperar_la_ventana(self, mock_queue, mock_ticket):
+        async def scenario():
+            result = data_api._queue_sensor_alert(_overload_branch("C-06", 14.0))
+            mock_queue.assert_called_once()
+            assert data_api.alert_coalescer.snapshot()["open_windows"] == 1
+            await data_api.alert_coalescer.flush()
+            return result
+
+        with patch.dict("os.environ", {"ALERT_COALESCE_WINDOW_SECONDS": "3600"}):
+            result = asyncio.run(scenario())
+
+        assert result["queued"] is True
+        mock_queue.assert_called_once()
+        mock_ticket.assert_not_called()
+
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=[])
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    def test_digest_fuera_de_horario_usa_su_propia_ventana(self, mock_queue, mock_ticket, mock_contacts):
+        sensor = {**_overload_branch("C-04", 0.9), "is_overload": False, "is_out_of_schedule": True}
+        env = {
+            "ALERT_COALESCE_WINDOW_SECONDS": "0",
+            "ALERT_OUT_OF_SCHEDULE_MODE": "digest",
+            "ALERT_DIGEST_WINDOW_SECONDS": "3600",
+        }
+
+        async def scenario():
+            result = data_api._queue_sensor_alert(sensor)
+            assert data_api.alert_coalescer.snapshot()["open_windows"] == 1
+            mock_queue.assert_not_called()
+            await data_api.alert_coalescer.flush()
+            return result
+
+        with patch.dict("os.environ", env):
+            result = asyncio.run(scenario())
+            payload = build_queued_payload(*mock_queue.call_args.args)
+
+        assert result["queued"] is True
+        assert payload["digest"] is True
+        assert payload["alert_type"] == "out_of_schedule_consumption"
+
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    def test_ventana_cero_mantiene_envio_inmediato(self, mock_queue, mock_ticket):
+        mock_queue.return_value = {"queued": True}
+
+        result = data_api._queue_sensor_alert(_overload_branch("C-05", 14.0))
+
+        assert result["queued"] is True
+        mock_queue.assert_called_once()
+        assert data_api.alert_coalescer.snapshot()["open_windows"] == 0
+
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification", return_value={"queued": True})
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_ingesta_escribe_cooldown_y_outbox_fuera_del_event_loop(self, mock_record, mock_queue, mock_ticket, test_client):
+        def running_loop():
+            try:
+                return asyncio.get_running_loop()
+            except RuntimeError:
+                return None
+
+        loops = []
+        store = Mock()
+        store.try_acquire.side_effect = lambda *args: loops.append(running_loop()) or True
+        mock_queue.side_effect = lambda *args: loops.append(running_loop()) or {"queued": True}
+        mock_record.return_value = _overload_branch("C-06", 14.0)
+
+        with patch.object(data_api, "alert_cooldown_store", store):
+            response = test_client.post(
+                "/api/data/iot/readings",
+                headers={"X-Safyra-Iot-Token": "test-iot-token"},
+                json={"sensor_id": "C-06", "irms": 14.0, "potencia": 3080.0},
+            )
+
+        assert response.status_code == 201
+        assert response.json()["notification"]["queued"] is True
+        assert loops == [None, None]
+
+
+@pytest.mark.unitaria
+class TestAlertCoalescer:
+    def test_ventana_abierta_desde_el_threadpool_se_cierra_en_el_loop(self):
+        emitted = []
+
+        async def emit(room_id, event_type, sensors):
+            emitted.append((room_id, event_type, [sensor["id"] for sensor in sensors]))
+
+        coalescer = AlertCoalescer(emit)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            first = await asyncio.to_thread(coalescer.add, "LAB-1", "overload", {"id": "C-01"}, 0.05, loop)
+            second = await asyncio.to_thread(coalescer.add, "LAB-1", "overload", {"id": "C-02"}, 0.05, loop)
+            await asyncio.sleep(0.1)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+
+        assert first["window_open"] is True and second["coalesced"] is True
+        assert emitted == [("LAB-1", "overload", ["C-01", "C-02"])]
+    def test_ventanas_independientes_por_sala_y_tipo(self):
+        emitted = []
+
+        async def emit(room_id, event_type, sensors):
+            emitted.append((room_id, event_type, sorted(sensor["id"] for sensor in sensors)))
+
+        coalescer = AlertCoalescer(emit)
+
+        async def scenario():
+            coalescer.add("LAB-1", "overload", {"id": "C-01"}, 60)
+            coalescer.add("LAB-1", "overload", {"id": "C-01", "irms": 2}, 60)
+            coalescer.add("LAB-1", "overload", {"id": "C-02"}, 60)
+            coalescer.add("LAB-2", "overload", {"id": "C-09"}, 60)
+            coalescer.add("LAB-1", "out_of_schedule_consumption", {"id": "C-01"}, 60)
+            await coalescer.flush()
+
+        asyncio.run(scenario())
+
+        assert sorted(emitted) == [
+            ("LAB-1", "out_of_schedule_consumption", ["C-01"]),
+            ("LAB-1", "overload", ["C-01", "C-02"]),
+            ("LAB-2", "overload", ["C-09"]),
+        ]
+
+    def test_varios_workers_comparten_la_ventana_en_sqlite(self, tmp_path):
+        emitted = []
+
+        async def emit(room_id, event_type, sensors):
+            emitted.append((room_id, event_type, sorted(sensor["id"] for sensor in sensors)))
+
+        path = str(tmp_path / "alertas.sqlite3")
+        worker_a = AlertCoalescer(emit, SqliteAlertWindowStore(path))
+        worker_b = AlertCoalescer(emit, SqliteAlertWindowStore(path))
+
+        async def scenario():
+            first = worker_a.add("LAB-1", "overload", {"id": "C-01"}, 0.05)
+            second = worker_b.add("LAB-1", "overload", {"id": "C-02"}, 0.05)
+            await asyncio.sleep(0.1)
+            await worker_a.flush()
+            await worker_b.flush()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+
+        assert first["coalesced"] is False and second["coalesced"] is True
+        assert emitted == [("LAB-1", "overload", ["C-01", "C-02"])]
+
+    def test_ventana_abierta_sobrevive_a_un_reinicio(self, tmp_path):
+        emitted = []
+
+        async def emit(room_id, event_type, sensors):
+            emitted.append((room_id, event_type, [sensor["id"] for sensor in sensors]))
+
+        path = str(tmp_path / "alertas.sqlite3")
+
+        async def before_restart():
+            AlertCoalescer(emit, SqliteAlertWindowStore(path)).add("LAB-1", "overload", {"id": "C-03"}, 0.05)
+
+        async def after_restart():
+            coalescer = AlertCoalescer(emit, SqliteAlertWindowStore(path))
+            recovered = coalescer.recover()
+            await asyncio.sleep(0.1)
+            await coalescer.flush()
+            return recovered
+
+        asyncio.run(before_restart())
+        assert emitted == []
+        assert asyncio.run(after_restart()) == 1
+        assert emitted == [("LAB-1", "overload", ["C-03"])]
@@ -0,0 +1,127 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.routers import data_api
+from app.services import admission_control
+from app.services.admission_control import AdmissionController, TokenBucket, retry_after_header
+from app.services.ingest_idempotency import ingest_idempotency_cache
+
+IOT_HEADERS = {"X-Safyra-Iot-Token": "test-iot-token"}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.unitaria
+class TestTokenBucket:
+    def test_recarga_perezosa_sin_temporizadores(self):
+        bucket = TokenBucket(rate_per_second=2.0, capacity=2.0, tokens=0.0, updated_at=10.0)
+
+        assert bucket.wait_seconds(10.0) == pytest.approx(0.5)
+        assert bucket.wait_seconds(10.5) == 0.0
+        assert bucket.wait_seconds(100.0) == 0.0
+        assert bucket.tokens == 2.0
+
+
+@pytest.mark.unitaria
+class TestAdmissionController:
+    def test_bucket_por_sensor_rechaza_exceso(self):
+        clock = FakeClock()
+        controller = AdmissionController(sensor_rate_per_second=1.0, sensor_burst=2.0, token_burst=100.0, clock=clock)
+
+        decisions = [controller.admit("C-01", "tok") for _ in range(3)]
+
+        assert [decision.admitted for decision in decisions] == [True, True, False]
+        assert decisions[2].scope == "sensor"
+        assert decisions[2].retry_after_seconds == pytest.approx(1.0)
+        assert controller.admit("C-02", "tok").admitted is True
+        assert controller.snapshot()["rejected"] == {"sensor": 1, "token": 0}
+
+        clock.now += 1.0
+        assert controller.admit("C-01", "tok").admitted is True
+
+    def test_bucket_por_token_limita_todos_los_sensores(self):
+        controller = AdmissionController(sensor_burst=10.0, token_rate_per_second=0.5, token_burst=2.0, clock=FakeClock())
+
+        results = [controller.admit(f"C-0{index}", "tok").admitted for index in range(1, 4)]
+
+        assert results == [True, True, False]
+        assert controller.snapshot()["rejected"]["token"] == 1
+        assert controller.admit("C-04", "otro-token").admitted is True
+
+    def test_rechazo_no_consume_el_otro_bucket(self):
+        controller = AdmissionController(sensor_rate_per_second=0.1, sensor_burst=1.0, token_rate_per_second=0.1, token_burst=2.0, clock=FakeClock())
+
+        controller.admit("C-01", "tok")
+        controller.admit("C-01", "tok")
+
+        assert controller.admit("C-02", "tok").admitted is True
+
+    def test_retry_after_redondea_hacia_arriba(self):
+        decision = admission_control.AdmissionDecision(False, 0.2, "sensor")
+
+        assert retry_after_header(decision) == "1"
+
+
+@pytest.mark.unitaria
+class TestIngestAdmission:
+    def setup_method(self) -> None:
+        data_api._alert_notification_cache.clear()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_responde_429_con_retry_after_antes_de_tocar_firebase(self, mock_record, test_client, monkeypatch):
+        controller = AdmissionController(sensor_rate_per_second=0.5, sensor_burst=1.0, clock=FakeClock())
+        monkeypatch.setattr(admission_control, "iot_admission_controller", controller)
+        mock_record.return_value = {"id": "C-01", "is_overload": False, "is_out_of_schedule": False}
+        body = {"sensor_id": "C-01", "irms": 0.1}
+
+        accepted = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+        rejected = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+
+        assert accepted.status_code == 201
+        assert rejected.status_code == 429
+        assert rejected.headers["Retry-After"] == "2"
+        mock_record.assert_called_once()
+        assert controller.snapshot()["rejected_total"] == 1
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_reintento_ya_procesado_no_consume_cupo(self, mock_record, test_client, monkeypatch):
+        controller = AdmissionController(sensor_rate_per_second=0.5, sensor_burst=1.0, clock=FakeClock())
+        monkeypatch.setattr(admission_control, "iot_admission_controller", controller)
+        ingest_idempotency_cache.clear()
+        mock_record.return_value = {"id": "C-01", "is_overload": False, "is_out_of_schedule": False}
+        body = {"sensor_id": "C-01", "irms": 0.1, "device_seq": 900}
+
+        first = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+        retry = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert controller.snapshot()["rejected_total"] == 0
+        mock_record.assert_called_once()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_control_de_admision_desactivable(self, mock_record, test_client, monkeypatch):
+        controller = AdmissionController(sensor_rate_per_second=0.0, sensor_burst=1.0, clock=FakeClock())
+        monkeypatch.setattr(admission_control, "iot_admission_controller", controller)
+        monkeypatch.setenv("IOT_ADMISSION_ENABLED", "false")
+        mock_record.return_value = {"id": "C-01", "is_overload": False, "is_out_of_schedule": False}
+
+        responses = [
+            test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json={"sensor_id": "C-01", "irms": 0.1})
+            for _ in range(3)
+        ]
+
+        assert [response.status_code for response in responses] == [201, 201, 201]
+
+    def test_metricas_exponen_rechazos(self, test_client, headers_autenticados):
+        response = test_client.get("/api/data/metrics", headers=headers_autenticados)
+
+        assert response.status_code == 200
+        assert "rejected_total" in response.json()["ingest"]["admission"]
@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.routers import data_api
+from app.services.admission_control import iot_admission_controller
+from app.services.ingest_idempotency import IngestIdempotencyCache, ingest_idempotency_cache
+
+IOT_HEADERS = {"X-Safyra-Iot-Token": "test-iot-token"}
+
+
+def _overload_sensor() -> dict:
+    return {
+        "id": "C-01",
+        "room_name": "Laboratorio de Computo",
+        "circuito": "C-01",
+        "irms": 16.4,
+        "potencia": 3608.0,
+        "is_overload": True,
+        "is_out_of_schedule": False,
+        "timestamp": "2026-06-03T06:15:30-05:00",
+        "timestamp_utc": "2026-06-03T11:15:30Z",
+        "estado": "Sobrecarga",
+        "threshold": {"corriente": 11.0, "potencia": 2420.0},
+        "schedule": {"is_scheduled_now": True, "blocked_by_no_class": False, "label": "En horario"},
+        "history_key": "20260603T111530Z_abcd1234",
+    }
+
+
+@pytest.mark.unitaria
+class TestIotIdempotency:
+    def setup_method(self) -> None:
+        data_api._alert_notification_cache.clear()
+        ingest_idempotency_cache.clear()
+        iot_admission_controller.reset()
+
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_reintento_con_device_seq_devuelve_resultado_original(self, mock_record, mock_queue, mock_ticket, test_client):
+        mock_record.return_value = _overload_sensor()
+        mock_queue.return_value = {"queued": True}
+        body = {"sensor_id": "C-01", "irms": 16.4, "potencia": 3608.0, "device_seq": 41}
+
+        first = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+        data_api._alert_notification_cache.clear()
+        retry = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+
+        assert first.status_code == 201
+        assert retry.status_code == 201
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        mock_record.assert_called_once()
+        mock_queue.assert_called_once()
+        mock_ticket.assert_called_once()
+
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_idempotency_key_tiene_prioridad_sobre_device_seq(self, mock_record, mock_queue, test_client):
+        mock_record.return_value = {**_overload_sensor(), "is_overload": False, "estado": "Normal"}
+        body = {"sensor_id": "C-01", "irms": 0.1, "device_seq": 7}
+
+        test_client.post("/api/data/iot/readings", headers={**IOT_HEADERS, "Idempotency-Key": "esp32-a"}, json=body)
+        test_client.post("/api/data/iot/readings", headers={**IOT_HEADERS, "Idempotency-Key": "esp32-b"}, json=body)
+        test_client.post("/api/data/iot/readings", headers={**IOT_HEADERS, "Idempotency-Key": "esp32-a"}, json=body)
+
+        assert mock_record.call_count == 2
+
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_secuencias_son_independientes_por_sensor(self, mock_record, mock_queue, test_client):
+        mock_record.side_effect = lambda **kwargs: {**_overload_sensor(), "id": kwargs["sensor_id"], "is_overload": False}
+
+        test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json={"sensor_id": "C-01", "irms": 0.1, "device_seq": 1})
+        test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json={"sensor_id": "C-02", "irms": 0.1, "device_seq": 1})
+
+        assert mock_record.call_count == 2
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_fallo_no_se_memoriza(self, mock_record, test_client):
+        mock_record.side_effect = [RuntimeError("firebase caido"), {**_overload_sensor(), "is_overload": False}]
+        body = {"sensor_id": "C-01", "irms": 0.1, "device_seq": 3}
+
+        failed = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+        retried = test_client.post("/api/data/iot/readings", headers=IOT_HEADERS, json=body)
+
+        assert failed.status_code == 500
+        assert retried.status_code == 201
+        assert mock_record.call_count == 2
+
+
+@pytest.mark.unitaria
+class TestIngestIdempotencyCache:
+    def test_lru_acotada_por_sensor(self):
+        cache = IngestIdempotencyCache(max_keys_per_sensor=2)
+
+        cache.put("C-01", "seq:1", {"n": 1})
+        cache.put("C-01", "seq:2", {"n": 2})
+        cache.get("C-01", "seq:1")
+        cache.put("C-01", "seq:3", {"n": 3})
+        cache.put("C-02", "seq:1", {"n": 10})
+
+        assert cache.get("C-01", "seq:1") == {"n": 1}
+        assert cache.get("C-01", "seq:2") is None
+        assert cache.get("C-02", "seq:1") == {"n": 10}
+
+    def test_reintento_concurrente_espera_la_lectura_en_curso(self):
+        cache = IngestIdempotencyCache()
+        calls = []
+
+        async def producer():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"stored": True}
+
+        async def scenario():
+            return await asyncio.gather(
+                cache.resolve("C-01", "seq:9", producer),
+                cache.resolve("C-01", "seq:9", producer),
+            )
+
+        results = asyncio.run(scenario())
+
+        assert len(calls) == 1
+        assert sorted(replayed for _, replayed in results) == [False, True]
+        assert all(result == {"stored": True} for result, _ in results)
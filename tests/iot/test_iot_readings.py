@@ -4,6 +4,7 @@ import pytest
 
 from app.db import firebase as firebase_db
 from app.routers import data_api
+from app.services.notifications import build_queued_payload
 
 
 @pytest.mark.unitaria
@@ -53,7 +54,7 @@ class TestIotReadings:
         assert response.status_code == 401
 
     @patch("app.routers.data_api.get_alert_email_contacts")
-    @patch("app.routers.data_api.queue_alert_notification_factory")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
     @patch("app.routers.data_api.record_iot_reading")
     def test_registra_lectura_y_encola_alerta_sobrecarga(
         self,
@@ -78,8 +79,8 @@ class TestIotReadings:
         ]
         captured_payload = {}
 
-        def queue_factory(payload_factory):
-            captured_payload.update(payload_factory())
+        def queue_factory(builder, inputs):
+            captured_payload.update(build_queued_payload(builder, inputs))
             return {"queued": True}
 
         mock_queue.side_effect = queue_factory
@@ -124,7 +125,7 @@ class TestIotReadings:
         assert payload["notification"]["email_subject"].startswith("[SafyraShield] CRITICA")
         assert "Sobrecarga electrica" in payload["notification"]["whatsapp_text"]
 
-    @patch("app.routers.data_api.queue_alert_notification_factory")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
     @patch("app.routers.data_api.record_iot_reading")
     def test_registra_lectura_normal_sin_notificacion(self, mock_record, mock_queue, test_client):
         mock_record.return_value = {
@@ -235,7 +236,7 @@ class TestAlertRecipients:
             },
         }
         consents = {
-            "/app_consents/admin": {
+            "admin": {
                 "consent-1": {
                     "event_type": "terms_acceptance",
                     "terms_version": firebase_db.TERMS_VERSION,
@@ -243,7 +244,7 @@ class TestAlertRecipients:
                     "uid": "uid-admin",
                 }
             },
-            "/app_consents/Direccion": {
+            "Direccion": {
                 "consent-2": {
                     "event_type": "terms_acceptance",
                     "terms_version": firebase_db.TERMS_VERSION,
@@ -255,7 +256,7 @@ class TestAlertRecipients:
 
         def reference(path: str):
             ref = Mock()
-            ref.get.return_value = users if path == "/app_users" else consents.get(path, {})
+            ref.get.return_value = {"/app_users": users, "/app_consents": consents}.get(path, {})
             return ref
 
         reset_firebase_mock.reference.side_effect = reference
@@ -280,6 +281,49 @@ class TestAlertRecipients:
         ]
 
 
+    def test_directorio_se_cachea_con_dos_lecturas_en_bloque(self, reset_firebase_mock):
+        users = {
+            "admin": {"email": "admin@example.test", "role": "admin", "status": "activo", "uid": "uid-admin"},
+            "tecnico": {"email": "tecnico@example.test", "role": "tecnico", "status": "activo", "uid": "uid-tec"},
+        }
+        consents = {
+            "admin": {"c-1": {"terms_version": firebase_db.TERMS_VERSION, "role": "admin"}},
+            "tecnico": {"c-2": {"terms_version": firebase_db.TERMS_VERSION, "role": "tecnico"}},
+        }
+        read_paths = []
+
+        def reference(path: str):
+            read_paths.append(path)
+            ref = Mock()
+            ref.get.return_value = {"/app_users": users, "/app_consents": consents}.get(path, {})
+            return ref
+
+        reset_firebase_mock.reference.side_effect = reference
+
+        for _ in range(5):
+            firebase_db.get_alert_email_contacts()
+        by_role = firebase_db.get_alert_email_contacts(["tecnico"])
+
+        assert read_paths == ["/app_users", "/app_consents"]
+        assert [contact["email"] for contact in by_role] == ["tecnico@example.test"]
+
+        firebase_db.invalidate_alert_recipient_directory()
+        firebase_db.get_alert_email_contacts()
+
+        assert len(read_paths) == 4
+
+    def test_aceptar_terminos_invalida_el_directorio(self, test_client, headers_autenticados):
+        with patch("app.routers.auth_api.invalidate_alert_recipient_directory") as mock_invalidate:
+            response = test_client.post(
+                "/consent/accept",
+                headers=headers_autenticados,
+                json={"terms_version": firebase_db.TERMS_VERSION},
+            )
+
+        assert response.status_code == 201
+        mock_invalidate.assert_called_once()
+
+
 @pytest.mark.unitaria
 class TestNotificationContent:
     def test_correo_fuera_de_horario_usa_referencia_de_agenda(self):
@@ -323,3 +367,17 @@ class TestNotificationContent:
         assert "Referencia de agenda" in content["email_html"]
         assert "Consumo relevante &gt;= 0.160 A fuera de horario" in content["email_html"]
         assert "Umbral: 15.00 A / 3300 W" not in content["whatsapp_text"]
+
+    def test_cuerpo_del_correo_se_renderiza_una_vez_por_alerta(self):
+        payload = {"alert_type": "overload", "severity": "critical", "irms": 16.4, "alert_id": "a-50"}
+        recipients = [{"email": f"user{index}@example.test", "name": f"Usuario {index}"} for index in range(50)]
+        recipients.append({"email": "x@example.test", "name": "<script>alert(1)</script>"})
+
+        with patch("app.routers.data_api.render_email_body", wraps=data_api.render_email_body) as mock_body:
+            notifications = data_api._build_email_notifications(payload, recipients)
+
+        mock_body.assert_called_once()
+        assert len(notifications) == 51
+        assert "Estimado(a) <strong>Usuario 7</strong>" in notifications[7]["htmlContent"]
+        assert "&lt;script&gt;" in notifications[-1]["htmlContent"]
+        assert notifications[0]["htmlContent"].split("</p>", 1)[1] == notifications[1]["htmlContent"].split("</p>", 1)[1]
@@ -0,0 +1,236 @@
+import asyncio
+import socket
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.routers import data_api
+from app.services import line_ingest
+from app.services.admission_control import iot_admission_controller
+from app.services.ingest_idempotency import ingest_idempotency_cache
+
+
+def _sensor(**kwargs) -> dict:
+    return {
+        "id": kwargs["sensor_id"],
+        "circuito": kwargs["sensor_id"],
+        "irms": kwargs["irms"],
+        "potencia": kwargs["potencia"] or kwargs["irms"] * kwargs["voltage"],
+        "is_overload": False,
+        "is_out_of_schedule": False,
+        "estado": "Normal",
+    }
+
+
+async def _tcp_exchange(port: int, lines: list[str]) -> list[str]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    replies = []
+    for line in lines:
+        writer.write((line + "\n").encode("utf-8"))
+        await writer.drain()
+        replies.append((await reader.readline()).decode("utf-8").strip())
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+
+async def _with_listener(scenario):
+    ports = await line_ingest.start_line_ingest_listener("127.0.0.1", tcp_port=0, udp_port=0)
+    try:
+        return await scenario(ports)
+    finally:
+        await line_ingest.stop_line_ingest_listener()
+
+
+@pytest.mark.unitaria
+class TestLineProtocolParsing:
+    def test_campos_opcionales_vacios(self):
+        assert line_ingest.parse_reading_line("C-01,0.175,,,") == {"sensor_id": "C-01", "irms": 0.175, "potencia": None}
+
+    def test_linea_completa(self):
+        assert line_ingest.parse_reading_line("C-02,0.25,55.0,220,42") == {
+            "sensor_id": "C-02",
+            "irms": 0.25,
+            "potencia": 55.0,
+            "voltage": 220.0,
+            "device_seq": 42,
+        }
+
+    def test_rechaza_linea_incompleta(self):
+        with pytest.raises(ValueError):
+            line_ingest.parse_reading_line("C-01")
+
+
+@pytest.mark.unitaria
+class TestLineIngestListener:
+    def setup_method(self) -> None:
+        data_api._alert_notification_cache.clear()
+        ingest_idempotency_cache.clear()
+        iot_admission_controller.reset()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_tcp_autentica_y_usa_el_pipeline_de_ingesta(self, mock_record):
+        mock_record.side_effect = _sensor
+
+        replies = asyncio.run(
+            _with_listener(
+                lambda ports: _tcp_exchange(
+                    ports["tcp"],
+                    ["AUTH test-iot-token", "C-01,0.175,38.5,220,7", "C-01,0.175,38.5,220,7", "C-01,abc,,,"],
+                )
+            )
+        )
+
+        assert replies[0] == "OK AUTH"
+        assert replies[1] == "OK C-01 7 Normal"
+        assert replies[2] == "OK C-01 7 Normal REPLAY"
+        assert replies[3].startswith("ERR 422 C-01")
+        mock_record.assert_called_once_with(sensor_id="C-01", irms=0.175, potencia=38.5, voltage=220.0, circuito=None)
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_tcp_rechaza_token_invalido(self, mock_record):
+        replies = asyncio.run(_with_listener(lambda ports: _tcp_exchange(ports["tcp"], ["AUTH otro-token"])))
+
+        assert replies == ["ERR 401 Token IoT invalido"]
+        mock_record.assert_not_called()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_udp_procesa_un_datagrama_con_varias_lecturas(self, mock_record):
+        mock_record.side_effect = _sensor
+
+        async def scenario(ports):
+            loop = asyncio.get_running_loop()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.setblocking(False)
+                client.sendto(b"AUTH test-iot-token\nC-01,0.2,,,1\nC-02,0.3,,,1\n", ("127.0.0.1", ports["udp"]))
+                data = await asyncio.wait_for(loop.sock_recv(client, 4096), timeout=2)
+            return data.decode("utf-8").splitlines()
+
+        replies = asyncio.run(_with_listener(scenario))
+
+        assert replies == ["OK C-01 1 Normal", "OK C-02 1 Normal"]
+        assert mock_record.call_count == 2
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_udp_descarta_sin_responder_datagramas_no_autenticados(self, mock_record):
+        async def scenario(ports):
+            loop = asyncio.get_running_loop()
+            dropped_before = line_ingest.line_ingest_snapshot()["dropped_unauthenticated"]
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.setblocking(False)
+                client.sendto(b"AUTH otro-token\nC-01,0.2,,,1\n", ("127.0.0.1", ports["udp"]))
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(loop.sock_recv(client, 4096), timeout=0.3)
+            return line_ingest.line_ingest_snapshot()["dropped_unauthenticated"] - dropped_before
+
+        assert asyncio.run(_with_listener(scenario)) == 1
+        mock_record.assert_not_called()
+
+    def test_udp_descarta_datagramas_con_el_pipeline_saturado(self, monkeypatch):
+        monkeypatch.setenv("IOT_LINE_UDP_MAX_INFLIGHT", "1")
+        release = asyncio.Event()
+
+        async def slow_line(line, iot_token):
+            await release.wait()
+            return "OK"
+
+        async def scenario():
+            protocol = line_ingest._LineDatagramProtocol()
+            protocol.connection_made(MagicMock())
+            dropped_before = line_ingest.line_ingest_snapshot()["dropped_busy"]
+            with patch.object(line_ingest, "handle_reading_line", slow_line):
+                for _ in range(3):
+                    protocol.datagram_received(b"AUTH test-iot-token\nC-01,0.2,,,1\n", ("127.0.0.1", 5000))
+                inflight = line_ingest.line_ingest_snapshot()["inflight"]
+                release.set()
+                await asyncio.gather(*list(line_ingest._pending_tasks))
+            return inflight, line_ingest.line_ingest_snapshot()["dropped_busy"] - dropped_before
+
+        inflight, dropped = asyncio.run(scenario())
+
+        assert inflight == 1
+        assert dropped == 2
+        assert line_ingest.line_ingest_snapshot()["inflight"] == 0
+
+    def test_tcp_cierra_conexion_inactiva(self, monkeypatch):
+        monkeypatch.setenv("IOT_LINE_TCP_IDLE_TIMEOUT_SECONDS", "0.2")
+
+        async def scenario(ports):
+            closed_before = line_ingest.line_ingest_snapshot()["tcp_idle_closed"]
+            reader, writer = await asyncio.open_connection("127.0.0.1", ports["tcp"])
+            writer.write(b"AUTH test-iot-token\n")
+            await writer.drain()
+            replies = [(await reader.readline()).decode("utf-8").strip()]
+            replies.append((await asyncio.wait_for(reader.readline(), timeout=2)).decode("utf-8").strip())
+            at_eof = await asyncio.wait_for(reader.read(), timeout=2) == b""
+            writer.close()
+            return replies, at_eof, line_ingest.line_ingest_snapshot()["tcp_idle_closed"] - closed_before
+
+        replies, at_eof, idle_closed = asyncio.run(_with_listener(scenario))
+
+        assert replies == ["OK AUTH", "ERR 408 Conexion inactiva"]
+        assert at_eof is True
+        assert idle_closed == 1
+
+    def test_tcp_rechaza_conexiones_sobre_el_cupo(self, monkeypatch):
+        monkeypatch.setenv("IOT_LINE_TCP_MAX_CONNECTIONS", "1")
+
+        async def scenario(ports):
+            rejected_before = line_ingest.line_ingest_snapshot()["tcp_rejected_busy"]
+            first_reader, first_writer = await asyncio.open_connection("127.0.0.1", ports["tcp"])
+            first_writer.write(b"AUTH test-iot-token\n")
+            await first_writer.drain()
+            await first_reader.readline()
+            second = await _tcp_exchange(ports["tcp"], ["AUTH test-iot-token"])
+            first_writer.close()
+            await first_writer.wait_closed()
+            return second, line_ingest.line_ingest_snapshot()["tcp_rejected_busy"] - rejected_before
+
+        second, rejected = asyncio.run(_with_listener(scenario))
+
+        assert second == ["ERR 503 Demasiadas conexiones"]
+        assert rejected == 1
+
+    def test_udp_cuenta_lecturas_sobre_el_maximo_y_mide_bytes(self, capsys):
+        replies = []
+
+        async def fake_line(line, iot_token):
+            replies.append(line)
+            return "OK"
+
+        async def scenario():
+            protocol = line_ingest._LineDatagramProtocol()
+            protocol.connection_made(MagicMock())
+            dropped_before = line_ingest.line_ingest_snapshot()["dropped_lines"]
+            wide_line = "C-01," + "ñ" * 130
+            lines = [wide_line] + [f"C-01,0.2,,,{seq}" for seq in range(line_ingest.MAX_LINES_PER_DATAGRAM + 2)]
+            with patch.object(line_ingest, "handle_reading_line", fake_line):
+                protocol.datagram_received(
+                    ("AUTH test-iot-token\n" + "\n".join(lines) + "\n").encode("utf-8"), ("127.0.0.1", 5000)
+                )
+                await asyncio.gather(*list(line_ingest._pending_tasks))
+            sent = protocol.transport.sendto.call_args.args[0].decode("utf-8").splitlines()
+            return sent, line_ingest.line_ingest_snapshot()["dropped_lines"] - dropped_before
+
+        sent, dropped = asyncio.run(scenario())
+
+        assert dropped == 3
+        assert "se descartan" in capsys.readouterr().out
+        assert sent[0] == "ERR 413 - - Linea demasiado larga"
+        assert len(sent) == line_ingest.MAX_LINES_PER_DATAGRAM
+        assert len(replies) == line_ingest.MAX_LINES_PER_DATAGRAM - 1
+
+    @patch("app.routers.data_api.handle_critical_alert")
+    @patch("app.routers.data_api.queue_raw_alert_notification")
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_alerta_crea_ticket_en_segundo_plano(self, mock_record, mock_queue, mock_ticket):
+        mock_record.side_effect = lambda **kwargs: {**_sensor(**kwargs), "is_overload": True, "estado": "Sobrecarga"}
+        mock_queue.return_value = {"queued": True}
+
+        replies = asyncio.run(
+            _with_listener(lambda ports: _tcp_exchange(ports["tcp"], ["AUTH test-iot-token", "C-03,16.5,,,"]))
+        )
+
+        assert replies[1] == "OK C-03 - Sobrecarga"
+        mock_ticket.assert_called_once()
+        assert mock_ticket.call_args.kwargs["sensor_id"] == "C-03"
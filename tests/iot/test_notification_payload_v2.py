@@ -0,0 +1,86 @@
+import json
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import pytest
+
+from app.routers import data_api
+
+CONTACTS = [{"email": f"user{index}@example.test", "name": f"Usuario {index}"} for index in range(50)]
+V2_ENV = {
+    "N8N_PAYLOAD_VERSION": "2",
+    "SAFYRA_BACKEND_URL": "https://safyra.example.test",
+    "N8N_BODY_URL_SECRET": "secreto-de-enlaces",
+}
+
+
+def _overload_sensor() -> dict:
+    return {
+        "id": "C-01",
+        "room_name": "Laboratorio de Computo",
+        "circuito": "C-01",
+        "irms": 16.4,
+        "potencia": 3608.0,
+        "timestamp": "2026-06-03T06:15:30-05:00",
+        "threshold": {"corriente": 11.0, "potencia": 2420.0},
+        "schedule": {"is_scheduled_now": True, "label": "En horario"},
+    }
+
+
+@pytest.mark.unitaria
+class TestNotificationPayloadV2:
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=CONTACTS)
+    def test_v2_envia_un_cuerpo_compartido_y_es_mas_liviano(self, mock_contacts):
+        with patch.dict("os.environ", {"N8N_PAYLOAD_VERSION": "1"}):
+            v1 = data_api._build_alert_notification_payload(_overload_sensor(), "overload")
+        with patch.dict("os.environ", V2_ENV):
+            v2 = data_api._build_alert_notification_payload(_overload_sensor(), "overload")
+
+        v1_size = len(json.dumps(v1, ensure_ascii=False))
+        v2_size = len(json.dumps(v2, ensure_ascii=False))
+        assert v2_size * 3 < v1_size
+        assert v2["payload_version"] == 2
+        assert "email_notifications" not in v2
+        assert len(v2["recipients"]) == 50
+        assert v2["recipients"][0]["body_url"].startswith("https://safyra.example.test/api/data/notifications/")
+        recipient = v2["recipients"][3]
+        assert "Estimado(a) <strong>Usuario 3</strong>" in recipient["greeting_html"]
+        body_html = v2["notification"]["email_body_html"]
+        assert recipient["greeting_html"] + body_html == data_api.render_email_html(body_html, "Usuario 3")
+        assert body_html.count("Reporte tecnico de telemetria") == 1
+        assert v2["irms"] == 16.4 and v2["alert_type"] == "overload"
+
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=CONTACTS[:1])
+    def test_url_firmada_devuelve_el_correo_completo(self, mock_contacts, test_client):
+        with patch.dict("os.environ", V2_ENV):
+            payload = data_api._build_alert_notification_payload(_overload_sensor(), "overload")
+            url = urlsplit(payload["recipients"][0]["body_url"])
+            response = test_client.get(f"{url.path}?{url.query}")
+            tampered = test_client.get(f"{url.path}?{url.query.replace('Usuario', 'Otro')}")
+
+        assert response.status_code == 200
+        assert "Estimado(a) <strong>Usuario 0</strong>" in response.text
+        assert "Reporte tecnico de telemetria" in response.text
+        assert tampered.status_code == 403
+
+    @pytest.mark.parametrize("missing", ["SAFYRA_BACKEND_URL", "N8N_BODY_URL_SECRET"])
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=CONTACTS[:1])
+    def test_v2_sin_url_o_secreto_vuelve_a_v1(self, mock_contacts, missing):
+        env = {**V2_ENV, missing: ""}
+        with patch.dict("os.environ", env):
+            payload = data_api._build_alert_notification_payload(_overload_sensor(), "overload")
+
+        assert "payload_version" not in payload
+        assert "recipients" not in payload
+        assert len(payload["email_notifications"]) == 1
+
+    @patch("app.routers.data_api.get_alert_email_contacts", return_value=CONTACTS[:1])
+    def test_url_no_se_firma_con_la_clave_de_sesiones(self, mock_contacts, test_client):
+        with patch.dict("os.environ", V2_ENV):
+            payload = data_api._build_alert_notification_payload(_overload_sensor(), "overload")
+        url = urlsplit(payload["recipients"][0]["body_url"])
+
+        with patch.dict("os.environ", {"N8N_BODY_URL_SECRET": ""}):
+            response = test_client.get(f"{url.path}?{url.query}")
+
+        assert response.status_code == 403
@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.db import firebase as firebase_module
+from tools.bench.profile_imports import profile_cold_import
+
+
+@pytest.mark.unitaria
+class TestArranqueEnFrio:
+    def test_importar_la_app_no_carga_dependencias_pesadas(self):
+        profile = profile_cold_import()
+
+        assert profile["total_us"] > 0
+        assert profile["lazy_loaded"] == []
+
+    def test_firebase_se_inicializa_una_vez_en_el_primer_acceso(self):
+        apps: dict = {}
+
+        def initialize_app(cred, options):
+            apps["[DEFAULT]"] = object()
+
+        with patch.object(firebase_module, "skip_firebase_init", False), patch.object(
+            firebase_module, "_firebase_init_done", False
+        ), patch.object(firebase_module, "_load_service_account_from_env", return_value={"type": "service_account"}), patch(
+            "firebase_admin._apps", apps
+        ), patch("firebase_admin.credentials.Certificate"), patch(
+            "firebase_admin.initialize_app", side_effect=initialize_app
+        ) as mock_initialize:
+            proxy = firebase_module.LazyFirebaseModule("firebase_admin.db")
+            reference = proxy.reference
+            assert firebase_module.ensure_firebase_app() is True
+
+        mock_initialize.assert_called_once()
+        assert callable(reference)
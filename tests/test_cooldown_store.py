@@ -0,0 +1,48 @@
+import threading
+
+import pytest
+
+from app.services.cooldown_store import InMemoryCooldownStore, SqliteCooldownStore
+
+
+@pytest.mark.unitaria
+class TestCooldownStore:
+    def test_memoria_respeta_el_cooldown(self):
+        entries: dict[str, float] = {}
+        store = InMemoryCooldownStore(entries)
+
+        assert store.try_acquire("C-01:overload", 300, now=1000)
+        assert not store.try_acquire("C-01:overload", 300, now=1200)
+        assert store.try_acquire("C-01:overload", 300, now=1300)
+        assert entries == {"C-01:overload": 1300}
+
+    def test_sqlite_se_comparte_entre_instancias_y_sobrevive_reinicios(self, tmp_path):
+        path = str(tmp_path / "cooldowns.sqlite3")
+        worker_a = SqliteCooldownStore(path)
+        worker_b = SqliteCooldownStore(path)
+
+        assert worker_a.try_acquire("C-01:overload", 300, now=1000)
+        assert not worker_b.try_acquire("C-01:overload", 300, now=1100)
+        assert worker_b.try_acquire("C-02:overload", 300, now=1100)
+
+        restarted = SqliteCooldownStore(path)
+        assert not restarted.try_acquire("C-01:overload", 300, now=1299)
+        assert restarted.try_acquire("C-01:overload", 300, now=1300)
+
+    def test_sqlite_check_and_set_atomico_con_concurrencia(self, tmp_path):
+        path = str(tmp_path / "cooldowns.sqlite3")
+        stores = [SqliteCooldownStore(path) for _ in range(8)]
+        results: list[bool] = []
+        barrier = threading.Barrier(len(stores))
+
+        def contend(store: SqliteCooldownStore) -> None:
+            barrier.wait()
+            results.append(store.try_acquire("LAB-PC-01:overload", 300, now=5000))
+
+        threads = [threading.Thread(target=contend, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 1
@@ -0,0 +1,118 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.services.export_jobs import ExportJobManager, export_job_manager
+
+
+def _rows(sensor_id, start_date=None, end_date=None, limit=1000):
+    return [[sensor_id, "2026-06-03T06:15:30-05:00", 16.4, 3608.0, "Laptop", "Sobrecarga"]]
+
+
+def _wait(job_id: str, manager: ExportJobManager = export_job_manager) -> None:
+    job = manager.wait(job_id, timeout=5)
+    assert job is not None and job.status in ("done", "failed")
+
+
+@pytest.mark.unitaria
+class TestExportJobs:
+    def setup_method(self) -> None:
+        export_job_manager.clear()
+
+    @patch("app.services.export_jobs.SENSOR_IDS", ["C-01", "C-02", "C-03"])
+    @patch("app.services.export_jobs.collect_history_rows", side_effect=_rows)
+    def test_exportacion_csv_completa_se_descarga_al_terminar(self, mock_rows, test_client, headers_autenticados):
+        created = test_client.post("/api/data/exports", json={"format": "csv"}, headers=headers_autenticados)
+        job_id = created.json()["job_id"]
+        _wait(job_id)
+
+        status = test_client.get(f"/api/data/exports/{job_id}", headers=headers_autenticados).json()
+        download = test_client.get(status["download_url"], headers=headers_autenticados)
+
+        assert created.status_code == 202
+        assert status["status"] == "done"
+        assert status["progress"] == 1.0
+        assert status["rows"] == 3
+        lines = download.text.splitlines()
+        assert lines[0].startswith("Sensor ID,")
+        assert [line.split(",")[0] for line in lines[1:]] == ["C-01", "C-02", "C-03"]
+        assert all(call.kwargs["limit"] is None for call in mock_rows.call_args_list)
+
+    @patch("app.services.export_jobs.collect_history_rows", side_effect=_rows)
+    def test_mismos_parametros_reutilizan_el_archivo(self, mock_rows, test_client, headers_autenticados):
+        body = {"format": "excel", "sensor_id": "C-01", "start_date": "2026-06-01", "end_date": "2026-06-30"}
+        first = test_client.post("/api/data/exports", json=body, headers=headers_autenticados).json()
+        _wait(first["job_id"])
+        second = test_client.post("/api/data/exports", json=body, headers=headers_autenticados).json()
+        download = test_client.get(second["download_url"], headers=headers_autenticados)
+
+        assert second["job_id"] == first["job_id"]
+        assert second["deduplicated"] is True
+        mock_rows.assert_called_once()
+        assert download.content.startswith(b"PK")
+        assert download.headers["content-disposition"].endswith('safyrashield_export_C-01.xlsx"')
+
+    def test_descarga_antes_de_terminar_devuelve_409(self, test_client, headers_autenticados):
+        release = threading.Event()
+
+        def slow_rows(*args, **kwargs):
+            release.wait(timeout=5)
+            return []
+
+        with patch("app.services.export_jobs.collect_history_rows", side_effect=slow_rows):
+            job = test_client.post(
+                "/api/data/exports", json={"format": "csv", "sensor_id": "C-01"}, headers=headers_autenticados
+            ).json()
+            early = test_client.get(f"/api/data/exports/{job['job_id']}/download", headers=headers_autenticados)
+            release.set()
+            _wait(job["job_id"])
+
+        assert early.status_code == 409
+        assert test_client.get("/api/data/exports/no-existe", headers=headers_autenticados).status_code == 404
+
+    @patch("app.services.export_jobs.collect_history_rows", side_effect=RuntimeError("firebase caido"))
+    def test_exportacion_fallida_no_se_reutiliza(self, mock_rows, test_client, headers_autenticados):
+        body = {"format": "csv", "sensor_id": "C-02"}
+        first = test_client.post("/api/data/exports", json=body, headers=headers_autenticados).json()
+        _wait(first["job_id"])
+        status = test_client.get(f"/api/data/exports/{first['job_id']}", headers=headers_autenticados).json()
+        second = test_client.post("/api/data/exports", json=body, headers=headers_autenticados).json()
+        _wait(second["job_id"])
+
+        assert status["status"] == "failed"
+        assert status["error"] == "firebase caido"
+        assert second["deduplicated"] is False
+        assert second["job_id"] != first["job_id"]
+
+    @patch("app.services.export_jobs.collect_history_rows", side_effect=_rows)
+    def test_rango_sin_fecha_final_no_reutiliza_pasada_la_ventana(self, mock_rows, tmp_path):
+        now = [1_000_000.0]
+        manager = ExportJobManager(str(tmp_path), open_range_reuse_seconds=60, clock=lambda: now[0])
+
+        first, _ = manager.submit("csv", "C-01", "2026-06-01", None)
+        _wait(first.id, manager)
+        now[0] += 30
+        within_window, reused = manager.submit("csv", "C-01", "2026-06-01", None)
+        now[0] += 60
+        after_window, reused_late = manager.submit("csv", "C-01", "2026-06-01", None)
+        _wait(after_window.id, manager)
+
+        assert reused is True and within_window.id == first.id
+        assert reused_late is False and after_window.id != first.id
+        assert mock_rows.call_count == 2
+
+    @patch("app.services.export_jobs.collect_history_rows", side_effect=_rows)
+    def test_otro_worker_ve_el_trabajo_y_lo_reutiliza(self, mock_rows, tmp_path):
+        worker_a = ExportJobManager(str(tmp_path))
+        worker_b = ExportJobManager(str(tmp_path))
+
+        job, _ = worker_a.submit("csv", "C-03", "2026-06-01", "2026-06-30")
+        finished = worker_b.wait(job.id, timeout=5)
+        again, deduplicated = worker_b.submit("csv", "C-03", "2026-06-01", "2026-06-30")
+
+        assert finished.status == "done"
+        assert finished.rows == 1
+        assert open(finished.path, encoding="utf-8").read().startswith("Sensor ID,")
+        assert deduplicated is True and again.id == job.id
+        mock_rows.assert_called_once()
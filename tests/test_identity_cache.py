@@ -0,0 +1,167 @@
+import secrets
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.routers.auth_api import (
+    TERMS_VERSION,
+    create_access_token,
+    fake_consent_db,
+    fake_users_db,
+    get_user,
+    identity_cache,
+)
+from app.services.identity_cache import IdentityCache
+
+
+def _auditor_headers() -> tuple[str, dict[str, str]]:
+    username = f"cache_{secrets.token_hex(4)}"
+    fake_users_db[username] = {
+        "username": username,
+        "full_name": "Usuario Cache",
+        "email": f"{username}@example.test",
+        "role": "auditor",
+        "status": "activo",
+        "disabled": False,
+        "hashed_password": "",
+    }
+    fake_consent_db.pop(username, None)
+    token = create_access_token({"sub": username, "role": "auditor"})
+    return username, {"Authorization": f"Bearer {token}"}
+
+
+def _consent_node(username: str) -> dict:
+    return {
+        "-push1": {
+            "username": username,
+            "role": "auditor",
+            "terms_version": TERMS_VERSION,
+            "accepted_at": datetime.now(timezone.utc).isoformat(),
+            "event_type": "terms_acceptance",
+        }
+    }
+
+
+class _FakeReference:
+    def __init__(self) -> None:
+        self.callbacks: dict[str, object] = {}
+
+    def __call__(self, path: str):
+        def listen(callback):
+            self.callbacks[path] = callback
+            return MagicMock()
+
+        return SimpleNamespace(listen=listen)
+
+
+@pytest.mark.unitaria
+class TestIdentityCacheEnRutas:
+    def test_verificacion_de_rol_no_relee_consentimientos(self, test_client):
+        username, headers = _auditor_headers()
+        try:
+            with patch("app.routers.auth_api._firebase_consent_store_enabled", return_value=True), patch(
+                "app.routers.auth_api.firebase_db.reference"
+            ) as mock_reference:
+                mock_reference.return_value.get.return_value = _consent_node(username)
+                statuses = [test_client.get("/consent/status", headers=headers).status_code for _ in range(3)]
+
+            assert statuses == [200, 200, 200]
+            assert mock_reference.return_value.get.call_count == 1
+        finally:
+            fake_users_db.pop(username, None)
+            fake_consent_db.pop(username, None)
+
+    def test_listado_de_usuarios_no_relee_el_arbol_completo(self, test_client, headers_autenticados):
+        with patch("app.routers.auth_api._firebase_user_store_enabled", return_value=True), patch(
+            "app.routers.auth_api.firebase_db.reference"
+        ) as mock_reference:
+            mock_reference.return_value.get.return_value = {}
+            first = test_client.get("/admin/users", headers=headers_autenticados)
+            second = test_client.get("/admin/users", headers=headers_autenticados)
+
+        assert first.status_code == second.status_code == 200
+        assert mock_reference.return_value.get.call_count == 1
+        assert identity_cache.snapshot()["users_fresh"] is True
+
+
+@pytest.mark.unitaria
+class TestIdentityCache:
+    def test_ttl_vencido_obliga_a_releer(self):
+        now = [0.0]
+        cache = IdentityCache({}, {}, ttl_seconds=60, clock=lambda: now[0])
+        cache.replace_users({"ana": {"username": "ana", "uid": "u-1"}})
+        cache.replace_consents("ana", [])
+
+        assert cache.users_fresh() and cache.consents_fresh("ana")
+        now[0] = 61.0
+        assert not cache.users_fresh() and not cache.consents_fresh("ana")
+
+    def test_indices_por_uid_y_email_se_reconstruyen_al_cambiar(self):
+        users: dict = {"ana": {"username": "ana", "uid": "u-1", "email": "Ana@Example.test"}}
+        cache = IdentityCache(users, {}, ttl_seconds=60)
+
+        assert cache.find_by_identity("u-1", None)["username"] == "ana"
+        assert cache.find_by_identity("otro", "ana@example.test")["username"] == "ana"
+        users["ana"]["uid"] = "u-2"
+        assert cache.find_by_identity("u-1", None) is None
+        assert cache.find_by_identity("u-2", None)["username"] == "ana"
+
+    def test_listeners_aplican_arbol_inicial_y_marcan_cambios(self):
+        users: dict = {}
+        consents: dict = {}
+        reference = _FakeReference()
+        cache = IdentityCache(users, consents, ttl_seconds=0)
+
+        assert cache.start_listeners(reference, "/app_users", "/app_consents") is True
+        reference.callbacks["/app_users"](SimpleNamespace(event_type="put", path="/", data={"ana": {"uid": "u-1"}}))
+        reference.callbacks["/app_consents"](SimpleNamespace(event_type="put", path="/", data={"ana": _consent_node("ana")}))
+
+        assert cache.users_fresh() and cache.consents_fresh("ana")
+        assert consents["ana"][0]["terms_version"] == TERMS_VERSION
+
+        reference.callbacks["/app_consents"](SimpleNamespace(event_type="put", path="/ana/-push2", data={}))
+        reference.callbacks["/app_users"](SimpleNamespace(event_type="put", path="/ana", data=None))
+
+        assert not cache.consents_fresh("ana")
+        assert "ana" not in users
+        assert cache.find_by_identity("u-1", None) is None
+
+    def test_listeners_aplican_cambios_de_un_usuario_sin_releer(self):
+        users: dict = {}
+        reference = _FakeReference()
+        cache = IdentityCache(users, {}, ttl_seconds=0)
+        cache.start_listeners(reference, "/app_users", "/app_consents")
+        on_users = reference.callbacks["/app_users"]
+        on_users(SimpleNamespace(event_type="put", path="/", data={"ana": {"uid": "u-1", "role": "auditor"}}))
+
+        on_users(SimpleNamespace(event_type="put", path="/luis", data={"uid": "u-2", "role": "tecnico"}))
+        on_users(SimpleNamespace(event_type="patch", path="/ana", data={"role": "admin", "email": "ana@example.test"}))
+        on_users(SimpleNamespace(event_type="put", path="/luis/status", data="inactivo"))
+
+        assert cache.users_fresh()
+        assert cache.store_reads == 1
+        assert users["ana"]["role"] == "admin"
+        assert users["luis"]["status"] == "inactivo"
+        assert cache.find_by_identity("otro", "ana@example.test")["uid"] == "u-1"
+        assert cache.find_by_identity("u-2", None)["role"] == "tecnico"
+
+    def test_acierto_en_cache_vencido_relee_el_store(self):
+        username, _ = _auditor_headers()
+        try:
+            identity_cache.reset()
+            with patch("app.routers.auth_api._firebase_user_store_enabled", return_value=True), patch(
+                "app.routers.auth_api.firebase_db.reference"
+            ) as mock_reference:
+                mock_reference.return_value.get.return_value = {
+                    username: {**fake_users_db[username], "role": "admin"}
+                }
+                user = get_user(fake_users_db, username)
+                get_user(fake_users_db, username)
+
+            assert user.role == "admin"
+            assert mock_reference.return_value.get.call_count == 1
+        finally:
+            fake_users_db.pop(username, None)
+            identity_cache.reset()
@@ -0,0 +1,277 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.services import notifications
+from app.services.notification_outbox import CircuitBreaker, NotificationOutbox, backoff_seconds
+
+WEBHOOK_ENV = {
+    "ALERT_NOTIFICATION_ENABLED": "true",
+    "N8N_ALERT_WEBHOOK_URL": "https://n8n.example.test/webhook/safyra",
+    "N8N_ALERT_WEBHOOK_TOKEN": "token-n8n",
+}
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.unitaria
+class TestWebhookPooledClient:
+    def setup_method(self) -> None:
+        notifications.webhook_metrics.reset()
+
+    def test_envios_reutilizan_el_mismo_cliente_y_registran_latencia(self):
+        received = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            received.append((request.headers["X-Safyra-Token"], json.loads(request.content)))
+            return httpx.Response(200, text="ok")
+
+        async def scenario():
+            try:
+                first = await notifications.send_alert_notification({"alert_id": "a-1"})
+                client = notifications.get_http_client()
+                second = await notifications.send_alert_notification({"alert_id": "a-2"})
+                return first, second, client is notifications.get_http_client()
+            finally:
+                await notifications.close_http_client()
+
+        with patch.dict("os.environ", WEBHOOK_ENV), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ) as mock_build:
+            first, second, same_client = asyncio.run(scenario())
+
+        assert first["sent"] is True and second["sent"] is True
+        assert same_client
+        mock_build.assert_called_once()
+        assert received == [("token-n8n", {"alert_id": "a-1"}), ("token-n8n", {"alert_id": "a-2"})]
+        snapshot = notifications.webhook_metrics.snapshot()
+        assert snapshot["sent"] == 2
+        assert snapshot["latency_ms"]["samples"] == 2
+
+    def test_timeout_se_reporta_como_fallo(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ReadTimeout("n8n lento", request=request)
+
+        async def scenario():
+            try:
+                return await notifications.send_alert_notification({"alert_id": "a-3"})
+            finally:
+                await notifications.close_http_client()
+
+        with patch.dict("os.environ", WEBHOOK_ENV), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ):
+            result = asyncio.run(scenario())
+
+        assert result == {"sent": False, "reason": "n8n lento"}
+        assert notifications.webhook_metrics.snapshot()["failed"] == 1
+
+
+@pytest.mark.unitaria
+class TestAlertDispatcher:
+    def setup_method(self) -> None:
+        notifications.webhook_metrics.reset()
+        notifications.alert_dispatcher.outbox.clear()
+        notifications.alert_dispatcher.breaker.reset()
+
+    def test_cola_construye_el_payload_y_lo_envia_en_segundo_plano(self):
+        received = []
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            received.append(json.loads(request.content))
+            return httpx.Response(202)
+
+        async def scenario():
+            results = [notifications.queue_raw_alert_notification("prueba", {"index": index}) for index in range(3)]
+            results.append(notifications.queue_alert_notification({"alert_id": "directo"}))
+            await notifications.shutdown_notifications()
+            return results
+
+        with patch.dict("os.environ", WEBHOOK_ENV), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ), patch.dict(notifications._payload_builders, {"prueba": lambda inputs: {"alert_id": f"f-{inputs['index']}"}}):
+            results = asyncio.run(scenario())
+
+        assert all(result["queued"] for result in results)
+        assert sorted(item["alert_id"] for item in received) == ["directo", "f-0", "f-1", "f-2"]
+        assert notifications.notification_metrics_snapshot()["outbox"]["depth"] == 0
+
+    def test_fallo_se_reintenta_con_backoff_sin_perder_la_alerta(self):
+        attempts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            attempts.append(json.loads(request.content)["alert_id"])
+            return httpx.Response(503 if len(attempts) < 3 else 200)
+
+        async def scenario():
+            notifications.queue_alert_notification({"alert_id": "reintento"})
+            await notifications.shutdown_notifications()
+
+        env = {**WEBHOOK_ENV, "N8N_RETRY_BASE_SECONDS": "0"}
+        with patch.dict("os.environ", env), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ):
+            asyncio.run(scenario())
+
+        assert attempts == ["reintento", "reintento", "reintento"]
+        assert notifications.alert_dispatcher.outbox.stats()["depth"] == 0
+
+    def test_sin_event_loop_la_alerta_queda_en_el_outbox(self):
+        with patch.dict("os.environ", WEBHOOK_ENV):
+            result = notifications.queue_alert_notification({"alert_id": "sin-loop"})
+            pending = notifications.alert_dispatcher.outbox.claim(10)
+
+        assert result["queued"] is True
+        assert [message.payload for message in pending] == [{"alert_id": "sin-loop"}]
+
+    def test_alerta_cruda_sin_event_loop_queda_en_el_outbox(self):
+        with patch.dict("os.environ", WEBHOOK_ENV):
+            result = notifications.queue_raw_alert_notification("prueba", {"sensor": {"id": "C-01"}})
+            pending = notifications.alert_dispatcher.outbox.claim(10)
+
+        assert result["queued"] is True
+        assert [message.payload for message in pending] == [
+            {"_build": {"builder": "prueba", "inputs": {"sensor": {"id": "C-01"}}}}
+        ]
+
+    def test_fallo_al_construir_el_payload_se_reintenta(self):
+        received = []
+        builds = []
+
+        def builder(inputs):
+            builds.append(inputs["index"])
+            if len(builds) == 1:
+                raise RuntimeError("Firebase no disponible")
+            return {"alert_id": f"b-{inputs['index']}"}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            received.append(json.loads(request.content)["alert_id"])
+            return httpx.Response(200)
+
+        async def scenario():
+            notifications.queue_raw_alert_notification("prueba", {"index": 1})
+            await asyncio.sleep(0.1)
+            await notifications.shutdown_notifications()
+
+        env = {**WEBHOOK_ENV, "N8N_RETRY_BASE_SECONDS": "0"}
+        with patch.dict("os.environ", env), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ), patch.dict(notifications._payload_builders, {"prueba": builder}):
+            asyncio.run(scenario())
+
+        assert builds == [1, 1]
+        assert received == ["b-1"]
+        assert notifications.alert_dispatcher.outbox.stats()["depth"] == 0
+
+    def test_half_open_los_demas_workers_esperan_la_prueba(self):
+        received = []
+        releases = []
+        release = notifications.alert_dispatcher.outbox.release
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(0.5)
+            received.append(json.loads(request.content)["alert_id"])
+            return httpx.Response(200)
+
+        def counting_release(message_id):
+            releases.append(message_id)
+            release(message_id)
+
+        async def scenario():
+            notifications.queue_alert_notification({"alert_id": "prueba"})
+            notifications.queue_alert_notification({"alert_id": "espera"})
+            await asyncio.sleep(0.9)
+            await notifications.shutdown_notifications()
+
+        breaker = notifications.alert_dispatcher.breaker
+        breaker.state = "open"
+        breaker.opened_at = -3600.0
+        with patch.dict("os.environ", WEBHOOK_ENV), patch.object(
+            notifications, "_build_http_client", side_effect=lambda: _mock_client(handler)
+        ), patch.object(notifications.alert_dispatcher.outbox, "release", counting_release):
+            asyncio.run(scenario())
+
+        assert sorted(received) == ["espera", "prueba"]
+        # Sin espera activa: los workers que no prueban liberan el mensaje una vez, no cada 100 ms.
+        assert len(releases) <= 4
+
+    def test_notificaciones_deshabilitadas(self):
+        with patch.dict("os.environ", {"ALERT_NOTIFICATION_ENABLED": "false"}):
+            result = notifications.queue_alert_notification({"alert_id": "x"})
+
+        assert result == {"queued": False, "reason": "notifications_disabled"}
+
+
+@pytest.mark.unitaria
+class TestNotificationOutbox:
+    def test_lease_vencido_se_vuelve_a_entregar(self):
+        now = [1000.0]
+        outbox = NotificationOutbox(":memory:", lease_seconds=30, clock=lambda: now[0])
+        outbox.enqueue({"alert_id": "a"})
+
+        first = outbox.claim()
+        assert outbox.claim() == []
+        now[0] += 31
+        second = outbox.claim()
+
+        assert first[0].id == second[0].id
+        assert outbox.stats()["in_flight"] == 1
+
+    def test_reintento_programado_y_metricas_de_antiguedad(self):
+        now = [1000.0]
+        outbox = NotificationOutbox(":memory:", clock=lambda: now[0])
+        message_id = outbox.enqueue({"alert_id": "b"})
+        outbox.claim()
+        outbox.retry_later(message_id, 10, "503")
+
+        now[0] += 5
+        assert outbox.claim() == []
+        assert outbox.seconds_until_next_due() == 5
+        now[0] += 5
+        retried = outbox.claim()
+
+        assert retried[0].attempts == 1
+        assert outbox.stats() == {"depth": 1, "oldest_age_seconds": 10.0, "retrying": 1, "in_flight": 1}
+
+    def test_backoff_exponencial_acotado(self):
+        assert 1.0 <= backoff_seconds(0, base=2, maximum=60) <= 2.0
+        assert 8.0 <= backoff_seconds(3, base=2, maximum=60) <= 16.0
+        assert backoff_seconds(30, base=2, maximum=60) <= 60.0
+
+
+@pytest.mark.unitaria
+class TestCircuitBreaker:
+    def test_abre_tras_fallos_y_prueba_una_vez_al_enfriar(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+        now[0] = 10
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+
+        assert breaker.state == "closed"
+        assert breaker.snapshot()["times_opened"] == 1
+
+    def test_fallo_en_half_open_reabre(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=5, clock=lambda: now[0])
+        breaker.record_failure()
+        now[0] = 5
+
+        assert breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.state == "open"
+        assert breaker.seconds_until_retry() == 5
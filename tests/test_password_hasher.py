@@ -0,0 +1,105 @@
+import asyncio
+import os
+import time
+from unittest.mock import patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from app.main import app
+from app.routers import auth_api
+from app.services.admission_control import iot_admission_controller
+from app.services.ingest_idempotency import ingest_idempotency_cache
+from app.services.password_hasher import PasswordHashPool, password_hash_pool
+
+IOT_HEADERS = {"X-Safyra-Iot-Token": "test-iot-token"}
+SLOW_HASH_SECONDS = 0.3
+ADMIN_LOGIN = {"username": os.getenv("ADMIN_USERNAME", "admin"), "password": os.environ["TEST_ADMIN_PASSWORD"]}
+
+
+def _slow_verify(plain_password: str, hashed_password: str) -> bool:
+    time.sleep(SLOW_HASH_SECONDS)
+    return True
+
+
+@pytest.mark.unitaria
+class TestPasswordHashPool:
+    def setup_method(self) -> None:
+        ingest_idempotency_cache.clear()
+        iot_admission_controller.reset()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_ingesta_no_espera_a_logins_en_curso(self, mock_record):
+        mock_record.return_value = {"id": "C-01", "irms": 2.1, "is_overload": False, "is_out_of_schedule": False}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 5000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                logins = [asyncio.create_task(client.post("/token", data=ADMIN_LOGIN)) for _ in range(2)]
+                await asyncio.sleep(0.05)
+                started = time.perf_counter()
+                ingest = await client.post(
+                    "/api/data/iot/readings", headers=IOT_HEADERS, json={"sensor_id": "C-01", "irms": 2.1}
+                )
+                ingest_latency = time.perf_counter() - started
+                responses = await asyncio.gather(*logins)
+            return ingest, ingest_latency, responses
+
+        with patch.object(auth_api.pwd_context, "verify", side_effect=_slow_verify):
+            ingest, ingest_latency, responses = asyncio.run(scenario())
+
+        assert ingest.status_code == 201
+        assert ingest_latency < SLOW_HASH_SECONDS / 2
+        assert [response.status_code for response in responses] == [200, 200]
+
+    def test_logins_simultaneos_de_una_ip_se_limitan(self):
+        async def scenario():
+            transport = httpx.ASGITransport(app=app, client=("10.0.0.2", 5000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*[client.post("/token", data=ADMIN_LOGIN) for _ in range(3)])
+
+        with patch.object(auth_api.pwd_context, "verify", side_effect=_slow_verify), patch.object(
+            password_hash_pool, "max_per_client", 2
+        ):
+            responses = asyncio.run(scenario())
+
+        assert sorted(response.status_code for response in responses) == [200, 200, 429]
+        assert password_hash_pool.snapshot()["clients_in_flight"] == 0
+
+    def test_detras_del_proxy_el_cupo_es_por_ip_del_cliente(self):
+        # Igual que uvicorn --proxy-headers: todas las conexiones llegan desde la IP de Traefik.
+        proxied_app = ProxyHeadersMiddleware(app, trusted_hosts="*")
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=proxied_app, client=("10.0.1.5", 5000))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*[
+                    client.post("/token", data=ADMIN_LOGIN, headers={"X-Forwarded-For": f"203.0.113.{index}"})
+                    for index in range(3)
+                ])
+
+        with patch.object(auth_api.pwd_context, "verify", side_effect=_slow_verify), patch.object(
+            password_hash_pool, "max_per_client", 1
+        ):
+            responses = asyncio.run(scenario())
+
+        assert [response.status_code for response in responses] == [200, 200, 200]
+
+    def test_cola_llena_responde_503(self):
+        pool = PasswordHashPool(max_workers=1, max_pending=1, max_per_client=1)
+
+        async def scenario():
+            first = asyncio.create_task(pool.run(time.sleep, 0.1))
+            await asyncio.sleep(0)
+            with pytest.raises(HTTPException) as exc_info:
+                await pool.run(time.sleep, 0)
+            await first
+            return exc_info.value
+
+        error = asyncio.run(scenario())
+        pool.shutdown()
+
+        assert error.status_code == 503
+        assert pool.snapshot()["rejected"] == 1
@@ -0,0 +1,133 @@
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.document_renderers import generate_pdf_from_summary
+from app.services.render_pool import DocumentRenderPool, _ping
+
+SUMMARY = {
+    "period_start": "2026-06-01T00:00:00+00:00",
+    "period_end": "2026-06-08T00:00:00+00:00",
+    "total_alerts": 3,
+    "total_tickets": 1,
+    "peak_current": 16.4,
+    "affected_branches": ["C-01"],
+    "tickets_list": [{"ticket_code": "TCK-1", "issue_type": "overload", "priority": "Alta", "status": "Abierto"}],
+}
+
+
+def _slow_job(seconds: float) -> str:
+    time.sleep(seconds)
+    return "listo"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.waitpid(pid, os.WNOHANG)
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+@pytest.mark.unitaria
+class TestDocumentRenderPool:
+    def test_pdf_se_renderiza_en_otro_proceso(self):
+        pool = DocumentRenderPool(max_workers=1, max_pending=4, timeout_seconds=60)
+
+        async def scenario():
+            pool.start()
+            worker_pid = await pool.render(_ping)
+            pdf = await pool.render(generate_pdf_from_summary, SUMMARY)
+            return worker_pid, pdf
+
+        try:
+            worker_pid, pdf = asyncio.run(scenario())
+        finally:
+            pool.shutdown()
+
+        assert worker_pid != os.getpid()
+        assert pdf.startswith(b"%PDF")
+        assert pool.snapshot()["completed"] == 2
+
+    def test_cola_llena_rechaza_con_503(self):
+        pool = DocumentRenderPool(max_workers=0, max_pending=1, timeout_seconds=5)
+
+        async def scenario():
+            return await asyncio.gather(
+                pool.render(_slow_job, 0.2), pool.render(_slow_job, 0), return_exceptions=True
+            )
+
+        first, second = asyncio.run(scenario())
+
+        assert first == "listo"
+        assert isinstance(second, HTTPException) and second.status_code == 503
+        assert pool.snapshot()["rejected"] == 1
+
+    def test_trabajo_que_excede_el_timeout_devuelve_504(self):
+        pool = DocumentRenderPool(max_workers=0, max_pending=2, timeout_seconds=0.05)
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(pool.render(_slow_job, 0.3))
+
+        assert exc_info.value.status_code == 504
+        assert pool.snapshot()["pending"] == 0
+
+    def test_timeout_en_proceso_recicla_el_worker_colgado(self):
+        pool = DocumentRenderPool(max_workers=1, max_pending=2, timeout_seconds=60)
+
+        async def scenario():
+            first_pid = await pool.render(_ping)
+            pool.timeout_seconds = 0.3
+            with pytest.raises(HTTPException) as exc_info:
+                await pool.render(_slow_job, 30)
+            pool.timeout_seconds = 60
+            return first_pid, exc_info.value.status_code, await pool.render(_ping)
+
+        try:
+            first_pid, status_code, second_pid = asyncio.run(scenario())
+        finally:
+            pool.shutdown()
+
+        assert status_code == 504
+        assert second_pid != first_pid
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and _process_alive(first_pid):
+            time.sleep(0.05)
+        assert not _process_alive(first_pid)
+        snapshot = pool.snapshot()
+        assert (snapshot["timed_out"], snapshot["completed"], snapshot["pending"]) == (1, 2, 0)
+
+    def test_run_blocking_usa_el_mismo_cupo_y_contadores(self):
+        pool = DocumentRenderPool(max_workers=0, max_pending=1, timeout_seconds=5)
+        results: list[str] = []
+        worker = threading.Thread(target=lambda: results.append(pool.run_blocking(_slow_job, 0.3)))
+        worker.start()
+        time.sleep(0.05)
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(pool.render(_slow_job, 0))
+        worker.join()
+
+        assert exc_info.value.status_code == 503
+        assert results == ["listo"]
+        snapshot = pool.snapshot()
+        assert (snapshot["completed"], snapshot["rejected"], snapshot["pending"]) == (1, 1, 0)
+
+    @patch("app.routers.data_api.collect_history_rows")
+    def test_excel_se_arma_con_filas_planas(self, mock_rows, test_client, headers_autenticados):
+        mock_rows.return_value = [["C-01", "2026-06-03T06:15:30-05:00", 16.4, 3608.0, "Laptop", "Sobrecarga"]]
+
+        response = test_client.get("/api/data/export/excel?sensor_id=C-01", headers=headers_autenticados)
+
+        assert response.status_code == 200
+        assert response.content.startswith(b"PK")
+        mock_rows.assert_called_once_with("C-01", None, None)
@@ -0,0 +1,275 @@
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import report_rollups, report_service
+from app.services.pdf_cache import ReportPdfCache, pdf_cache_key, report_pdf_cache
+
+
+@pytest.mark.unitaria
+class TestReportesAgregados:
+    def test_sin_tabla_de_agregados_se_calcula_en_sql(self):
+        # Contrato con report_period_summary (20261021): recibe los limites del periodo
+        # y devuelve un jsonb con los agregados; ninguna fila se descarga al backend.
+        client = MagicMock()
+        client.table.side_effect = AssertionError("get_period_data no debe descargar filas")
+        client.rpc.return_value.execute.return_value.data = {
+            "total_alerts": 3,
+            "peak_current": 16.4,
+            "affected_branches": ["C-03", "C-01", "C-02"],
+            "alerts_by_type": {"overload": 2, "out_of_schedule_consumption": 1},
+            "total_tickets": 1,
+        }
+
+        with patch.object(report_service, "get_supabase_client", return_value=client), patch.object(
+            report_service, "fetch_rollups", side_effect=RuntimeError("relation does not exist")
+        ):
+            summary = report_service.get_period_data(days=7)
+
+        client.rpc.assert_called_once_with(
+            "report_period_summary",
+            {"period_start": summary["period_start"], "period_end": summary["period_end"]},
+        )
+        assert summary["total_alerts"] == 3
+        assert summary["total_tickets"] == 1
+        assert summary["peak_current"] == 16.4
+        assert summary["affected_branches"] == ["C-01", "C-02", "C-03"]
+        assert summary["alerts_by_type"] == {"overload": 2, "out_of_schedule_consumption": 1}
+        assert "tickets_list" not in summary
+
+    def test_rpc_que_devuelve_lista_usa_la_primera_fila(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.return_value.data = [{"total_alerts": 2, "peak_current": "12.5"}]
+
+        with patch.object(report_service, "get_supabase_client", return_value=client), patch.object(
+            report_service, "fetch_rollups", side_effect=RuntimeError("relation does not exist")
+        ):
+            summary = report_service.get_period_data(days=7)
+
+        assert summary["total_alerts"] == 2
+        assert summary["peak_current"] == 12.5
+        assert summary["total_tickets"] == 0
+        assert summary["affected_branches"] == []
+
+    def setup_method(self) -> None:
+        report_pdf_cache.clear()
+
+    def test_pdf_consulta_tickets_solo_al_descargar(self, test_client):
+        summary = {
+            "period_start": "2026-06-01T00:00:00+00:00",
+            "period_end": "2026-06-08T00:00:00+00:00",
+            "total_alerts": 1,
+            "total_tickets": 1,
+            "peak_current": 16.4,
+            "affected_branches": ["C-01"],
+            "alerts_by_type": {"overload": 1},
+        }
+        client = MagicMock()
+        client.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+            {"id": "rep-1", "report_code": "REP-2026-W23", "summary_data": summary}
+        ]
+        tickets = [{"ticket_code": "TCK-1", "issue_type": "overload", "priority": "Alta", "status": "Abierto"}]
+
+        with patch("app.routers.reports_api.get_supabase_client", return_value=client), patch(
+            "app.services.report_service.get_period_tickets", return_value=tickets
+        ) as mock_tickets, patch("app.routers.reports_api.generate_pdf_from_summary", return_value=b"%PDF") as mock_pdf:
+            response = test_client.get("/api/reports/rep-1/download")
+
+        assert response.status_code == 200
+        mock_tickets.assert_called_once_with(summary["period_start"], summary["period_end"])
+        assert mock_pdf.call_args.args[0]["tickets_list"] == tickets
+
+    def test_reporte_antiguo_usa_su_lista_guardada(self):
+        stored = {"period_start": "a", "period_end": "b", "tickets_list": []}
+
+        with patch.object(report_service, "get_period_tickets") as mock_tickets:
+            assert report_service.with_tickets_list(stored) is stored
+
+        mock_tickets.assert_not_called()
+
+
+def _report_client(generated_at: str = "2026-06-08T12:00:00+00:00") -> MagicMock:
+    client = MagicMock()
+    client.table.return_value.select.return_value.eq.return_value.execute.return_value.data = [
+        {
+            "id": "rep-7",
+            "report_code": "REP-2026-W23",
+            "generated_at": generated_at,
+            "summary_data": {"period_start": "a", "period_end": "b", "tickets_list": []},
+        }
+    ]
+    return client
+
+
+@pytest.mark.unitaria
+class TestReportPdfCache:
+    def setup_method(self) -> None:
+        report_pdf_cache.clear()
+
+    def _download(self, test_client, client, headers=None, pdf=b"%PDF-1.4 contenido", tickets_version="3:2026-06-07T10:00:00+00:00"):
+        with patch("app.routers.reports_api.get_supabase_client", return_value=client), patch(
+            "app.routers.reports_api.generate_pdf_from_summary", return_value=pdf
+        ) as mock_pdf, patch("app.routers.reports_api.get_tickets_version", return_value=tickets_version):
+            response = test_client.get("/api/reports/rep-7/download", headers=headers or {})
+        return response, mock_pdf
+
+    def test_segunda_descarga_no_vuelve_a_renderizar(self, test_client):
+        client = _report_client()
+
+        first, first_render = self._download(test_client, client)
+        second, second_render = self._download(test_client, client)
+
+        assert first.content == second.content == b"%PDF-1.4 contenido"
+        first_render.assert_called_once()
+        second_render.assert_not_called()
+        assert second.headers["etag"] == first.headers["etag"]
+        assert report_pdf_cache.snapshot()["hits"] == 1
+
+    def test_etag_coincidente_devuelve_304(self, test_client):
+        client = _report_client()
+        first, _ = self._download(test_client, client)
+
+        response, mock_pdf = self._download(test_client, client, headers={"If-None-Match": first.headers["etag"]})
+
+        assert response.status_code == 304
+        assert response.content == b""
+        mock_pdf.assert_not_called()
+
+    def test_range_devuelve_contenido_parcial(self, test_client):
+        response, _ = self._download(test_client, _report_client(), headers={"Range": "bytes=0-7"})
+
+        assert response.status_code == 206
+        assert response.content == b"%PDF-1.4"
+        assert response.headers["content-range"] == "bytes 0-7/18"
+
+        suffix, _ = self._download(test_client, _report_client(), headers={"Range": "bytes=-9"})
+        assert suffix.content == b"contenido"
+
+        invalid, _ = self._download(test_client, _report_client(), headers={"Range": "bytes=50-60"})
+        assert invalid.status_code == 416
+
+    def test_reporte_regenerado_cambia_la_clave(self, test_client):
+        first, _ = self._download(test_client, _report_client("2026-06-08T12:00:00+00:00"))
+        second, mock_pdf = self._download(test_client, _report_client("2026-06-09T12:00:00+00:00"), pdf=b"%PDF nuevo")
+
+        assert first.headers["etag"] != second.headers["etag"]
+        assert second.content == b"%PDF nuevo"
+        mock_pdf.assert_called_once()
+
+    def test_ticket_editado_cambia_la_clave_y_el_etag(self, test_client):
+        client = _report_client()
+        first, _ = self._download(test_client, client)
+
+        second, mock_pdf = self._download(
+            test_client,
+            client,
+            headers={"If-None-Match": first.headers["etag"]},
+            pdf=b"%PDF ticket cerrado",
+            tickets_version="3:2026-06-09T08:00:00+00:00",
+        )
+
+        assert second.status_code == 200
+        assert second.content == b"%PDF ticket cerrado"
+        assert second.headers["etag"] != first.headers["etag"]
+        mock_pdf.assert_called_once()
+
+    def test_sin_version_de_tickets_no_se_cachea(self, test_client):
+        client = _report_client()
+
+        first, first_render = self._download(test_client, client, tickets_version=None)
+        second, second_render = self._download(test_client, client, tickets_version=None)
+
+        assert first.status_code == second.status_code == 200
+        assert "etag" not in second.headers
+        first_render.assert_called_once()
+        second_render.assert_called_once()
+
+    def test_version_de_tickets_cuenta_y_ultima_edicion_del_periodo(self):
+        client = MagicMock()
+        query = client.table.return_value.select.return_value.gte.return_value.lte.return_value
+        query.order.return_value.limit.return_value.execute.return_value = MagicMock(
+            data=[{"updated_at": "2026-06-09T08:00:00+00:00"}], count=4
+        )
+
+        with patch.object(report_service, "get_supabase_client", return_value=client):
+            version = report_service.get_tickets_version("2026-06-01T00:00:00-05:00", "2026-06-08T12:00:00+00:00")
+
+        assert version == "4:2026-06-09T08:00:00+00:00"
+        client.table.return_value.select.assert_called_once_with("updated_at", count="exact")
+        query.order.assert_called_once_with("updated_at", desc=True)
+
+    def test_lru_en_memoria_con_respaldo_en_disco(self, tmp_path):
+        cache = ReportPdfCache(str(tmp_path), memory_max_bytes=10, disk_max_bytes=1024)
+        cache.put("rep-1", "a", b"123456")
+        cache.put("rep-2", "b", b"abcdef")
+
+        assert cache.snapshot()["memory_entries"] == 1
+        assert cache.get("rep-1", "a") == b"123456"
+        assert cache.snapshot()["disk_hits"] == 1
+
+        cache.invalidate("rep-1")
+        assert cache.get("rep-1", "a") is None
+        assert cache.get("rep-2", "b") == b"abcdef"
+
+    def test_disco_expulsa_los_pdfs_mas_antiguos_por_tamano(self, tmp_path):
+        cache = ReportPdfCache(str(tmp_path), memory_max_bytes=0, disk_max_bytes=10)
+        cache.put("rep-1", "a", b"123456")
+        cache.put("rep-2", "b", b"abcdef")
+
+        assert sorted(path.name for path in tmp_path.iterdir()) == ["rep-2--b.pdf"]
+        assert pdf_cache_key("rep-1", "x") != pdf_cache_key("rep-1", "y")
+
+
+@pytest.mark.unitaria
+class TestReportRollups:
+    def test_reporte_suma_los_agregados_del_periodo(self):
+        rows = [
+            {"event_type": "overload", "branch_label": "C-01", "alerts": 2, "tickets_opened": 1, "tickets_closed": 0,
+             "peak_current": 16.4, "peak_power": 3608.0, "power_sum": 6248.0},
+            {"event_type": "out_of_schedule_consumption", "branch_label": "C-02", "alerts": 1, "tickets_opened": 1,
+             "tickets_closed": 0, "peak_current": 0.9, "peak_power": 198.0, "power_sum": 198.0},
+            # Cierre de un ticket de dias anteriores: cuenta sin alertas ese dia.
+            {"event_type": "overload", "branch_label": "C-05", "alerts": 0, "tickets_opened": 0, "tickets_closed": 1,
+             "peak_current": 0, "peak_power": 0, "power_sum": 0},
+        ]
+
+        with patch.object(report_service, "fetch_rollups", return_value=rows) as mock_fetch, patch.object(
+            report_service, "get_supabase_client"
+        ) as mock_client:
+            summary = report_service.get_period_data(days=7)
+
+        mock_client.return_value.rpc.assert_not_called()
+        start_day, end_day, _ = report_rollups.period_bounds(7)
+        mock_fetch.assert_called_once_with(start_day, end_day)
+        assert summary["total_alerts"] == 3
+        assert summary["total_tickets"] == 2
+        assert summary["tickets_closed"] == 1
+        assert summary["peak_current"] == 16.4
+        assert summary["peak_power"] == 3608.0
+        assert summary["avg_alert_power"] == round((6248.0 + 198.0) / 3, 1)
+        assert summary["affected_branches"] == ["C-01", "C-02"]
+        assert summary["alerts_by_type"] == {"overload": 2, "out_of_schedule_consumption": 1}
+
+    def test_periodo_son_dias_locales_completos(self):
+        # 2026-06-08 02:00 UTC = 2026-06-07 21:00 en Lima.
+        now = datetime(2026, 6, 8, 2, 0, tzinfo=timezone.utc)
+
+        start_day, end_day, period_start = report_rollups.period_bounds(7, now)
+
+        assert (start_day, end_day) == ("2026-06-01", "2026-06-07")
+        assert period_start.isoformat() == "2026-06-01T00:00:00-05:00"
+        assert report_rollups.period_bounds(1, now)[:2] == ("2026-06-07", "2026-06-07")
+
+    def test_sin_tabla_de_agregados_usa_la_consulta_sql_con_los_mismos_limites(self):
+        client = MagicMock()
+        client.rpc.return_value.execute.return_value.data = {"total_alerts": 4}
+
+        with patch.object(report_service, "fetch_rollups", side_effect=RuntimeError("relation does not exist")), patch.object(
+            report_service, "get_supabase_client", return_value=client
+        ):
+            summary = report_service.get_period_data(days=7)
+
+        params = client.rpc.call_args.args[1]
+        assert summary["total_alerts"] == 4
+        assert params["period_start"] == report_rollups.period_bounds(7)[2].isoformat() == summary["period_start"]
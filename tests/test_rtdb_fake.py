@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from tools.bench.bench_ingest_path import compare, run_scenario
+from tools.bench.rtdb_fake import FakeRealtimeDatabase
+
+
+@pytest.mark.unitaria
+class TestFakeRealtimeDatabase:
+    def test_lecturas_y_escrituras_copian_y_borran_nodos_vacios(self):
+        fake = FakeRealtimeDatabase()
+        record = {"irms": 1.5, "detalle": {"estado": "Normal"}}
+
+        fake.reference("/current_data/C-01").set(record)
+        record["irms"] = 9.0
+        leido = fake.reference("/current_data/C-01").get()
+        leido["detalle"]["estado"] = "Sobrecarga"
+
+        assert fake.reference("current_data/C-01/irms").get() == 1.5
+        assert fake.reference("/current_data/C-01/detalle/estado").get() == "Normal"
+        fake.reference("/current_data/C-01").update({"detalle": None, "irms": None})
+        assert fake.reference("/current_data").get() is None
+        assert fake.calls == {"set": 1, "get": 4, "update": 1}
+
+    def test_consultas_ordenan_como_firebase_y_push_conserva_el_orden(self):
+        fake = FakeRealtimeDatabase({"history": {"C-01": {"10": 1, "9": 2, "b": 3, "a": 4}}})
+        reference = fake.reference("/history/C-01")
+
+        assert list(reference.order_by_key().get()) == ["9", "10", "a", "b"]
+        assert list(reference.order_by_key().limit_to_last(2).get()) == ["a", "b"]
+        assert list(reference.order_by_value().limit_to_first(2).get()) == ["10", "9"]
+        keys = [fake.reference("/app_consents/ana").push({"n": index}).key for index in range(20)]
+        assert keys == sorted(keys)
+        with pytest.raises(ValueError):
+            fake.reference("/history/C.01").set({"irms": 1})
+
+    def test_latencia_inyectada_por_viaje(self):
+        fake = FakeRealtimeDatabase(latency_seconds=0.05)
+        started = time.perf_counter()
+        fake.reference("/a").set(1)
+        fake.reference("/a").get()
+
+        assert fake.total_calls() == 2
+        assert time.perf_counter() - started >= 0.1
+
+
+@pytest.mark.unitaria
+class TestBenchIngesta:
+    def test_ingesta_con_cache_caliente_hace_dos_escrituras(self):
+        result = asyncio.run(run_scenario("ingest", 5, history_size=5, warmup=1))
+
+        assert result["statuses"] == {"201": 5}
+        assert result["db_calls"] == {"set": 10}
+        assert result["db_calls_per_request"] == 2.0
+
+    def test_comparacion_detecta_llamadas_extra_y_p95(self):
+        base = {"ingest": {"db_calls_per_request": 2.0, "p95_ms": 10.0, "statuses": {"201": 5}}}
+        peor = {"ingest": {"db_calls_per_request": 4.0, "p95_ms": 20.0, "statuses": {"201": 5}}}
+
+        assert compare(base, base, tolerance=0.25) == []
+        assert len(compare(peor, base, tolerance=0.25)) == 2
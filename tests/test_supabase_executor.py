@@ -0,0 +1,81 @@
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.db import supabase as supabase_db
+from app.main import app
+from app.services.admission_control import iot_admission_controller
+from app.services.ingest_idempotency import ingest_idempotency_cache
+
+IOT_HEADERS = {"X-Safyra-Iot-Token": "test-iot-token"}
+SLOW_QUERY_SECONDS = 0.4
+
+
+def _normal_sensor() -> dict:
+    return {
+        "id": "C-01",
+        "room_name": "Laboratorio de Computo",
+        "circuito": "C-01",
+        "irms": 2.1,
+        "potencia": 462.0,
+        "is_overload": False,
+        "is_out_of_schedule": False,
+        "timestamp": "2026-06-03T06:15:30-05:00",
+        "estado": "Normal",
+        "schedule": {"is_scheduled_now": True, "blocked_by_no_class": False, "label": "En horario"},
+    }
+
+
+def _slow_tickets_client() -> MagicMock:
+    client = MagicMock()
+
+    def slow_execute():
+        time.sleep(SLOW_QUERY_SECONDS)
+        return MagicMock(data=[])
+
+    query = client.table.return_value.select.return_value.order.return_value.order.return_value
+    query.limit.return_value.execute.side_effect = slow_execute
+    return client
+
+
+@pytest.mark.unitaria
+class TestSupabaseExecutor:
+    def setup_method(self) -> None:
+        ingest_idempotency_cache.clear()
+        iot_admission_controller.reset()
+
+    @patch("app.routers.data_api.record_iot_reading")
+    def test_ingesta_no_espera_a_consultas_lentas_de_tickets(self, mock_record):
+        mock_record.return_value = _normal_sensor()
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                tickets = [asyncio.create_task(client.get("/api/tickets/")) for _ in range(4)]
+                started = time.perf_counter()
+                ingest = await client.post(
+                    "/api/data/iot/readings", headers=IOT_HEADERS, json={"sensor_id": "C-01", "irms": 2.1}
+                )
+                ingest_latency = time.perf_counter() - started
+                responses = await asyncio.gather(*tickets)
+            return ingest, ingest_latency, responses
+
+        with patch("app.routers.tickets_api.get_supabase_client", return_value=_slow_tickets_client()):
+            ingest, ingest_latency, responses = asyncio.run(scenario())
+
+        assert ingest.status_code == 201
+        assert ingest_latency < SLOW_QUERY_SECONDS / 2
+        assert [response.status_code for response in responses] == [200] * 4
+
+    def test_consulta_que_excede_el_timeout_devuelve_504(self):
+        async def scenario():
+            await supabase_db.run_supabase(lambda: time.sleep(0.3), timeout=0.05)
+
+        with pytest.raises(HTTPException) as exc_info:
+            asyncio.run(scenario())
+
+        assert exc_info.value.status_code == 504
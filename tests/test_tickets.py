@@ -0,0 +1,301 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.routers import tickets_api
+from app.services import ticket_service
+from app.services.ticket_service import TicketBatcher
+
+
+class _FakeSupabase:
+    """``create_alert_tickets`` en memoria: cada fila se inserta o falla por separado
+    y una alerta con ticket abierto del mismo sensor y tipo suma una ocurrencia."""
+
+    def __init__(self, failing_sensors: set[str] | None = None, transport_failures: int = 0) -> None:
+        self.calls: list[tuple[str, dict]] = []
+        self.failing_sensors = failing_sensors or set()
+        self.transport_failures = transport_failures
+        self.events: dict[str, dict] = {}
+        self.tickets: dict[str, dict] = {}
+        self.open_tickets: dict[str, dict] = {}
+
+    def rpc(self, name: str, params: dict):
+        self.calls.append((name, params))
+        result = MagicMock()
+        if self.transport_failures:
+            self.transport_failures -= 1
+            result.execute.side_effect = RuntimeError("timeout de red")
+            return result
+        rows = []
+        for row in params["p_rows"]:
+            event, ticket = row["event"], row["ticket"]
+            if event["sensor_id"] in self.failing_sensors:
+                rows.append({"ticket_code": ticket["ticket_code"], "error": "violates check constraint"})
+                continue
+            open_key = f"{event['sensor_id']}:{ticket['issue_type']}"
+            if event["id"] in self.events:
+                # Reintento: no se vuelve a contar la ocurrencia.
+                stored = self.tickets.get(ticket["ticket_code"]) or self.open_tickets[open_key]
+                rows.append({"ticket_code": ticket["ticket_code"], "id": stored["id"], "created": stored is self.tickets.get(ticket["ticket_code"])})
+                continue
+            self.events[event["id"]] = event
+            stored = self.open_tickets.get(open_key)
+            if stored is None:
+                stored = {**ticket, "id": f"ticket-{ticket['ticket_code']}", "occurrence_count": 1}
+                self.tickets[ticket["ticket_code"]] = self.open_tickets[open_key] = stored
+                rows.append({"ticket_code": ticket["ticket_code"], "id": stored["id"], "created": True})
+            else:
+                stored["occurrence_count"] += 1
+                rows.append({"ticket_code": ticket["ticket_code"], "id": stored["id"], "created": False})
+        result.execute.return_value.data = rows
+        return result
+
+
+def _alert(sensor_id: str, **kwargs):
+    return ticket_service.handle_critical_alert(
+        event_type="overload", sensor_id=sensor_id, severity="Alta", irms=16.0, power=3500.0, **kwargs
+    )
+
+
+@pytest.mark.unitaria
+class TestTicketBatcher:
+    def test_alertas_concurrentes_se_insertan_en_un_solo_lote(self):
+        fake = _FakeSupabase()
+        batcher = TicketBatcher(window_seconds=0.1, client_factory=lambda: fake)
+        futures: dict[str, object] = {}
+
+        def alert(sensor_id: str) -> None:
+            futures[sensor_id] = _alert(sensor_id)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            threads = [threading.Thread(target=alert, args=(f"C-0{index}",)) for index in range(1, 6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results = {sensor_id: future.result(timeout=2) for sensor_id, future in futures.items()}
+
+        assert [name for name, _ in fake.calls] == ["create_alert_tickets"]
+        rows = fake.calls[0][1]["p_rows"]
+        assert len(rows) == 5
+        for row in rows:
+            assert row["ticket"]["event_id"] == row["event"]["id"]
+            assert row["ticket"]["priority"] == "Alta"
+            assert results[row["event"]["sensor_id"]] == f"ticket-{row['ticket']['ticket_code']}"
+        assert batcher.snapshot()["batches_flushed"] == 1
+
+    def test_alerta_no_espera_al_insert_del_lote(self):
+        fake = _FakeSupabase()
+        batcher = TicketBatcher(window_seconds=0.3, client_factory=lambda: fake)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            started = time.perf_counter()
+            future = _alert("C-01")
+            elapsed = time.perf_counter() - started
+            ticket_id = future.result(timeout=2)
+
+        assert elapsed < 0.1
+        assert ticket_id.startswith("ticket-TCK-")
+
+    def test_fila_invalida_solo_falla_su_alerta(self):
+        fake = _FakeSupabase(failing_sensors={"C-02"})
+        batcher = TicketBatcher(window_seconds=0.05, client_factory=lambda: fake)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            futures = [_alert(sensor_id) for sensor_id in ("C-01", "C-02", "C-03")]
+            ok_first, failed, ok_last = futures
+            assert ok_first.result(timeout=2).startswith("ticket-")
+            assert ok_last.result(timeout=2).startswith("ticket-")
+            with pytest.raises(Exception, match="check constraint"):
+                failed.result(timeout=2)
+
+        assert len(fake.calls) == 1
+        assert batcher.snapshot()["rows_failed"] == 1
+
+    def test_lote_se_reintenta_sin_duplicar_filas(self):
+        fake = _FakeSupabase(transport_failures=1)
+        batcher = TicketBatcher(window_seconds=0, client_factory=lambda: fake, retry_backoff_seconds=0)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            ticket_id = _alert("C-01").result(timeout=2)
+
+        assert len(fake.calls) == 2
+        assert fake.calls[0][1] == fake.calls[1][1]
+        assert list(fake.tickets.values())[0]["id"] == ticket_id
+        assert len(fake.events) == 1
+
+    def test_fallo_del_lote_se_reporta_en_el_future(self):
+        fake = _FakeSupabase(transport_failures=ticket_service.BATCH_RETRY_ATTEMPTS)
+        batcher = TicketBatcher(window_seconds=0, client_factory=lambda: fake, retry_backoff_seconds=0)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            future = _alert("C-01")
+
+        with pytest.raises(RuntimeError, match="timeout de red"):
+            future.result(timeout=2)
+        assert len(fake.calls) == ticket_service.BATCH_RETRY_ATTEMPTS
+
+    def test_flush_al_apagar_inserta_las_alertas_pendientes(self):
+        fake = _FakeSupabase(transport_failures=1)
+        batcher = TicketBatcher(window_seconds=30, client_factory=lambda: fake, retry_backoff_seconds=0)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            futures = [_alert(sensor_id) for sensor_id in ("C-01", "C-02", "C-03")]
+            started = time.perf_counter()
+            drained = batcher.flush(timeout=2)
+
+        assert drained == 3
+        assert time.perf_counter() - started < 1
+        assert all(future.done() and future.result().startswith("ticket-") for future in futures)
+        assert len(fake.calls) == 2
+        assert batcher.snapshot()["pending"] == 0
+
+
+@pytest.mark.unitaria
+class TestTicketsAbiertos:
+    def test_alerta_repetida_suma_ocurrencia_en_el_servidor(self):
+        fake = _FakeSupabase()
+        batcher = TicketBatcher(window_seconds=0, client_factory=lambda: fake)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            first = _alert("C-02").result()
+            second = _alert("C-02").result()
+            other = _alert("C-03").result()
+
+        assert first == second != other
+        assert fake.open_tickets["C-02:overload"]["occurrence_count"] == 2
+        assert batcher.snapshot()["tickets_created"] == 2
+        assert batcher.snapshot()["occurrences_merged"] == 1
+
+    def test_workers_distintos_comparten_el_ticket_abierto(self):
+        fake = _FakeSupabase()
+        worker_a = TicketBatcher(window_seconds=0, client_factory=lambda: fake)
+        worker_b = TicketBatcher(window_seconds=0, client_factory=lambda: fake)
+
+        with patch.object(ticket_service, "ticket_batcher", worker_a):
+            first = _alert("C-01").result()
+        with patch.object(ticket_service, "ticket_batcher", worker_b):
+            second = _alert("C-01").result()
+
+        assert first == second
+        assert len(fake.tickets) == 1
+        assert fake.open_tickets["C-01:overload"]["occurrence_count"] == 2
+
+    def test_reintento_no_cuenta_dos_veces_la_ocurrencia(self):
+        fake = _FakeSupabase()
+        batcher = TicketBatcher(window_seconds=0, client_factory=lambda: fake, retry_backoff_seconds=0)
+
+        with patch.object(ticket_service, "ticket_batcher", batcher):
+            _alert("C-01").result()
+            original_rpc = fake.rpc
+            calls = []
+
+            def rpc_que_pierde_la_respuesta(name, params):
+                result = original_rpc(name, params)
+                if not calls:
+                    calls.append(name)
+                    result.execute.side_effect = RuntimeError("respuesta perdida")
+                return result
+
+            fake.rpc = rpc_que_pierde_la_respuesta
+            _alert("C-01").result()
+
+        assert fake.open_tickets["C-01:overload"]["occurrence_count"] == 2
+
+    def test_patch_de_estado_no_depende_de_estado_local(self, test_client):
+        client = MagicMock()
+        client.table.return_value.update.return_value.eq.return_value.execute.return_value.data = [
+            {"id": "tck-5", "status": "En revisión"}
+        ]
+
+        with patch("app.routers.tickets_api.get_supabase_client", return_value=client):
+            response = test_client.patch("/api/tickets/tck-5", json={"status": "En revisión"})
+
+        assert response.status_code == 200
+        assert response.json()["data"]["status"] == "En revisión"
+
+
+class _RecordingQuery:
+    """Builder de PostgREST que registra los filtros aplicados."""
+
+    def __init__(self, rows: list[dict], count: int | None = None) -> None:
+        self.rows = rows
+        self.count = count
+        self.calls: list[tuple] = []
+
+    def __getattr__(self, name: str):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+
+        return record
+
+    def execute(self):
+        return MagicMock(data=self.rows, count=self.count)
+
+
+def _ticket_row(index: int) -> dict:
+    return {
+        "id": f"00000000-0000-4000-8000-{index:012d}",
+        "ticket_code": f"TCK-2026-{index:04d}",
+        "issue_type": "overload",
+        "priority": "Alta",
+        "status": "Abierto",
+        "created_at": f"2026-06-{index:02d}T10:00:00+00:00",
+        "audit_events": {"sensor_id": "C-01", "branch_label": "C-01"},
+    }
+
+
+@pytest.mark.unitaria
+class TestTicketsPagination:
+    def _get(self, test_client, query: _RecordingQuery, url: str):
+        client = MagicMock()
+        client.table.return_value = query
+        with patch("app.routers.tickets_api.get_supabase_client", return_value=client):
+            return test_client.get(url)
+
+    def test_pagina_devuelve_cursor_cuando_hay_mas_filas(self, test_client):
+        query = _RecordingQuery([_ticket_row(index) for index in (9, 8, 7)])
+
+        response = self._get(test_client, query, "/api/tickets/?limit=2")
+
+        body = response.json()
+        assert response.status_code == 200
+        assert [ticket["ticket_code"] for ticket in body["data"]] == ["TCK-2026-0009", "TCK-2026-0008"]
+        assert tickets_api.decode_cursor(body["next_cursor"]) == ("2026-06-08T10:00:00+00:00", _ticket_row(8)["id"])
+        assert ("limit", (3,), {}) in query.calls
+        assert ("order", ("id",), {"desc": True}) in query.calls
+
+    def test_cursor_y_filtros_se_aplican_en_el_servidor(self, test_client):
+        query = _RecordingQuery([_ticket_row(1)])
+        cursor = tickets_api.encode_cursor("2026-06-02T10:00:00+00:00", _ticket_row(2)["id"])
+
+        response = self._get(
+            test_client, query, f"/api/tickets/?cursor={cursor}&status=Abierto&priority=Alta&sensor_id=C-01"
+        )
+
+        assert response.status_code == 200
+        assert response.json()["next_cursor"] is None
+        assert ("eq", ("status", "Abierto"), {}) in query.calls
+        assert ("eq", ("priority", "Alta"), {}) in query.calls
+        assert ("eq", ("audit_events.sensor_id", "C-01"), {}) in query.calls
+        assert "audit_events!inner(" in query.calls[0][1][0]
+        keyset = next(args[0] for name, args, _ in query.calls if name == "or_")
+        assert keyset.startswith('created_at.lt."2026-06-02T10:00:00+00:00"')
+        assert _ticket_row(2)["id"] in keyset
+
+    def test_cursor_invalido_devuelve_400(self, test_client):
+        response = self._get(test_client, _RecordingQuery([]), "/api/tickets/?cursor=no-es-un-cursor")
+
+        assert response.status_code == 400
+
+    def test_conteo_no_transfiere_filas(self, test_client):
+        query = _RecordingQuery([], count=1234)
+
+        response = self._get(test_client, query, "/api/tickets/count?status=Cerrado")
+
+        assert response.json() == {"count": 1234}
+        assert query.calls[0][2] == {"count": "exact", "head": True}
+        assert ("eq", ("status", "Cerrado"), {}) in query.calls
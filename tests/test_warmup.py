@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from unittest.mock import patch
+
+import pytest
+
+from app.db import firebase as firebase_db
+from app.db import supabase as supabase_db
+from app.services.warmup import WarmupState, warmup_state
+
+
+@pytest.mark.unitaria
+class TestReadiness:
+    def setup_method(self) -> None:
+        warmup_state.reset()
+
+    def teardown_method(self) -> None:
+        warmup_state.reset()
+
+    def test_ready_responde_503_hasta_terminar_el_calentamiento(self, test_client):
+        before = test_client.get("/ready")
+
+        def falla():
+            raise RuntimeError("Supabase caido")
+
+        asyncio.run(warmup_state.run({"thresholds": lambda: None, "supabase": falla}))
+        after = test_client.get("/ready")
+
+        assert before.status_code == 503
+        assert before.json()["status"] == "pending"
+        assert after.status_code == 200
+        assert after.json()["status"] == "degraded"
+        assert after.json()["steps"]["supabase"]["error"] == "Supabase caido"
+        assert test_client.get("/health").status_code == 200
+
+    def test_pasos_se_ejecutan_en_paralelo(self):
+        state = WarmupState()
+        started = time.perf_counter()
+
+        asyncio.run(state.run({"a": lambda: time.sleep(0.2), "b": lambda: time.sleep(0.2)}))
+
+        assert time.perf_counter() - started < 0.35
+        assert state.status() == "ready"
+
+    def test_calentamiento_de_supabase_consulta_la_tabla_de_tickets(self):
+        with patch.object(supabase_db, "SUPABASE_URL", "https://demo.supabase.co"), \
+                patch.object(supabase_db, "SUPABASE_KEY", "service-role"), \
+                patch.object(supabase_db, "get_supabase_client") as mock_client:
+            assert supabase_db.warm_supabase_connection() is True
+
+        mock_client.return_value.table.assert_called_once_with("maintenance_tickets")
+
+
+@pytest.mark.unitaria
+class TestAvisoWorkers:
+    def test_con_varios_workers_advierte_el_estado_por_proceso(self, capsys, monkeypatch):
+        from app import main
+
+        monkeypatch.setenv("UVICORN_WORKERS", "3")
+        main._warn_per_process_state()
+        aviso = capsys.readouterr().out
+
+        monkeypatch.setenv("UVICORN_WORKERS", "1")
+        main._warn_per_process_state()
+
+        assert "3 workers" in aviso
+        assert "reintentos IoT" in aviso
+        assert "admision IoT" in aviso
+        assert capsys.readouterr().out == ""
+
+
+@pytest.mark.unitaria
+class TestConfigCache:
+    def test_umbral_se_lee_una_vez_y_se_invalida_al_editar(self, reset_firebase_mock):
+        reference = reset_firebase_mock.reference.return_value
+        reference.get.return_value = {"corriente": 9.0, "potencia": 1980.0}
+
+        first = firebase_db.get_sensor_threshold("C-01")
+        firebase_db.get_sensor_threshold("C-01")
+        assert reference.get.call_count == 1
+
+        assert firebase_db.update_sensor_threshold("C-01", 8.0, 1760.0) is True
+        reference.get.return_value = {"corriente": 8.0, "potencia": 1760.0}
+
+        assert first["corriente"] == 9.0
+        assert firebase_db.get_sensor_threshold("C-01")["corriente"] == 8.0
+        assert reference.get.call_count == 2
+
+    def test_calentamiento_de_umbrales_usa_una_sola_lectura(self, reset_firebase_mock):
+        reset_firebase_mock.reference.return_value.get.return_value = {
+            sensor_id: {"corriente": 10.0, "potencia": 2200.0} for sensor_id in firebase_db.SENSOR_IDS
+        }
+
+        warmed = firebase_db.warm_sensor_thresholds()
+        for sensor_id in firebase_db.SENSOR_IDS:
+            firebase_db.get_sensor_threshold(sensor_id)
+
+        assert set(warmed) == set(firebase_db.SENSOR_IDS)
+        reset_firebase_mock.reference.assert_called_once_with("/config/thresholds")
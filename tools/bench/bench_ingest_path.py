@@ -0,0 +1,252 @@
+"""Benchmark del camino de ingesta y lectura contra un Realtime Database en memoria.
+
+Recorre por HTTP (ASGI, sin red) la ingesta IoT, los datos actuales, el
+historial, las alertas y las dos exportaciones, con ``firebase_admin.db``
+reemplazado por ``FakeRealtimeDatabase`` y una latencia inyectada por viaje.
+Reporta throughput, p50/p95/p99 y llamadas a Firebase por request, y compara
+contra una linea base guardada: termina con codigo 1 si algun escenario hace
+mas llamadas que la base o su p95 empeora mas que ``--tolerance``.
+
+    python tools/bench/bench_ingest_path.py --save-baseline
+    python tools/bench/bench_ingest_path.py --latency-ms 5 --concurrency 4
+
+Las llamadas por request no dependen de la maquina; los tiempos si, por eso la
+linea base debe regenerarse en la maquina donde se compara.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable
+from unittest.mock import patch
+
+if __package__ in {None, ""}:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from tools.bench.profile_imports import IMPORT_ENV_DEFAULTS  # noqa: E402
+
+for _name, _value in {**IMPORT_ENV_DEFAULTS, "SAFYRA_IOT_TOKEN": "bench-iot-token", "TERMS_REQUIRED_ROLES": ""}.items():
+    os.environ.setdefault(_name, _value)
+
+import httpx  # noqa: E402
+
+from app.db import firebase as firebase_module  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers.auth_api import create_access_token  # noqa: E402
+from tools.bench.rtdb_fake import FakeRealtimeDatabase  # noqa: E402
+
+DEFAULT_BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "ingest_path.json"
+
+# Por debajo de la corriente residual: sin alertas, se mide solo la escritura.
+INGEST_IRMS = 0.12
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def seed_tree(history_per_sensor: int, alert_every: int = 10) -> dict[str, Any]:
+    """Umbrales, datos actuales e historial con la forma que escribe ``record_iot_reading``."""
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    thresholds = {sensor_id: {"corriente": 11.0, "potencia": 2420.0} for sensor_id in firebase_module.SENSOR_IDS}
+    current: dict[str, Any] = {}
+    history: dict[str, Any] = {}
+    for sensor_index, sensor_id in enumerate(firebase_module.SENSOR_IDS):
+        records = {}
+        for index in range(history_per_sensor):
+            moment = now - timedelta(minutes=history_per_sensor - index)
+            overload = alert_every > 0 and index % alert_every == 0
+            irms = 11.8 if overload else 0.18 + (index % 5) * 0.02
+            records[f"{moment:%Y%m%dT%H%M%SZ}_{sensor_index:02x}{index:06x}"] = {
+                "circuito": sensor_id,
+                "estado": "Sobrecarga" if overload else "Normal",
+                "irms": irms,
+                "potencia": round(irms * 220.0, 3),
+                "timestamp": moment.astimezone(firebase_module.LOCAL_TIMEZONE).isoformat(),
+                "timestamp_utc": moment.isoformat().replace("+00:00", "Z"),
+                "room_name": firebase_module.ROOM_LABELS.get(sensor_id, sensor_id),
+                "is_overload": overload,
+                "is_out_of_schedule": False,
+                "schedule_room_id": firebase_module.LAB_ROOM_ID,
+            }
+        history[sensor_id] = records
+        latest_key = max(records) if records else None
+        if latest_key:
+            current[sensor_id] = {
+                key: value for key, value in records[latest_key].items() if key not in {"room_name", "is_overload", "is_out_of_schedule"}
+            }
+    return {"config": {"thresholds": thresholds}, "current_data": current, "history": history}
+
+
+def _ingest(index: int) -> dict[str, Any]:
+    return {
+        "method": "POST",
+        "url": "/api/data/iot/readings",
+        "headers": {"X-Safyra-Iot-Token": os.environ["SAFYRA_IOT_TOKEN"]},
+        "json": {"sensor_id": "C-01", "irms": INGEST_IRMS, "device_seq": index},
+    }
+
+
+def _get(url: str) -> Callable[[int], dict[str, Any]]:
+    return lambda index: {"method": "GET", "url": url}
+
+
+SCENARIOS: dict[str, Callable[[int], dict[str, Any]]] = {
+    "ingest": _ingest,
+    "current_data": _get("/api/data/current"),
+    "history": _get("/api/data/history/C-01?limit=50"),
+    "alerts": _get("/api/data/alerts"),
+    "export_csv": _get("/api/data/export/csv"),
+    "export_excel": _get("/api/data/export/excel"),
+}
+
+
+async def run_scenario(
+    name: str,
+    iterations: int,
+    *,
+    latency_ms: float = 0.0,
+    history_size: int = 200,
+    concurrency: int = 1,
+    warmup: int = 3,
+) -> dict[str, Any]:
+    """Un escenario sobre un arbol recien sembrado; el calentamiento no cuenta en las metricas."""
+    build_request = SCENARIOS[name]
+    fake = FakeRealtimeDatabase(seed_tree(history_size), latency_seconds=latency_ms / 1000)
+    token = create_access_token({"sub": os.getenv("ADMIN_USERNAME", "admin"), "role": "admin"})
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    sequence = iter(range(warmup + iterations))
+
+    async def send(client: httpx.AsyncClient, measured: bool) -> None:
+        request = build_request(next(sequence))
+        request.setdefault("headers", {})["Authorization"] = f"Bearer {token}"
+        started = time.perf_counter()
+        response = await client.request(**request)
+        if measured:
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async def worker(client: httpx.AsyncClient, count: int) -> None:
+        for _ in range(count):
+            await send(client, measured=True)
+
+    firebase_module.invalidate_config_cache()
+    with patch.object(firebase_module, "db", fake), patch.dict(os.environ, {"IOT_ADMISSION_ENABLED": "false"}):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for _ in range(warmup):
+                await send(client, measured=False)
+            fake.reset_calls()
+            workers = max(1, min(concurrency, iterations))
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(worker(client, iterations // workers + (1 if index < iterations % workers else 0)) for index in range(workers))
+            )
+            elapsed = time.perf_counter() - started
+    firebase_module.invalidate_config_cache()
+
+    return {
+        "requests": iterations,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "ops_per_second": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "db_calls_per_request": round(fake.total_calls() / iterations, 2),
+        "db_calls": dict(sorted(fake.calls.items())),
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float, slack_ms: float = 1.0) -> list[str]:
+    """Regresiones frente a la base: mas llamadas a Firebase o p95 fuera de tolerancia."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # Margen minimo: una exportacion larga puede cruzar el TTL de la cache de umbrales y releerlos.
+        if result["db_calls_per_request"] > base["db_calls_per_request"] * 1.05 + 0.01:
+            regressions.append(
+                f"{name}: {result['db_calls_per_request']} llamadas/request (base {base['db_calls_per_request']})"
+            )
+        allowed_p95 = base["p95_ms"] * (1 + tolerance) + slack_ms
+        if result["p95_ms"] > allowed_p95:
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms (base {base['p95_ms']} ms, limite {allowed_p95:.2f} ms)")
+        if set(result["statuses"]) != set(base.get("statuses", result["statuses"])):
+            regressions.append(f"{name}: estados HTTP {result['statuses']} (base {base['statuses']})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta y lecturas contra un RTDB en memoria")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="latencia inyectada por viaje a Firebase")
+    parser.add_argument("--history-size", type=int, default=200, help="registros de historial por sensor")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="repetible; por defecto todos")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="guarda el resultado como nueva base")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="empeoramiento de p95 permitido (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    config = {
+        "latency_ms": args.latency_ms,
+        "history_size": args.history_size,
+        "concurrency": args.concurrency,
+        "iterations": args.iterations,
+    }
+    names = args.scenario or list(SCENARIOS)
+    results = {
+        name: asyncio.run(
+            run_scenario(
+                name,
+                args.iterations,
+                latency_ms=args.latency_ms,
+                history_size=args.history_size,
+                concurrency=args.concurrency,
+                warmup=args.warmup,
+            )
+        )
+        for name in names
+    }
+
+    print(f"Ingesta/lecturas: {json.dumps(config)}")
+    print(f"  {'escenario':<14} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'db/req':>7}  estados")
+    for name, result in results.items():
+        print(
+            f"  {name:<14} {result['ops_per_second']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f}"
+            f" {result['p99_ms']:>8.2f} {result['db_calls_per_request']:>7.2f}  {result['statuses']}"
+        )
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"config": config, "scenarios": results}, indent=2) + "\n", encoding="utf-8")
+        print(f"\nLinea base guardada en {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"\nSin linea base en {args.baseline}; usa --save-baseline para crearla")
+        return 0
+
+    stored = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if stored.get("config") != config:
+        print(f"\nAVISO: la base se genero con otra configuracion: {json.dumps(stored.get('config'))}")
+    regressions = compare(results, stored.get("scenarios", {}), args.tolerance)
+    if regressions:
+        print("\nERROR: regresiones frente a la linea base:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nSin regresiones frente a la linea base")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
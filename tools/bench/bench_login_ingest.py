@@ -0,0 +1,113 @@
+"""Benchmark: latencia de ingesta IoT durante una rafaga de logins.
+
+Lanza ``--logins`` logins locales (bcrypt real) desde varias IPs mientras un
+ESP32 simulado envia lecturas, y reporta p50/p99 de la ingesta. ``--inline``
+reproduce el comportamiento anterior (bcrypt dentro del event loop).
+
+La escritura en Firebase se reemplaza por una respuesta fija: se mide el
+event loop de la API, no la red.
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+if __package__ in {None, ""}:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+ADMIN_PASSWORD = secrets.token_urlsafe(18)
+IOT_TOKEN = "bench-iot-token"
+
+os.environ.setdefault("SKIP_FIREBASE_INIT", "1")
+os.environ.update(
+    {
+        "AUTH_PROVIDER": "local",
+        "ALLOW_LEGACY_PASSWORD_LOGIN": "true",
+        "JWT_SECRET_KEY": "bench-jwt-secret-key",
+        "ADMIN_USERNAME": "admin",
+        "ADMIN_PASSWORD": ADMIN_PASSWORD,
+        "ADMIN_PASSWORD_HASH": "",
+        "SAFYRA_IOT_TOKEN": IOT_TOKEN,
+        "NOTIFICATION_OUTBOX_PATH": ":memory:",
+        "ALERT_COOLDOWN_STORE": "memory",
+        "IOT_ADMISSION_ENABLED": "false",
+    }
+)
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.services.password_hasher import PasswordHashPool  # noqa: E402
+
+NORMAL_READING = {"id": "C-01", "irms": 2.1, "potencia": 462.0, "is_overload": False, "is_out_of_schedule": False}
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def _inline_run(self, func, *args):
+    return func(*args)
+
+
+async def run_burst(logins: int, readings: int, interval: float) -> tuple[list[float], dict[int, int]]:
+    login_statuses: dict[int, int] = {}
+
+    async def login(client_index: int) -> None:
+        transport = httpx.ASGITransport(app=app, client=(f"10.0.{client_index // 250}.{client_index % 250}", 5000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/token", data={"username": "admin", "password": ADMIN_PASSWORD})
+        login_statuses[response.status_code] = login_statuses.get(response.status_code, 0) + 1
+
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        burst = [asyncio.create_task(login(index)) for index in range(logins)]
+        origin = time.perf_counter()
+        for sequence in range(readings):
+            # Cadencia fija: la latencia se mide desde el instante programado, asi un
+            # event loop congelado cuenta para todas las lecturas que se retrasaron.
+            scheduled = origin + sequence * interval
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            response = await client.post(
+                "/api/data/iot/readings",
+                headers={"X-Safyra-Iot-Token": IOT_TOKEN},
+                json={"sensor_id": "C-01", "irms": 2.1, "device_seq": sequence},
+            )
+            latencies.append(time.perf_counter() - scheduled)
+            response.raise_for_status()
+        await asyncio.gather(*burst)
+    return latencies, login_statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latencia de ingesta durante una rafaga de logins")
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--readings", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01, help="segundos entre lecturas")
+    parser.add_argument("--inline", action="store_true", help="bcrypt dentro del event loop (antes)")
+    args = parser.parse_args()
+
+    with patch("app.routers.data_api.record_iot_reading", return_value=NORMAL_READING):
+        if args.inline:
+            with patch.object(PasswordHashPool, "run", _inline_run):
+                latencies, statuses = asyncio.run(run_burst(args.logins, args.readings, args.interval))
+        else:
+            latencies, statuses = asyncio.run(run_burst(args.logins, args.readings, args.interval))
+
+    mode = "bcrypt en el event loop" if args.inline else "bcrypt en pool dedicado"
+    print(f"{args.logins} logins + {args.readings} lecturas ({mode})")
+    print(f"  logins por estado: {dict(sorted(statuses.items()))}")
+    print(f"  ingesta p50: {statistics.median(latencies) * 1000:8.2f} ms")
+    print(f"  ingesta p99: {percentile(latencies, 0.99) * 1000:8.2f} ms")
+    print(f"  ingesta max: {max(latencies) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
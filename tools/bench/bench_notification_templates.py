@@ -0,0 +1,72 @@
+"""Micro-benchmark: correo de alerta para 50 destinatarios.
+
+Compara renderizar el cuerpo completo por destinatario (como antes) contra
+renderizar el cuerpo una vez y solo la cabecera por destinatario.
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+if __package__ in {None, ""}:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.services.notification_templates import render_email_body, render_email_html, render_whatsapp_text
+
+SAMPLE_CONTEXT = {
+    "alert_label": "Sobrecarga electrica",
+    "severity_label": "Critica",
+    "room_name": "Laboratorio de Computo",
+    "room_id": "LAB-PC-01",
+    "circuito": "C-01, C-02, C-03",
+    "schedule_label": "En horario",
+    "detected_at_display": "03/06/2026 06:15:30",
+    "irms": "16.40",
+    "potencia": "3608",
+    "device_type": "Carga alta",
+    "device_description": "Consumo por encima del limite seguro del ramal.",
+    "reference_label": "Umbral",
+    "reference_value": "11.00 A / 2420 W",
+    "intro": "ha detectado una anomalia electrica que requiere su intervencion inmediata.",
+    "summary_title": "Resumen de la emergencia",
+    "action_title": "Accion inmediata requerida",
+    "current_detail": "16.40 A (umbral: 11.00 A)",
+    "power_detail": "3608 W (limite seguro: 2420 W)",
+    "recommended_action": "Cortar la carga del ramal y revisar equipos conectados.",
+    "reason": "La corriente supero el umbral configurado.",
+    "alert_id": "LAB-PC-01-overload-20260603111530-abcd1234",
+}
+
+
+def per_recipient_full_render(names: list[str]) -> list[str]:
+    return [render_email_html(render_email_body(SAMPLE_CONTEXT), name) for name in names]
+
+
+def shared_body_render(names: list[str]) -> list[str]:
+    body_html = render_email_body(SAMPLE_CONTEXT)
+    return [render_email_html(body_html, name) for name in names]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de plantillas de notificacion")
+    parser.add_argument("--recipients", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    names = [f"Usuario {index:02d}" for index in range(args.recipients)]
+    assert per_recipient_full_render(names) == shared_body_render(names)
+
+    results = {
+        "cuerpo por destinatario": timeit.timeit(lambda: per_recipient_full_render(names), number=args.repeat),
+        "cuerpo compartido": timeit.timeit(lambda: shared_body_render(names), number=args.repeat),
+        "whatsapp": timeit.timeit(lambda: render_whatsapp_text(SAMPLE_CONTEXT), number=args.repeat),
+    }
+    print(f"Alerta con {args.recipients} destinatarios, {args.repeat} repeticiones")
+    for label, seconds in results.items():
+        print(f"  {label:<25} {seconds / args.repeat * 1000:8.3f} ms/alerta")
+    speedup = results["cuerpo por destinatario"] / results["cuerpo compartido"]
+    print(f"  mejora cuerpo compartido: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
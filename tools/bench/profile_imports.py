@@ -0,0 +1,101 @@
+"""Perfil de arranque en frio: costo de ``import app.main`` por modulo.
+
+Ejecuta ``python -X importtime`` en un proceso limpio (como un cold start de
+Vercel) y reporta el total, los paquetes mas caros y los modulos de ``app``.
+Sirve como puerta de CI: termina con codigo 1 si el total supera ``--max-ms``
+o si se cargaron dependencias pesadas que deben importarse en el primer uso.
+
+    python tools/bench/profile_imports.py --max-ms 900
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+LAZY_MODULES = ("firebase_admin", "google.auth", "supabase", "postgrest", "fpdf", "openpyxl", "jose")
+
+# Lo minimo para importar la app sin credenciales reales; el entorno del CI tiene prioridad.
+IMPORT_ENV_DEFAULTS = {
+    "SKIP_FIREBASE_INIT": "1",
+    "AUTH_PROVIDER": "local",
+    "JWT_SECRET_KEY": "perfil-imports",
+    "ADMIN_USERNAME": "admin",
+    "ADMIN_PASSWORD_HASH": "perfil-imports",
+    "NOTIFICATION_OUTBOX_PATH": ":memory:",
+    "ALERT_COOLDOWN_STORE": "memory",
+}
+
+_PROBE = (
+    "import json, sys; import app.main; "
+    f"print(json.dumps(sorted(m for m in {LAZY_MODULES!r} if m in sys.modules)))"
+)
+
+
+def profile_cold_import() -> dict:
+    """Un proceso nuevo: tiempos por modulo (microsegundos) y modulos perezosos ya cargados."""
+    env = {**IMPORT_ENV_DEFAULTS, **os.environ}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules: list[tuple[str, int, int]] = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    total_us = next((cumulative for name, _, cumulative in modules if name == "app.main"), 0)
+    return {
+        "total_us": total_us,
+        "modules": modules,
+        "lazy_loaded": json.loads(completed.stdout.strip().splitlines()[-1]),
+    }
+
+
+def by_package(modules: list[tuple[str, int, int]]) -> list[tuple[str, int]]:
+    totals: dict[str, int] = {}
+    for name, self_us, _ in modules:
+        package = name.split(".", 1)[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Costo de importacion en frio de app.main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3, help="se reporta la corrida mas rapida")
+    parser.add_argument("--max-ms", type=float, default=None, help="falla si el total lo supera")
+    args = parser.parse_args()
+
+    profile = min((profile_cold_import() for _ in range(max(1, args.runs))), key=lambda item: item["total_us"])
+    total_ms = profile["total_us"] / 1000
+
+    print(f"import app.main: {total_ms:.1f} ms (mejor de {args.runs})")
+    print("\nPaquetes (tiempo propio):")
+    for package, self_us in by_package(profile["modules"])[: args.top]:
+        print(f"  {package:<28} {self_us / 1000:8.1f} ms")
+    print("\nModulos de app (acumulado):")
+    app_modules = sorted((m for m in profile["modules"] if m[0].startswith("app")), key=lambda m: m[2], reverse=True)
+    for name, _, cumulative_us in app_modules[: args.top]:
+        print(f"  {name:<40} {cumulative_us / 1000:8.1f} ms")
+
+    failed = False
+    if profile["lazy_loaded"]:
+        print(f"\nERROR: dependencias que deberian cargarse en el primer uso: {', '.join(profile['lazy_loaded'])}")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"\nERROR: el arranque en frio ({total_ms:.1f} ms) supera el limite de {args.max_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""Firebase Realtime Database en memoria para benchmarks y pruebas.
+
+Reemplaza a ``firebase_admin.db`` (``patch.object(app.db.firebase, "db", fake)``)
+con la misma semantica que usa la app: rutas con ``/``, valores JSON copiados en
+cada lectura y escritura, ``None`` o ``{}`` borran el nodo, ``push`` genera claves
+ordenadas por tiempo y las consultas ``order_by_*`` devuelven ``OrderedDict``.
+
+Cada operacion de red suma en ``calls`` y espera ``latency_seconds``, asi un
+benchmark puede medir tanto el tiempo como el numero de viajes a Firebase.
+"""
+import json
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any
+
+INVALID_KEY_CHARS = set(".$#[]")
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+
+def _split_path(path: str) -> list[str]:
+    segments = [segment for segment in str(path or "/").split("/") if segment]
+    for segment in segments:
+        if INVALID_KEY_CHARS & set(segment):
+            raise ValueError(f"Ruta invalida para Realtime Database: {path}")
+    return segments
+
+
+def _json_copy(value: Any) -> Any:
+    """Copia profunda con las mismas restricciones que el SDK (solo tipos JSON)."""
+    if value is None:
+        return None
+    return _prune(json.loads(json.dumps(value)))
+
+
+def _prune(value: Any) -> Any:
+    # Realtime Database no guarda nodos vacios ni hijos nulos.
+    if not isinstance(value, dict):
+        return value
+    pruned = {}
+    for key, child in value.items():
+        if INVALID_KEY_CHARS & set(key) or "/" in key:
+            raise ValueError(f"Clave invalida para Realtime Database: {key}")
+        child = _prune(child)
+        if child is not None:
+            pruned[key] = child
+    return pruned or None
+
+
+def _key_order(key: str) -> tuple:
+    # Igual que Firebase: claves enteras de 32 bits primero (numericamente), luego el resto.
+    try:
+        number = int(key)
+    except ValueError:
+        return (1, 0, key)
+    if str(number) == key and -(2 ** 31) <= number < 2 ** 31:
+        return (0, number, "")
+    return (1, 0, key)
+
+
+def _value_order(value: Any) -> tuple:
+    if value is None:
+        return (0, 0, "")
+    if value is False or value is True:
+        return (1, int(value), "")
+    if isinstance(value, (int, float)):
+        return (2, value, "")
+    if isinstance(value, str):
+        return (3, 0, value)
+    return (4, 0, "")
+
+
+class FakeRealtimeDatabase:
+    """Arbol JSON compartido; ``reference`` tiene la firma de ``firebase_admin.db``."""
+
+    def __init__(self, data: dict | None = None, *, latency_seconds: float = 0.0) -> None:
+        self.latency_seconds = latency_seconds
+        self.calls: Counter[str] = Counter()
+        self._root: dict = _json_copy(data) or {}
+        self._lock = threading.RLock()
+        self._last_push_ms = 0
+        self._last_push_suffix: list[int] = []
+
+    def reference(self, path: str = "/", app: Any = None, url: str | None = None) -> "FakeReference":
+        return FakeReference(self, _split_path(path))
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset_calls(self) -> None:
+        self.calls.clear()
+
+    def dump(self) -> dict:
+        with self._lock:
+            return _json_copy(self._root) or {}
+
+    def _round_trip(self, operation: str) -> None:
+        self.calls[operation] += 1
+        if self.latency_seconds > 0:
+            time.sleep(self.latency_seconds)
+
+    def _read(self, segments: list[str]) -> Any:
+        with self._lock:
+            node: Any = self._root
+            for segment in segments:
+                if not isinstance(node, dict) or segment not in node:
+                    return None
+                node = node[segment]
+            return _json_copy(node)
+
+    def _write(self, segments: list[str], value: Any) -> None:
+        value = _json_copy(value)
+        with self._lock:
+            if not segments:
+                self._root = value if isinstance(value, dict) else {}
+                return
+            parents = [self._root]
+            node = self._root
+            for segment in segments[:-1]:
+                child = node.get(segment)
+                if not isinstance(child, dict):
+                    if value is None:
+                        return
+                    child = node[segment] = {}
+                parents.append(child)
+                node = child
+            if value is None:
+                node.pop(segments[-1], None)
+            else:
+                node[segments[-1]] = value
+            # Un padre que queda vacio desaparece, como en Firebase.
+            for depth in range(len(parents) - 1, 0, -1):
+                if parents[depth]:
+                    break
+                parents[depth - 1].pop(segments[depth - 1], None)
+
+    def _next_push_key(self) -> str:
+        # Mismo formato que los push IDs de Firebase: 8 caracteres de tiempo + 12 aleatorios
+        # que se incrementan dentro del mismo milisegundo para conservar el orden.
+        with self._lock:
+            now_ms = int(time.time() * 1000)
+            if now_ms == self._last_push_ms:
+                for index in range(11, -1, -1):
+                    if self._last_push_suffix[index] < 63:
+                        self._last_push_suffix[index] += 1
+                        break
+                    self._last_push_suffix[index] = 0
+            else:
+                self._last_push_ms = now_ms
+                self._last_push_suffix = [random.randrange(64) for _ in range(12)]
+            prefix = ""
+            remaining = now_ms
+            for _ in range(8):
+                prefix = PUSH_CHARS[remaining % 64] + prefix
+                remaining //= 64
+            return prefix + "".join(PUSH_CHARS[index] for index in self._last_push_suffix)
+
+
+class FakeReference:
+    def __init__(self, database: FakeRealtimeDatabase, segments: list[str]) -> None:
+        self._database = database
+        self._segments = segments
+
+    @property
+    def key(self) -> str | None:
+        return self._segments[-1] if self._segments else None
+
+    @property
+    def path(self) -> str:
+        return "/" + "/".join(self._segments)
+
+    @property
+    def parent(self) -> "FakeReference | None":
+        if not self._segments:
+            return None
+        return FakeReference(self._database, self._segments[:-1])
+
+    def child(self, path: str) -> "FakeReference":
+        return FakeReference(self._database, self._segments + _split_path(path))
+
+    def get(self, etag: bool = False, shallow: bool = False) -> Any:
+        self._database._round_trip("get")
+        value = self._database._read(self._segments)
+        if shallow and isinstance(value, dict):
+            value = {key: True for key in value}
+        return value
+
+    def set(self, value: Any) -> None:
+        if value is None:
+            raise ValueError("El valor no puede ser None")
+        self._database._round_trip("set")
+        self._database._write(self._segments, value)
+
+    def update(self, value: dict) -> None:
+        if not isinstance(value, dict) or not value:
+            raise ValueError("update requiere un diccionario no vacio")
+        self._database._round_trip("update")
+        with self._database._lock:
+            for path, child_value in value.items():
+                self._database._write(self._segments + _split_path(path), child_value)
+
+    def push(self, value: Any = "") -> "FakeReference":
+        if value is None:
+            raise ValueError("El valor no puede ser None")
+        reference = self.child(self._database._next_push_key())
+        self._database._round_trip("push")
+        self._database._write(reference._segments, value)
+        return reference
+
+    def delete(self) -> None:
+        self._database._round_trip("delete")
+        self._database._write(self._segments, None)
+
+    def listen(self, callback: Any) -> Any:
+        # La app cae a TTL si no puede escuchar; los benchmarks miden ese camino.
+        raise NotImplementedError("El fake no emite eventos de Realtime Database")
+
+    def order_by_key(self) -> "FakeQuery":
+        return FakeQuery(self, "key")
+
+    def order_by_value(self) -> "FakeQuery":
+        return FakeQuery(self, "value")
+
+    def order_by_child(self, path: str) -> "FakeQuery":
+        return FakeQuery(self, "child", _split_path(path))
+
+
+class FakeQuery:
+    def __init__(self, reference: FakeReference, order_by: str, child_segments: list[str] | None = None) -> None:
+        self._reference = reference
+        self._order_by = order_by
+        self._child_segments = child_segments or []
+        self._limit: tuple[str, int] | None = None
+        self._start: Any = None
+        self._end: Any = None
+
+    def limit_to_first(self, limit: int) -> "FakeQuery":
+        return self._with_limit("first", limit)
+
+    def limit_to_last(self, limit: int) -> "FakeQuery":
+        return self._with_limit("last", limit)
+
+    def start_at(self, start: Any) -> "FakeQuery":
+        self._start = start
+        return self
+
+    def end_at(self, end: Any) -> "FakeQuery":
+        self._end = end
+        return self
+
+    def equal_to(self, value: Any) -> "FakeQuery":
+        self._start = self._end = value
+        return self
+
+    def _with_limit(self, side: str, limit: int) -> "FakeQuery":
+        if not isinstance(limit, int) or limit < 0:
+            raise ValueError("El limite debe ser un entero no negativo")
+        if self._limit is not None:
+            raise ValueError("No se pueden combinar limit_to_first y limit_to_last")
+        self._limit = (side, limit)
+        return self
+
+    def _sort_key(self, item: tuple[str, Any]) -> tuple:
+        key, value = item
+        if self._order_by == "key":
+            return _key_order(key)
+        if self._order_by == "child":
+            for segment in self._child_segments:
+                value = value.get(segment) if isinstance(value, dict) else None
+        return _value_order(value) + _key_order(key)
+
+    def _position(self, item: tuple[str, Any]) -> tuple:
+        return self._sort_key(item)[:3]
+
+    def _bound(self, value: Any) -> tuple:
+        return _key_order(str(value)) if self._order_by == "key" else _value_order(value)
+
+    def get(self) -> "OrderedDict[str, Any]":
+        database = self._reference._database
+        database._round_trip("query")
+        value = database._read(self._reference._segments)
+        if not isinstance(value, dict):
+            return OrderedDict()
+        items = sorted(value.items(), key=self._sort_key)
+        if self._start is not None:
+            start = self._bound(self._start)
+            items = [item for item in items if self._position(item) >= start]
+        if self._end is not None:
+            end = self._bound(self._end)
+            items = [item for item in items if self._position(item) <= end]
+        if self._limit is not None:
+            side, limit = self._limit
+            items = items[:limit] if side == "first" else items[len(items) - limit:] if limit else []
+        return OrderedDict(items)